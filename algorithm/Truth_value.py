@@ -2,82 +2,222 @@
 """
 真值层流水线（适配项目结构）：
 - 读取：data/movies.csv, data/reviews_douban.csv
-- 产出：truth_value_out/ 下的 item_quality.csv, interactions_gt.csv, splits.csv, eval_samples.csv
+- 产出：truth_value_out/ 下的 item_quality, interactions_gt, splits, eval_samples（默认 Parquet，没有 pyarrow 时为 CSV，见 --format），
+  以及 user_id / item_id 的整数编码表 user_map, item_map
 放置位置：algorithm/Truth_value.py
 运行方式（在项目根目录）：
     python -m algorithm.Truth_value
 或：
     python algorithm/Truth_value.py
+评论文件大于内存时使用流式模式（分块读取、按用户哈希分片落盘，峰值内存只与块大小/分片大小有关）：
+    python -m algorithm.Truth_value --stream --chunksize 1000000
+各阶段按输入内容（文件哈希 + 参数）缓存，输入未变化的阶段直接复用上次的产出；--force 全部重跑
 """
 
 from __future__ import annotations
+import argparse
+import hashlib
+import json
+import math
+import shutil
+import tempfile
 import pandas as pd
 import numpy as np
 from pathlib import Path
-from datetime import datetime
+
+try:
+    import pyarrow  # noqa: F401  Parquet/Feather 读写依赖 pyarrow
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
 
 
 # 现在文件在 algorithm/ 下，项目根目录是其上一层
 ROOT_DIR   = Path(__file__).resolve().parents[1]
 DATA_DIR   = ROOT_DIR / "data"
 OUT_DIR    = ROOT_DIR / "truth_value_out"
-OUT_DIR.mkdir(exist_ok=True, parents=True)
 
 IN_MOVIES  = DATA_DIR / "movies.csv"
 IN_REVIEWS = DATA_DIR / "reviews_douban.csv"
 
-# 工具函数：把分数/人数/时间戳转成数值；统一 user_id/item_id
-def _to_float(x):
-    try:
-        return float(str(x).strip())
-    except:
-        return np.nan
-
-def _to_int(x):
-    s = str(x).strip().replace(",", "")
-    s = "".join(ch for ch in s if ch.isdigit())
-    return int(s) if s else np.nan
-
-def _parse_dt(s: str):
-    s = str(s).strip()
-    for fmt in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d", "%Y/%m/%d %H:%M", "%Y/%m/%d"):
-        try:
-            return datetime.strptime(s, fmt)
-        except:
-            pass
-    return pd.NaT
-
-def _read_csv_smart(path: Path) -> pd.DataFrame:
+# 工具函数：把分数/人数/时间戳整列转成数值（向量化，避免逐行 .apply）
+# 评论时间可能出现的格式，依次尝试，先匹配上的格式优先
+DT_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d", "%Y/%m/%d %H:%M", "%Y/%m/%d")
+
+# 读取时只取用到的列，且全部按字符串读入再统一解析（“无评分”“无时间”之类的占位符不会打乱类型推断）
+MOVIES_USECOLS  = ["imdb_id", "original_title", "release_year", "genres",
+                   "douban_average_score", "douban_star_rating", "number_of_ratings"]
+REVIEWS_USECOLS = ["imdb_id", "author", "user_status", "score", "comment_time"]
+# 只把空串当作缺失值：作者名与 id 可能恰好是 "NA"、"null"、"None"，pandas 默认会把它们读成 NaN
+CSV_NA = {"keep_default_na": False, "na_values": [""]}
+
+
+def _to_float(s: pd.Series) -> pd.Series:
+    """无法解析的值（如“无评分”）记为 NaN"""
+    return pd.to_numeric(s.astype(str).str.strip(), errors="coerce")
+
+def _to_int(s: pd.Series) -> pd.Series:
+    """只保留数字字符（去掉千分位逗号、“人评价”等），没有数字的记为 NaN"""
+    digits = s.astype(str).str.replace(r"[^0-9]", "", regex=True)
+    return pd.to_numeric(digits.where(digits != ""), errors="coerce")
+
+def _parse_dt(s: pd.Series) -> pd.Series:
+    """按 DT_FORMATS 逐个格式整列解析，再按顺序合并；都解析不了的记为 NaT"""
+    s = s.astype(str).str.strip()
+    ts = pd.Series(pd.NaT, index=s.index, dtype="datetime64[ns]")
+    for fmt in DT_FORMATS:
+        missing = ts.isna()
+        if not missing.any():
+            break
+        ts[missing] = pd.to_datetime(s[missing], format=fmt, errors="coerce")
+    return ts
+
+def _read_csv_smart(path: Path, **kwargs) -> pd.DataFrame:
     """兼容带 BOM 的 UTF-8 文件"""
     try:
-        return pd.read_csv(path, encoding="utf-8")
+        return pd.read_csv(path, encoding="utf-8", **kwargs)
     except UnicodeDecodeError:
-        return pd.read_csv(path, encoding="utf-8-sig")
+        return pd.read_csv(path, encoding="utf-8-sig", **kwargs)
+
+# 产出文件格式：Parquet/Feather 保留原生类型（时间戳、整数、分类），下游按列读取无需重新解析；
+# 没有安装 pyarrow 时退回 CSV
+ARTIFACT_FORMATS = ("parquet", "feather", "csv")
+ARTIFACT_FORMAT  = "parquet" if HAS_PYARROW else "csv"
+# 以分类类型（字典编码）存储的 id 列
+ID_COLUMNS = ("user_id", "item_id", "pos_item_id")
+
+def artifact_path(out_dir: Path, name: str, fmt: str | None = None) -> Path | None:
+    """产出文件的路径；fmt 为 None 时在已有的各格式文件中取最新的一个，都不存在时返回 None"""
+    if fmt is not None:
+        return out_dir / f"{name}.{fmt}"
+    paths = [out_dir / f"{name}.{f}" for f in ARTIFACT_FORMATS]
+    paths = [path for path in paths if path.exists()]
+    return max(paths, key=lambda path: path.stat().st_mtime) if paths else None
+
+def write_artifact(df: pd.DataFrame, out_dir: Path, name: str, fmt: str = ARTIFACT_FORMAT,
+                   part: int | None = None) -> Path:
+    """
+    写出一个产出表。流式模式按分片传入 part：CSV 追加到同一个文件，
+    Parquet/Feather 写成 <name>.<fmt>/part-00000.<fmt> 的目录，read_artifact 读取时再合并
+    """
+    path = artifact_path(out_dir, name, fmt)
+    if not part:
+        # 覆盖上一次运行的产出（可能是单个文件，也可能是分片目录）
+        if path.is_dir():
+            shutil.rmtree(path)
+        else:
+            path.unlink(missing_ok=True)
+    if fmt == "csv":
+        df.to_csv(path, index=False, mode="a" if part else "w", header=not part)
+        return path
+
+    df = df.astype({c: "category" for c in ID_COLUMNS if c in df.columns}).reset_index(drop=True)
+    target = path
+    if part is not None:
+        path.mkdir(exist_ok=True)
+        target = path / f"part-{part:05d}.{fmt}"
+    if fmt == "parquet":
+        df.to_parquet(target, index=False)
+    else:
+        df.to_feather(target)
+    return path
+
+def read_artifact(out_dir: Path, name: str, columns: list[str] | None = None, fmt: str | None = None) -> pd.DataFrame:
+    """
+    读取 write_artifact 的产出；Parquet/Feather 只读取 columns 指定的列
+    Django 的评测命令（films_recommender_system/evaluation.py）直接调用本函数
+    """
+    path = artifact_path(out_dir, name, fmt)
+    if path is None:
+        raise FileNotFoundError(out_dir / name)
+    fmt = path.suffix[1:]
+    if fmt == "csv":
+        # to_csv 把缺失值写成空串，读回时同样只认空串
+        df = pd.read_csv(path, usecols=columns, dtype={c: str for c in (*ID_COLUMNS, "id")}, **CSV_NA)
+        if "ts" in df.columns:
+            df["ts"] = pd.to_datetime(df["ts"])
+        return df
+    if fmt == "parquet":
+        return pd.read_parquet(path, columns=columns)
+    parts = sorted(path.glob("*.feather")) if path.is_dir() else [path]
+    df = pd.concat([pd.read_feather(part, columns=columns) for part in parts], ignore_index=True)
+    # 各分片的字典不同，合并后重新转回分类类型
+    return df.astype({c: "category" for c in ID_COLUMNS if c in df.columns})
 
 # 读取与清洗
-def step1_load_clean():
+def load_movies(movies_path: Path = IN_MOVIES) -> pd.DataFrame:
     # 电影表
-    movies = _read_csv_smart(IN_MOVIES)
+    movies = _read_csv_smart(movies_path, usecols=MOVIES_USECOLS,
+                             dtype={c: str for c in MOVIES_USECOLS if c != "release_year"}, **CSV_NA)
     # 均分是 0~10；爬虫里已经把 star = 均分/2（0~5），这里统一兜底
-    movies["douban_average_score"] = movies["douban_average_score"].apply(_to_float)
-    movies["douban_star_rating"]   = movies["douban_star_rating"].apply(_to_float)
-    movies["number_of_ratings"]    = movies["number_of_ratings"].apply(_to_int)
+    movies["douban_average_score"] = _to_float(movies["douban_average_score"])
+    movies["douban_star_rating"]   = _to_float(movies["douban_star_rating"])
+    movies["number_of_ratings"]    = _to_int(movies["number_of_ratings"])
 
     # 若 star 缺失，用 average_score/2 兜底
     mask = movies["douban_star_rating"].isna()
     movies.loc[mask, "douban_star_rating"] = movies.loc[mask, "douban_average_score"] / 2.0
+    return movies
 
-    # 评论表
-    reviews = _read_csv_smart(IN_REVIEWS)
-    reviews["score"] = reviews["score"].apply(_to_float)
-    reviews["ts"]    = reviews["comment_time"].apply(_parse_dt)
+def clean_reviews(reviews: pd.DataFrame) -> pd.DataFrame:
+    """解析评论表的分数与时间，统一 user_id/item_id；整表与流式分块共用"""
+    reviews["score"] = _to_float(reviews["score"])
+    reviews["ts"]    = _parse_dt(reviews["comment_time"])
     reviews["user_id"] = reviews["author"].astype(str)
     reviews["item_id"] = reviews["imdb_id"].astype(str)
+    return reviews
 
-    return movies, reviews
+def load_reviews(reviews_path: Path = IN_REVIEWS) -> pd.DataFrame:
+    # 评论表（不读取体积最大的评论正文）
+    return clean_reviews(_read_csv_smart(reviews_path, usecols=REVIEWS_USECOLS, dtype=str, **CSV_NA))
+
+def step1_load_clean(movies_path: Path = IN_MOVIES, reviews_path: Path = IN_REVIEWS):
+    return load_movies(movies_path), load_reviews(reviews_path)
+
+# 字典编码：user_id / item_id 换成稠密的 int32 编码，之后的排序、分组、去重、负采样都在整数列上进行
+# 词表按字典序排列，编码的大小与原字符串的先后一致，排序结果（包括同一时间戳的先后）与直接按字符串处理相同
+def encode_ids(df: pd.DataFrame, users: pd.Index | None = None,
+               items: pd.Index | None = None) -> tuple[pd.DataFrame, pd.Index, pd.Index]:
+    """
+    返回 (编码后的表, 用户词表, 电影词表)；给定词表时按词表编码（流式模式下各分片共用电影词表）
+    缺少用户或电影 id 的行无法归属，直接丢掉；原始的 author/imdb_id/comment_time 字符串列编码后不再需要，一并丢掉
+    """
+    df = df.dropna(subset=["user_id", "item_id"])
+    vocabs = {"user_id": users, "item_id": items}
+    codes = {}
+    for col, vocab in vocabs.items():
+        if vocab is None:
+            col_codes, uniques = pd.factorize(df[col], sort=True)
+            vocabs[col] = pd.Index(uniques)
+        else:
+            col_codes = vocab.get_indexer(df[col])
+        codes[col] = col_codes.astype(np.int32)
+    df = df.drop(columns=["author", "imdb_id", "comment_time"], errors="ignore").assign(**codes)
+    return df, vocabs["user_id"], vocabs["item_id"]
+
+def decode_ids(df: pd.DataFrame, users: pd.Index, items: pd.Index) -> pd.DataFrame:
+    """写出前把编码换回原始 id：Categorical.from_codes 不复制字符串，Parquet/Feather 中就是字典编码"""
+    vocabs = {"user_id": users, "item_id": items, "pos_item_id": items}
+    return df.assign(**{col: pd.Categorical.from_codes(df[col], categories=vocab)
+                        for col, vocab in vocabs.items() if col in df.columns})
+
+def write_id_maps(out_dir: Path, fmt: str, users: pd.Index, items: pd.Index | None = None,
+                  part: int | None = None, user_offset: int = 0):
+    """保存编码表 user_map / item_map（code, id）；流式模式下各分片的用户编码从 user_offset 起连续编号"""
+    codes = np.arange(user_offset, user_offset + len(users), dtype=np.int32)
+    write_artifact(pd.DataFrame({"code": codes, "id": users}), out_dir, "user_map", fmt, part)
+    if items is not None:
+        write_artifact(pd.DataFrame({"code": np.arange(len(items), dtype=np.int32), "id": items}),
+                       out_dir, "item_map", fmt)
+
+def load_id_maps(out_dir: Path, fmt: str) -> tuple[pd.Index, pd.Index]:
+    users, items = (read_artifact(out_dir, name, fmt=fmt).sort_values("code")["id"].astype(str)
+                    for name in ("user_map", "item_map"))
+    return pd.Index(users), pd.Index(items)
 
 # 电影“质量真值”——贝叶斯校准
-def step2_item_quality(movies: pd.DataFrame, C: int = 80) -> pd.DataFrame:
+def step2_item_quality(movies: pd.DataFrame, C: int = 80, out_dir: Path = OUT_DIR,
+                       fmt: str = ARTIFACT_FORMAT) -> pd.DataFrame:
     """
     s_hat_5 = (m*C + R*N) / (C+N)
     R: 电影的平均星级(0~5)；N:评分人数；m:全局先验均值；C:先验强度
@@ -99,8 +239,8 @@ def step2_item_quality(movies: pd.DataFrame, C: int = 80) -> pd.DataFrame:
     item_quality["prior_m"] = round(m, 3)
     item_quality["C"] = C
 
-    item_quality.to_csv(OUT_DIR / "item_quality.csv", index=False)
-    print(f"[OK] {OUT_DIR/'item_quality.csv'} -> {len(item_quality)} rows")
+    path = write_artifact(item_quality, out_dir, "item_quality", fmt)
+    print(f"[OK] {path} -> {len(item_quality)} rows")
     return item_quality
 
 #  用户→电影“偏好真值”——显式 + 隐式
@@ -119,7 +259,8 @@ def _implicit_weight(status: str) -> float:
         return 0.1
     return 0.0
 
-def step3_interactions_gt(reviews: pd.DataFrame) -> pd.DataFrame:
+def label_interactions(reviews: pd.DataFrame) -> pd.DataFrame:
+    """把评论打成交互标签（逐行独立，可以分块进行），去重在 dedupe_interactions 中按用户完成"""
     # 显式评分：≥4 为正，≤2 为负；3星丢弃
     exp = reviews.dropna(subset=["score"]).copy()
     exp = exp[(exp["score"] >= 4.0) | (exp["score"] <= 2.0)]
@@ -140,100 +281,372 @@ def step3_interactions_gt(reviews: pd.DataFrame) -> pd.DataFrame:
     imp["score"] = np.nan
     imp = imp[["user_id", "item_id", "ts", "y", "weight", "label_source", "score"]]
 
-    # 合并 + 时间兜底 + 去重（保留最新）
+    # 合并 + 时间兜底
     df = pd.concat([exp, imp], ignore_index=True)
     df["ts"] = pd.to_datetime(df["ts"], errors="coerce").fillna(pd.Timestamp("1970-01-01"))
-    df = df.sort_values(["user_id", "item_id", "ts"]).drop_duplicates(["user_id", "item_id"], keep="last")
+    return df
+
+def dedupe_interactions(df: pd.DataFrame) -> pd.DataFrame:
+    """同一 (用户, 电影) 只保留最新的一条"""
+    return df.sort_values(["user_id", "item_id", "ts"]).drop_duplicates(["user_id", "item_id"], keep="last")
+
+def step3_interactions_gt(reviews: pd.DataFrame) -> pd.DataFrame:
+    df = dedupe_interactions(label_interactions(reviews))
 
-    df.to_csv(OUT_DIR / "interactions_gt.csv", index=False)
-    print(f"[OK] {OUT_DIR/'interactions_gt.csv'} -> {len(df)} rows (pos={int((df.y==1).sum())}, neg={int((df.y==0).sum())})")
+    # interactions_gt.csv 在 step4 加上 split 列后只写一次
+    print(f"[OK] interactions -> {len(df)} rows (pos={int((df.y==1).sum())}, neg={int((df.y==0).sum())})")
     return df
 
 #  时序切分（train/val/test）
-def step4_time_splits(interactions_gt: pd.DataFrame) -> pd.DataFrame:
+SPLITS_COLUMNS = ["user_id", "item_id", "ts", "y", "weight", "label_source", "split"]
+
+def assign_time_splits(interactions_gt: pd.DataFrame) -> pd.DataFrame:
     """
     每个用户按时间排序：
       - 最后一个正样本 -> test
       - 倒数第二个正样本(若有) -> val
       - 其他 -> train
+    一次排序 + 正样本按用户倒序编号（cumcount），没有逐用户的 Python 调用
     """
-    df = interactions_gt.copy().sort_values(["user_id", "ts"])
+    df = interactions_gt.sort_values(["user_id", "ts"])
 
-    pos = df[df["y"] == 1]
-    last_idx = pos.groupby("user_id").tail(1).index
-    # 仅对“有 ≥ 2 个正样本”的用户取倒数第二个
-    second_last_idx = (
-        pos.groupby("user_id")
-          .apply(lambda g: g.iloc[-2].name if len(g) >= 2 else None)
-          .dropna()
-          .astype(int)
-          .values
-    )
+    # 0 = 用户最后一个正样本，1 = 倒数第二个；负样本为 NaN
+    rank = df[df["y"] == 1].groupby("user_id", sort=False).cumcount(ascending=False).reindex(df.index)
+    df["split"] = np.select([rank == 0, rank == 1], ["test", "val"], default="train")
+    return df
 
-    splits = pd.Series("train", index=df.index)
-    splits.loc[second_last_idx] = "val"
-    splits.loc[last_idx] = "test"
-    df["split"] = splits.values
+def _write_splits(df: pd.DataFrame, users: pd.Index, items: pd.Index, out_dir: Path, fmt: str,
+                  part: int | None = None) -> Path:
+    df = decode_ids(df, users, items)
+    write_artifact(df[SPLITS_COLUMNS], out_dir, "splits", fmt, part)
+    return write_artifact(df, out_dir, "interactions_gt", fmt, part)
 
-    df.to_csv(OUT_DIR / "interactions_gt.csv", index=False)
-    df[["user_id", "item_id", "ts", "y", "weight", "label_source", "split"]].to_csv(OUT_DIR / "splits.csv", index=False)
+def step4_time_splits(interactions_gt: pd.DataFrame, users: pd.Index, items: pd.Index, out_dir: Path = OUT_DIR,
+                      fmt: str = ARTIFACT_FORMAT) -> pd.DataFrame:
+    df = assign_time_splits(interactions_gt)
+    path = _write_splits(df, users, items, out_dir, fmt)
+    write_id_maps(out_dir, fmt, users, items)
 
+    print(f"[OK] {path} -> {len(df)} rows")
     print(f"[OK] splits -> train={sum(df.split=='train')}  val={sum(df.split=='val')}  test={sum(df.split=='test')}")
     return df
 
 # 离线评测负采样（HR@K/NDCG@K）
-def step5_eval_samples(movies: pd.DataFrame, interactions: pd.DataFrame, K: int = 50) -> pd.DataFrame:
+def _cdf_guide(cdf: np.ndarray, buckets: int) -> np.ndarray:
+    """逆 CDF 抽样的索引表：guide[j] = 第一个 cdf > j/buckets 的下标"""
+    return np.searchsorted(cdf, np.arange(buckets + 2) / buckets, side="right")
+
+def _sample_cdf(cdf: np.ndarray, guide: np.ndarray, u: np.ndarray) -> np.ndarray:
+    """
+    与 np.searchsorted(cdf, u, side="right") 结果相同的逆 CDF 抽样：
+    先用索引表把每个 u 限定在相邻几个桶对应的小区间内（两侧各放宽一桶，容忍 u*buckets 的舍入），
+    再在区间内做几轮向量化二分，避免对整个 cdf 做随机访问的二分查找
+    """
+    buckets = len(guide) - 2
+    j = (u * buckets).astype(np.int64)
+    lo = guide[np.maximum(j - 1, 0)]
+    hi = guide[np.minimum(j + 2, buckets + 1)]
+    for _ in range(int(np.ceil(np.log2(int((hi - lo).max(initial=0)) + 1)))):
+        mid = (lo + hi) >> 1
+        right = cdf[mid] <= u
+        lo = np.where(right, mid + 1, lo)
+        hi = np.where(right, hi, mid)
+    return lo
+
+def sample_eval_negatives(movies: pd.DataFrame, interactions: pd.DataFrame, items: pd.Index, K: int = 50,
+                          seed: int = 42, oversample: int = 5, block_size: int = 50_000,
+                          item_pop: np.ndarray | None = None) -> pd.DataFrame:
     """
     为每个 test 正样本采 K 个负例：
       - 负例按 item 流行度做概率采样（pop^0.5），并过滤用户已看/正样本
+      - 按抽取顺序保留前 K 个未看过的候选，每个用户最多抽 K*oversample 次；
+        仍不足 K 个的用户（几乎看遍了热门电影），再从其未看过的电影中均匀无放回补齐
+    实现上按块批量抽取 (用户数 × 约 K) 的候选矩阵，已看过滤用排好序的 用户→电影 CSR 键做二分查找，
+    只对候选不足的行继续补抽；各次抽样独立同分布，结果的分布与逐用户抽 K*oversample 次完全相同
+    interactions 的 user_id/item_id 是 encode_ids 的编码，items 为电影词表；返回的 user_id/pos_item_id 仍是编码，
+    负例是电影表中的 imdb_id
+    item_pop: 按电影编码的交互数；流式模式下 interactions 只是一个分片，需要传入全量的计数
     """
-    rng = np.random.default_rng(42)
-    all_items = movies["imdb_id"].astype(str).unique()
+    rng = np.random.default_rng(seed)
+    # 转成 numpy 对象数组：安装 pyarrow 后字符串列的 unique() 是 Arrow 数组，不支持下面的二维下标
+    all_items = np.asarray(movies["imdb_id"].astype(str).unique(), dtype=object)
+    n_items = len(all_items)
+
+    # 电影编码 -> 电影表中的下标（不在电影表中的为 -1）
+    catalog_pos = pd.Index(all_items).get_indexer(items)
+    in_catalog = catalog_pos >= 0
 
     # 流行度（交互计数 + 1 平滑）
-    item_pop = interactions.groupby("item_id").size().rename("cnt")
-    pop = pd.Series(0.0, index=pd.Index(all_items, name="item_id"))
-    pop.loc[item_pop.index] = item_pop.values
-    pop = pop + 1.0
-    p = (pop ** 0.5)
-    p = p / p.sum()
-
-    # 用户已看集合
-    user_items = interactions.groupby("user_id")["item_id"].apply(set).to_dict()
-
-    rows = []
-    for u, pos_i in interactions[interactions["split"] == "test"][["user_id", "item_id"]].itertuples(index=False):
-        seen = user_items.get(u, set())
-        cand = rng.choice(all_items, size=K * 5, replace=True, p=p.loc[all_items].values)
-        negs = [c for c in cand if c not in seen and c != pos_i][:K]
-        if len(negs) < K:
-            fill = [x for x in all_items if (x not in seen and x != pos_i)]
-            rng.shuffle(fill)
-            negs += fill[:(K - len(negs))]
-        rows.append({"user_id": u, "pos_item_id": pos_i, **{f"neg_{i+1}": v for i, v in enumerate(negs)}})
-
-    eval_df = pd.DataFrame(rows)
-    eval_df.to_csv(OUT_DIR / "eval_samples.csv", index=False)
-    print(f"[OK] {OUT_DIR/'eval_samples.csv'} -> {len(eval_df)} cases, K={K}")
+    if item_pop is None:
+        item_pop = np.bincount(interactions["item_id"], minlength=len(items))
+    pop = np.ones(n_items, dtype=np.float64)
+    pop[catalog_pos[in_catalog]] += item_pop[in_catalog]
+    p = pop ** 0.5
+    cdf = np.cumsum(p / p.sum())
+    cdf /= cdf[-1]
+    guide = _cdf_guide(cdf, 8 * n_items)
+
+    # 用户已看集合：(用户编号, 电影编号) 组合成一个整数键并排序，等价于按用户切片的 CSR
+    # （step3 已按 (user_id, item_id) 去重，重复的键也不影响二分查找）
+    # user_id 已是稠密编码，直接作为用户编号
+    user_codes = interactions["user_id"].to_numpy(dtype=np.int64)
+    n_users = int(user_codes.max()) + 1 if len(user_codes) else 0
+    item_codes = catalog_pos[interactions["item_id"].to_numpy()]
+    seen = item_codes >= 0
+    seen_keys = np.sort(user_codes[seen] * n_items + item_codes[seen])
+    seen_indptr = np.searchsorted(seen_keys, np.arange(n_users + 1, dtype=np.int64) * n_items)
+
+    def _is_seen(keys):
+        pos = np.minimum(np.searchsorted(seen_keys, keys), len(seen_keys) - 1)
+        return seen_keys[pos] == keys
+
+    test = interactions[interactions["split"] == "test"]
+    test_users = test["user_id"].to_numpy(dtype=np.int64)
+    negatives = np.full((len(test), K), -1, dtype=np.int64)
+    counts = np.zeros(len(test), dtype=np.int64)
+    max_draws = K * oversample
+
+    for lo in range(0, len(test), block_size):
+        active = np.arange(lo, min(lo + block_size, len(test)))
+        drawn = 0
+        while len(active) and drawn < max_draws:
+            # 本轮每行抽取的数量：按仍缺的个数略多抽一些，且不超过每个用户的抽样上限
+            width = min(max_draws - drawn, int((K - counts[active]).max() * 1.25) + 4)
+            cand = _sample_cdf(cdf, guide, rng.random((len(active), width)))
+            keep = ~_is_seen(test_users[active, None] * n_items + cand)
+            rank = counts[active, None] + np.cumsum(keep, axis=1)
+            r, c = np.nonzero(keep & (rank <= K))
+            negatives[active[r], rank[r, c] - 1] = cand[r, c]
+            counts[active] = np.minimum(rank[:, -1], K)
+            drawn += width
+            active = active[counts[active] < K]
+
+    # 抽满 K*oversample 次仍不足 K 个的用户：从未看过的电影中均匀无放回补齐
+    for row in np.flatnonzero(counts < K):
+        u = test_users[row]
+        unseen = np.setdiff1d(np.arange(n_items), seen_keys[seen_indptr[u]:seen_indptr[u + 1]] - u * n_items)
+        fill = rng.choice(unseen, size=min(K - counts[row], len(unseen)), replace=False)
+        negatives[row, counts[row]:counts[row] + len(fill)] = fill
+
+    neg_ids = np.where(negatives >= 0, all_items[np.maximum(negatives, 0)], None)
+    eval_df = pd.DataFrame(neg_ids, columns=[f"neg_{i+1}" for i in range(K)])
+    eval_df.insert(0, "pos_item_id", test["item_id"].to_numpy())
+    eval_df.insert(0, "user_id", test["user_id"].to_numpy())
+    return eval_df
+
+def step5_eval_samples(movies: pd.DataFrame, interactions: pd.DataFrame, users: pd.Index, items: pd.Index,
+                       K: int = 50, out_dir: Path = OUT_DIR, fmt: str = ARTIFACT_FORMAT) -> pd.DataFrame:
+    eval_df = sample_eval_negatives(movies, interactions, items, K=K)
+    path = write_artifact(decode_ids(eval_df, users, items), out_dir, "eval_samples", fmt)
+    print(f"[OK] {path} -> {len(eval_df)} cases, K={K}")
     return eval_df
 
+# 流式模式：评论分块读取并打标，交互按 user_id 哈希分片落盘；同一用户的交互总在同一个分片中，
+# 去重、时序切分、负采样都只在用户内部进行，因此可以逐分片完成，再把各分片的输出依次追加
+STREAM_CHUNK_ROWS  = 1_000_000
+STREAM_SHARD_BYTES = 256 * 2 ** 20  # 默认分片数 = 评论文件大小 / 该值（文件含正文，分片内的交互远小于此）
+STREAM_SAMPLE_BLOCK = 10_000        # 负采样每块的 test 用户数，候选矩阵的内存与之成正比
+
+def _shard_parts(shard_dir: Path) -> pd.DataFrame | None:
+    parts = sorted(shard_dir.glob("*.pkl"))
+    return pd.concat([pd.read_pickle(part) for part in parts], ignore_index=True) if parts else None
+
+def run_streaming(movies: pd.DataFrame, reviews_path: Path, out_dir: Path, K: int = 50, seed: int = 42,
+                  chunksize: int = STREAM_CHUNK_ROWS, shards: int | None = None, fmt: str = ARTIFACT_FORMAT) -> dict:
+    """流式完成 step3~step5，返回小结计数"""
+    shards = shards or max(1, math.ceil(reviews_path.stat().st_size / STREAM_SHARD_BYTES))
+    work_dir = Path(tempfile.mkdtemp(prefix="_shards_", dir=out_dir))
+    summary = {"interactions": 0, "pos": 0, "neg": 0, "splits": {}}
+    try:
+        # 1. 分块读取 + 打标，按用户哈希写入各分片；同时收集电影 id，各分片共用一个电影词表
+        reader = pd.read_csv(reviews_path, encoding="utf-8-sig", usecols=REVIEWS_USECOLS, dtype=str,
+                             chunksize=chunksize, **CSV_NA)
+        item_ids = set()
+        chunk_no = -1
+        for chunk_no, chunk in enumerate(reader):
+            labeled = label_interactions(clean_reviews(chunk))
+            item_ids.update(labeled["item_id"].unique())
+            shard_of = pd.util.hash_pandas_object(labeled["user_id"], index=False).to_numpy() % shards
+            for shard, part in labeled.groupby(shard_of, sort=False):
+                shard_dir = work_dir / f"{shard:04d}"
+                shard_dir.mkdir(exist_ok=True)
+                part.to_pickle(shard_dir / f"{chunk_no:06d}.pkl")
+        print(f"[OK] stream -> {chunk_no + 1} chunks hashed into {shards} shards")
+        if not any(work_dir.iterdir()):
+            # 没有读到任何可归属的评论（空文件或全部缺少 id）：与整表模式一样写出空的产出表
+            reviews, users, items = encode_ids(clean_reviews(pd.DataFrame(columns=REVIEWS_USECOLS, dtype=str)))
+            interactions = step4_time_splits(step3_interactions_gt(reviews), users, items, out_dir=out_dir, fmt=fmt)
+            step5_eval_samples(movies, interactions, users, items, K=K, out_dir=out_dir, fmt=fmt)
+            return _interaction_summary(interactions)
+        items = pd.Index(sorted(item_ids))
+
+        # 2. 逐分片编码 + 去重 + 时序切分，追加写出；同时累计全量的电影交互数，供负采样计算流行度
+        #    用户词表按分片各自编码（一个用户只出现在一个分片中），保存时依次接续编号
+        item_pop = np.zeros(len(items), dtype=np.int64)
+        n_users = 0
+        for i, shard_dir in enumerate(sorted(p for p in work_dir.iterdir() if p.is_dir())):
+            df, users, _ = encode_ids(_shard_parts(shard_dir), items=items)
+            shutil.rmtree(shard_dir)
+            df = assign_time_splits(dedupe_interactions(df))
+            path = _write_splits(df, users, items, out_dir, fmt, part=i)
+            write_id_maps(out_dir, fmt, users, items if i == 0 else None, part=i, user_offset=n_users)
+            n_users += len(users)
+            pd.to_pickle((df, users), work_dir / f"{shard_dir.name}.pkl")
+
+            item_pop += np.bincount(df["item_id"], minlength=len(items))
+            summary["interactions"] += len(df)
+            summary["pos"] += int((df.y == 1).sum())
+            summary["neg"] += int((df.y == 0).sum())
+            for split, n in df["split"].value_counts().items():
+                summary["splits"][split] = summary["splits"].get(split, 0) + int(n)
+        print(f"[OK] {path} -> {summary['interactions']} rows "
+              f"(pos={summary['pos']}, neg={summary['neg']})")
+
+        # 3. 逐分片负采样（每个分片用各自的种子，结果可复现），追加写出
+        n_cases = 0
+        for i, shard_file in enumerate(sorted(work_dir.glob("*.pkl"))):
+            df, users = pd.read_pickle(shard_file)
+            eval_df = sample_eval_negatives(movies, df, items, K=K, seed=seed + i, block_size=STREAM_SAMPLE_BLOCK,
+                                            item_pop=item_pop)
+            path = write_artifact(decode_ids(eval_df, users, items), out_dir, "eval_samples", fmt, part=i)
+            n_cases += len(eval_df)
+        print(f"[OK] {path} -> {n_cases} cases, K={K}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return summary
+
+# 阶段缓存：阶段的键 = 输入文件的内容哈希 + 参数 + 上游阶段的键 + 本文件源码的哈希；
+# 键与 out_dir/_manifest.json 中记录的一致且产出文件都在时，跳过该阶段并复用上次的产出
+MANIFEST_NAME = "_manifest.json"
+
+def file_digest(path: Path, known: dict | None = None) -> str:
+    """文件内容的 sha256；known 记录 路径 -> [大小, 修改时间, 哈希]，大小与修改时间都没变时不重新读取文件"""
+    stat = path.stat()
+    signature = [stat.st_size, stat.st_mtime_ns]
+    name = str(path.resolve())
+    if known is not None and known.get(name, [None, None])[:2] == signature:
+        return known[name][2]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(2 ** 20), b""):
+            h.update(block)
+    if known is not None:
+        known[name] = [*signature, h.hexdigest()]
+    return h.hexdigest()
+
+def stage_key(stage: str, *inputs: str, **params) -> str:
+    return hashlib.sha256(json.dumps([stage, inputs, params], sort_keys=True).encode()).hexdigest()
+
+def load_manifest(out_dir: Path) -> dict:
+    try:
+        manifest = json.loads((out_dir / MANIFEST_NAME).read_text(encoding="utf-8"))
+    except (FileNotFoundError, json.JSONDecodeError):
+        manifest = {}
+    manifest.setdefault("stages", {})
+    manifest.setdefault("files", {})
+    return manifest
+
+def _save_manifest(manifest: dict, out_dir: Path):
+    # 先写临时文件再替换，中途退出不会留下半个清单
+    tmp = out_dir / f"{MANIFEST_NAME}.tmp"
+    tmp.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    tmp.replace(out_dir / MANIFEST_NAME)
+
+def reuse_stage(manifest: dict, out_dir: Path, stage: str, key: str, outputs: list[str], fmt: str) -> bool:
+    """
+    键一致且产出都在时返回 True（跳过该阶段）；否则该阶段要重跑，先把产出与之重叠的记录都移出清单
+    （如流式/非流式两种阶段写同样的文件），重跑中途失败时也不会误用写了一半的产出
+    """
+    entry = manifest["stages"].get(stage)
+    if entry and entry["key"] == key and all(artifact_path(out_dir, name, fmt).exists() for name in outputs):
+        print(f"[SKIP] {stage} -> 输入未变化，复用 {', '.join(outputs)}")
+        return True
+    manifest["stages"] = {name: entry for name, entry in manifest["stages"].items()
+                          if not set(entry["outputs"]) & set(outputs)}
+    _save_manifest(manifest, out_dir)
+    return False
+
+def record_stage(manifest: dict, out_dir: Path, stage: str, key: str, outputs: list[str], **info):
+    manifest["stages"][stage] = {"key": key, "outputs": outputs, **info}
+    _save_manifest(manifest, out_dir)
+
+def _interaction_summary(df: pd.DataFrame) -> dict:
+    return {"interactions": len(df), "pos": int((df.y == 1).sum()), "neg": int((df.y == 0).sum()),
+            "splits": {split: int(n) for split, n in df["split"].value_counts().items()}}
+
 # main
-def main():
+def main(movies_path: Path = IN_MOVIES, reviews_path: Path = IN_REVIEWS, out_dir: Path = OUT_DIR,
+         C: int = 80, K: int = 50, stream: bool = False, chunksize: int = STREAM_CHUNK_ROWS, shards: int | None = None,
+         fmt: str = ARTIFACT_FORMAT, force: bool = False):
+    out_dir.mkdir(exist_ok=True, parents=True)
     print(f"[INFO] ROOT_DIR={ROOT_DIR}")
     print(f"[INFO] DATA_DIR={DATA_DIR}")
-    print(f"[INFO] OUT_DIR ={OUT_DIR}")
-
-    movies, reviews = step1_load_clean()
-    item_quality = step2_item_quality(movies, C=80)
-    interactions = step3_interactions_gt(reviews)
-    interactions = step4_time_splits(interactions)
-    _ = step5_eval_samples(movies, interactions, K=50)
+    print(f"[INFO] OUT_DIR ={out_dir} (format={fmt})")
+
+    manifest = load_manifest(out_dir)
+    if force:
+        manifest["stages"] = {}
+    code = file_digest(Path(__file__), manifest["files"])
+    movies_hash = file_digest(movies_path, manifest["files"])
+    reviews_hash = file_digest(reviews_path, manifest["files"])
+    movies = None
+
+    # step1(电影) + step2：只依赖电影表与 C
+    key, outputs = stage_key("item_quality", code, movies_hash, C=C, fmt=fmt), ["item_quality"]
+    if not reuse_stage(manifest, out_dir, "item_quality", key, outputs, fmt):
+        movies = load_movies(movies_path)
+        step2_item_quality(movies, C=C, out_dir=out_dir, fmt=fmt)
+        record_stage(manifest, out_dir, "item_quality", key, outputs, movies=len(movies))
+
+    if stream:
+        # 流式模式下 step3~step5 在分片中一起完成，作为一个阶段缓存
+        key = stage_key("stream", code, movies_hash, reviews_hash, K=K, shards=shards, fmt=fmt)
+        outputs = ["interactions_gt", "splits", "user_map", "item_map", "eval_samples"]
+        if not reuse_stage(manifest, out_dir, "stream", key, outputs, fmt):
+            movies = load_movies(movies_path) if movies is None else movies
+            summary = run_streaming(movies, reviews_path, out_dir, K=K, chunksize=chunksize, shards=shards, fmt=fmt)
+            record_stage(manifest, out_dir, "stream", key, outputs, summary=summary)
+        summary = manifest["stages"]["stream"]["summary"]
+    else:
+        # step1(评论) + 编码 + step3 + step4：只依赖评论表
+        splits_key = stage_key("splits", code, reviews_hash, fmt=fmt)
+        outputs = ["interactions_gt", "splits", "user_map", "item_map"]
+        interactions = None
+        if not reuse_stage(manifest, out_dir, "splits", splits_key, outputs, fmt):
+            reviews, users, items = encode_ids(load_reviews(reviews_path))
+            interactions = step3_interactions_gt(reviews)
+            del reviews  # 评论表不再需要，尽早释放，降低后续步骤的峰值内存
+            interactions = step4_time_splits(interactions, users, items, out_dir=out_dir, fmt=fmt)
+            record_stage(manifest, out_dir, "splits", splits_key, outputs, summary=_interaction_summary(interactions))
+
+        # step5：依赖电影表、切分结果与 K
+        key, outputs = stage_key("eval_samples", code, movies_hash, splits_key, K=K, fmt=fmt), ["eval_samples"]
+        if not reuse_stage(manifest, out_dir, "eval_samples", key, outputs, fmt):
+            movies = load_movies(movies_path) if movies is None else movies
+            if interactions is None:
+                users, items = load_id_maps(out_dir, fmt)
+                interactions, _, _ = encode_ids(read_artifact(out_dir, "interactions_gt", fmt=fmt), users, items)
+            step5_eval_samples(movies, interactions, users, items, K=K, out_dir=out_dir, fmt=fmt)
+            record_stage(manifest, out_dir, "eval_samples", key, outputs)
+        summary = manifest["stages"]["splits"]["summary"]
 
     # 小结
     print("\n[SUMMARY]")
-    print(f"  movies      : {len(movies)}")
-    print(f"  interactions: {len(interactions)} (pos={int((interactions.y==1).sum())}, neg={int((interactions.y==0).sum())})")
-    print(f"  splits      : {interactions['split'].value_counts().to_dict()}")
+    print(f"  movies      : {manifest['stages']['item_quality']['movies']}")
+    print(f"  interactions: {summary['interactions']} (pos={summary['pos']}, neg={summary['neg']})")
+    print(f"  splits      : {summary['splits']}")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="真值层流水线")
+    parser.add_argument("--movies", type=Path, default=IN_MOVIES, dest="movies_path")
+    parser.add_argument("--reviews", type=Path, default=IN_REVIEWS, dest="reviews_path")
+    parser.add_argument("--out", type=Path, default=OUT_DIR, dest="out_dir")
+    parser.add_argument("--C", type=int, default=80, help="电影质量贝叶斯校准的先验强度")
+    parser.add_argument("--K", type=int, default=50, help="每个 test 正样本的负例数")
+    parser.add_argument("--stream", action="store_true", help="流式模式：评论分块读取、按用户哈希分片处理")
+    parser.add_argument("--chunksize", type=int, default=STREAM_CHUNK_ROWS, help="流式模式每块读取的评论行数")
+    parser.add_argument("--shards", type=int, default=None, help="流式模式的分片数，默认按评论文件大小估算")
+    parser.add_argument("--format", choices=ARTIFACT_FORMATS, default=ARTIFACT_FORMAT, dest="fmt",
+                        help="产出文件格式，Parquet/Feather 需要 pyarrow")
+    parser.add_argument("--force", action="store_true", help="忽略阶段缓存，全部重跑")
+    main(**vars(parser.parse_args()))
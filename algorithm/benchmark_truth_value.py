@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+"""
+Truth_value 流水线的性能基准（合成数据）：
+    python -m algorithm.benchmark_truth_value parse --rows 1000000 10000000
+    python -m algorithm.benchmark_truth_value splits --users 100000 1000000
+    python -m algorithm.benchmark_truth_value negatives --users 10000 1000000
+    python -m algorithm.benchmark_truth_value stream --rows 1000000 5000000
+    python -m algorithm.benchmark_truth_value formats --users 1000000
+合成文件写在临时目录中，运行结束后删除
+"""
+
+from __future__ import annotations
+import argparse
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from algorithm import Truth_value as tv
+
+
+# 合成数据：与 data/ 下爬虫产出的列与取值格式一致（含“无评分”“无时间”等占位符）
+def make_movies(n_items: int, rng: np.random.Generator) -> pd.DataFrame:
+    avg = rng.uniform(2, 9.5, n_items).round(1)
+    return pd.DataFrame({
+        "imdb_id": np.char.add("tt", np.char.zfill(np.arange(n_items).astype(str), 7)),
+        "original_title": "title",
+        "release_year": rng.integers(1950, 2026, n_items),
+        "genres": "剧情 / 悬疑",
+        "douban_average_score": avg,
+        "douban_star_rating": (avg / 2).round(1),
+        "number_of_ratings": rng.integers(0, 500000, n_items),
+    })
+
+def make_reviews(n_rows: int, n_items: int, n_users: int, rng: np.random.Generator) -> pd.DataFrame:
+    seconds = rng.integers(1.5e9, 1.76e9, n_rows).astype("datetime64[s]").astype(str)
+    comment_time = np.char.replace(seconds, "T", " ")
+    fmt = rng.random(n_rows)
+    comment_time = np.where(fmt < 0.05, "无时间", comment_time)
+    comment_time = np.where((fmt >= 0.05) & (fmt < 0.10), np.char.replace(
+        np.char.partition(comment_time, " ")[:, 0], "-", "/"), comment_time)
+    score = rng.integers(1, 6, n_rows).astype(float).astype(str)
+    return pd.DataFrame({
+        "imdb_id": np.char.add("tt", np.char.zfill(rng.integers(0, n_items, n_rows).astype(str), 7)),
+        "original_title": "title",
+        "release_year": 2025,
+        "author": np.char.add("user_", rng.integers(0, n_users, n_rows).astype(str)),
+        "user_status": rng.choice(["看过", "想看", "未知"], n_rows, p=[0.75, 0.1, 0.15]),
+        "content": "这是一条合成的短评内容，用于模拟真实评论正文的体积。" * 3,
+        "score": np.where(rng.random(n_rows) < 0.2, "无评分", score),
+        "score_max": 5.0,
+        "comment_time": comment_time,
+    })
+
+
+# 旧版逐行解析（.apply），仅作为基准对照
+def _legacy_to_float(x):
+    try:
+        return float(str(x).strip())
+    except:
+        return np.nan
+
+def _legacy_parse_dt(s):
+    s = str(s).strip()
+    for fmt in tv.DT_FORMATS:
+        try:
+            return datetime.strptime(s, fmt)
+        except:
+            pass
+    return pd.NaT
+
+def legacy_load_reviews(path: Path) -> pd.DataFrame:
+    reviews = tv._read_csv_smart(path)
+    reviews["score"] = reviews["score"].apply(_legacy_to_float)
+    reviews["ts"]    = reviews["comment_time"].apply(_legacy_parse_dt)
+    reviews["user_id"] = reviews["author"].astype(str)
+    reviews["item_id"] = reviews["imdb_id"].astype(str)
+    return reviews
+
+
+def make_interactions(n_users: int, per_user: int, n_items: int, rng: np.random.Generator) -> pd.DataFrame:
+    """step3 产出格式的交互表：每个用户平均 per_user 条，约 80% 为正样本"""
+    n_rows = n_users * per_user
+    return pd.DataFrame({
+        "user_id": np.char.add("user_", rng.integers(0, n_users, n_rows).astype(str)),
+        "item_id": np.char.add("tt", np.char.zfill(rng.integers(0, n_items, n_rows).astype(str), 7)),
+        "ts": pd.to_datetime(rng.integers(1.5e9, 1.76e9, n_rows), unit="s"),
+        "y": (rng.random(n_rows) < 0.8).astype(float),
+        "weight": 1.0,
+        "label_source": "explicit_rating",
+        "score": 4.0,
+    })
+
+def write_reviews(path: Path, n_rows: int, n_items: int, n_users: int, rng: np.random.Generator,
+                  chunk_rows: int = 1_000_000):
+    """分块生成并追加写入，生成千万行文件时内存只与块大小有关"""
+    for lo in range(0, n_rows, chunk_rows):
+        chunk = make_reviews(min(chunk_rows, n_rows - lo), n_items, n_users, rng)
+        chunk.to_csv(path, index=False, mode="w" if lo == 0 else "a", header=lo == 0)
+
+
+def legacy_assign_time_splits(interactions_gt: pd.DataFrame) -> pd.DataFrame:
+    """旧版 step4：倒数第二个正样本用 groupby.apply 逐用户查找"""
+    df = interactions_gt.copy().sort_values(["user_id", "ts"])
+    pos = df[df["y"] == 1]
+    last_idx = pos.groupby("user_id").tail(1).index
+    second_last_idx = (
+        pos.groupby("user_id")
+          .apply(lambda g: g.iloc[-2].name if len(g) >= 2 else None)
+          .dropna()
+          .astype(int)
+          .values
+    )
+    splits = pd.Series("train", index=df.index)
+    splits.loc[second_last_idx] = "val"
+    splits.loc[last_idx] = "test"
+    df["split"] = splits.values
+    return df
+
+
+def bench_splits(args):
+    rng = np.random.default_rng(args.seed)
+    for n_users in args.users:
+        interactions = make_interactions(n_users, args.per_user, args.items, rng)
+        print(f"\n[{n_users:,} 用户，{len(interactions):,} 条交互]")
+
+        start = time.perf_counter()
+        df = tv.assign_time_splits(interactions)
+        vectorized = time.perf_counter() - start
+        print(f"  排序 + cumcount         : {vectorized:8.2f} 秒")
+
+        if n_users <= args.legacy_max_users:
+            start = time.perf_counter()
+            legacy = legacy_assign_time_splits(interactions)
+            elapsed = time.perf_counter() - start
+            same = (legacy["split"].to_numpy() == df["split"].to_numpy()).all()
+            print(f"  groupby.apply（旧版）   : {elapsed:8.2f} 秒  加速 {elapsed / vectorized:.1f}x  结果一致={same}")
+        else:
+            print(f"  groupby.apply（旧版）   : 跳过（超过 --legacy-max-users={args.legacy_max_users:,}）")
+
+
+def legacy_sample_eval_negatives(movies: pd.DataFrame, interactions: pd.DataFrame, K: int = 50) -> pd.DataFrame:
+    """旧版 step5：逐个 test 用户抽样，每次都重新按 all_items 对齐概率"""
+    rng = np.random.default_rng(42)
+    all_items = movies["imdb_id"].astype(str).unique()
+    item_pop = interactions.groupby("item_id").size().rename("cnt")
+    pop = pd.Series(0.0, index=pd.Index(all_items, name="item_id"))
+    pop.loc[item_pop.index] = item_pop.values
+    pop = pop + 1.0
+    p = (pop ** 0.5)
+    p = p / p.sum()
+    user_items = interactions.groupby("user_id")["item_id"].apply(set).to_dict()
+
+    rows = []
+    for u, pos_i in interactions[interactions["split"] == "test"][["user_id", "item_id"]].itertuples(index=False):
+        seen = user_items.get(u, set())
+        cand = rng.choice(all_items, size=K * 5, replace=True, p=p.loc[all_items].values)
+        negs = [c for c in cand if c not in seen and c != pos_i][:K]
+        if len(negs) < K:
+            fill = [x for x in all_items if (x not in seen and x != pos_i)]
+            rng.shuffle(fill)
+            negs += fill[:(K - len(negs))]
+        rows.append({"user_id": u, "pos_item_id": pos_i, **{f"neg_{i+1}": v for i, v in enumerate(negs)}})
+    return pd.DataFrame(rows)
+
+
+def bench_negatives(args):
+    rng = np.random.default_rng(args.seed)
+    movies = make_movies(args.items, rng)
+    for n_users in args.users:
+        raw = tv.assign_time_splits(make_interactions(n_users, args.per_user, args.items, rng))
+        interactions, _, items = tv.encode_ids(raw)
+        n_test = int((interactions["split"] == "test").sum())
+        print(f"\n[{n_test:,} 个 test 用户，{len(interactions):,} 条交互，{args.items:,} 部电影，K={args.k}]")
+
+        start = time.perf_counter()
+        eval_df = tv.sample_eval_negatives(movies, interactions, items, K=args.k)
+        vectorized = time.perf_counter() - start
+        print(f"  批量抽样             : {vectorized:8.2f} 秒")
+
+        if n_users <= args.legacy_max_users:
+            start = time.perf_counter()
+            legacy = legacy_sample_eval_negatives(movies, raw, K=args.k)
+            elapsed = time.perf_counter() - start
+            print(f"  逐用户循环（旧版）   : {elapsed:8.2f} 秒  加速 {elapsed / vectorized:.0f}x")
+
+            # 分布一致性：负例的电影频次分布与旧版的总变差距离，和换一个随机种子时的差异处于同一量级
+            reseeded = tv.sample_eval_negatives(movies, interactions, items, K=args.k, seed=args.seed + 1)
+            print(f"  负例频次的总变差距离 : 对旧版 {_tv_distance(eval_df, legacy):.4f}  "
+                  f"对换种子 {_tv_distance(eval_df, reseeded):.4f}")
+
+
+def _tv_distance(a: pd.DataFrame, b: pd.DataFrame) -> float:
+    neg_cols = [c for c in a.columns if c.startswith("neg_")]
+    fa = a[neg_cols].stack().value_counts(normalize=True)
+    fb = b[neg_cols].stack().value_counts(normalize=True)
+    return float(fa.sub(fb, fill_value=0).abs().sum() / 2)
+
+
+def bench_parse(args):
+    rng = np.random.default_rng(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        movies_path = Path(tmp) / "movies.csv"
+        make_movies(args.items, rng).to_csv(movies_path, index=False)
+        for n_rows in args.rows:
+            reviews_path = Path(tmp) / "reviews.csv"
+            write_reviews(reviews_path, n_rows, args.items, args.users, rng)
+            size_mb = reviews_path.stat().st_size / 2 ** 20
+            print(f"\n[{n_rows:,} 行评论，{size_mb:.0f} MB]")
+
+            start = time.perf_counter()
+            _, reviews = tv.step1_load_clean(movies_path, reviews_path)
+            vectorized = time.perf_counter() - start
+            print(f"  向量化 step1_load_clean : {vectorized:8.2f} 秒")
+
+            if n_rows <= args.legacy_max_rows:
+                start = time.perf_counter()
+                legacy = legacy_load_reviews(reviews_path)
+                elapsed = time.perf_counter() - start
+                same = (np.allclose(legacy["score"], reviews["score"], equal_nan=True)
+                        and pd.to_datetime(legacy["ts"]).astype(reviews["ts"].dtype).equals(reviews["ts"]))
+                print(f"  逐行 .apply（旧版）     : {elapsed:8.2f} 秒  加速 {elapsed / vectorized:.1f}x  结果一致={same}")
+            else:
+                print(f"  逐行 .apply（旧版）     : 跳过（超过 --legacy-max-rows={args.legacy_max_rows:,}）")
+
+
+# 子进程运行流水线后报告自身的 VmHWM（峰值常驻内存）；ru_maxrss 会从 fork 时的父进程继承，不能用
+_PEAK_PROBE = ("import runpy, sys; sys.argv[0] = 'Truth_value'; "
+               "runpy.run_module('algorithm.Truth_value', run_name='__main__'); "
+               "print(next(line for line in open('/proc/self/status') if line.startswith('VmHWM')), file=sys.stderr)")
+
+def _run_pipeline(movies_path: Path, reviews_path: Path, out_dir: Path, extra: list[str]) -> tuple[float, float]:
+    """在子进程中运行整条流水线，返回 (耗时秒数, 峰值常驻内存 MB)"""
+    cmd = [sys.executable, "-c", _PEAK_PROBE, "--movies", str(movies_path),
+           "--reviews", str(reviews_path), "--out", str(out_dir), *extra]
+    start = time.perf_counter()
+    proc = subprocess.run(cmd, cwd=tv.ROOT_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+                          check=True)
+    elapsed = time.perf_counter() - start
+    peak_kb = int(proc.stderr.strip().splitlines()[-1].split()[1])
+    return elapsed, peak_kb / 1024
+
+
+def bench_stream(args):
+    rng = np.random.default_rng(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        movies_path = Path(tmp) / "movies.csv"
+        make_movies(args.items, rng).to_csv(movies_path, index=False)
+        for n_rows in args.rows:
+            reviews_path = Path(tmp) / "reviews.csv"
+            write_reviews(reviews_path, n_rows, args.items, args.users, rng)
+            size_mb = reviews_path.stat().st_size / 2 ** 20
+            print(f"\n[{n_rows:,} 行评论，{size_mb:.0f} MB]")
+
+            extra = ["--stream", "--chunksize", str(args.chunksize)]
+            if args.shards:
+                extra += ["--shards", str(args.shards)]
+            elapsed, peak = _run_pipeline(movies_path, reviews_path, Path(tmp) / "out_stream", extra)
+            print(f"  流式（每块 {args.chunksize:,} 行） : {elapsed:8.2f} 秒  峰值内存 {peak:8.0f} MB")
+
+            if n_rows <= args.memory_max_rows:
+                elapsed, peak = _run_pipeline(movies_path, reviews_path, Path(tmp) / "out_memory", [])
+                print(f"  整表读入内存          : {elapsed:8.2f} 秒  峰值内存 {peak:8.0f} MB")
+            else:
+                print(f"  整表读入内存          : 跳过（超过 --memory-max-rows={args.memory_max_rows:,}）")
+
+
+def _size_mb(path: Path) -> float:
+    files = path.rglob("*") if path.is_dir() else [path]
+    return sum(f.stat().st_size for f in files if f.is_file()) / 2 ** 20
+
+
+def bench_formats(args):
+    rng = np.random.default_rng(args.seed)
+    formats = [fmt for fmt in tv.ARTIFACT_FORMATS if fmt == "csv" or tv.HAS_PYARROW]
+    if not tv.HAS_PYARROW:
+        print("[WARN] 未安装 pyarrow，只测试 CSV")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_users in args.users:
+            df = tv.assign_time_splits(make_interactions(n_users, args.per_user, args.items, rng))
+            print(f"\n[interactions_gt：{n_users:,} 用户，{len(df):,} 行]")
+            for fmt in formats:
+                start = time.perf_counter()
+                path = tv.write_artifact(df, Path(tmp), "interactions_gt", fmt)
+                write = time.perf_counter() - start
+                start = time.perf_counter()
+                tv.read_artifact(Path(tmp), "interactions_gt", fmt=fmt)
+                read_all = time.perf_counter() - start
+                start = time.perf_counter()
+                tv.read_artifact(Path(tmp), "interactions_gt", columns=["user_id", "item_id"], fmt=fmt)
+                read_ids = time.perf_counter() - start
+                print(f"  {fmt:8s}: {_size_mb(path):7.1f} MB  写 {write:6.2f} 秒  读全部列 {read_all:6.2f} 秒  "
+                      f"读 user_id/item_id {read_ids:6.2f} 秒")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Truth_value 流水线性能基准")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("parse", help="step1 读取与解析：逐行 .apply 对比向量化")
+    p.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    p.add_argument("--items", type=int, default=50_000)
+    p.add_argument("--users", type=int, default=200_000)
+    p.add_argument("--legacy-max-rows", type=int, default=2_000_000, help="旧版逐行解析只在不超过该行数时运行")
+    p.add_argument("--seed", type=int, default=42)
+    p.set_defaults(func=bench_parse)
+
+    p = sub.add_parser("splits", help="step4 时序切分：groupby.apply 对比排序 + cumcount")
+    p.add_argument("--users", type=int, nargs="+", default=[100_000, 1_000_000])
+    p.add_argument("--per-user", type=int, default=10)
+    p.add_argument("--items", type=int, default=50_000)
+    p.add_argument("--legacy-max-users", type=int, default=1_000_000, help="旧版只在用户数不超过该值时运行")
+    p.add_argument("--seed", type=int, default=42)
+    p.set_defaults(func=bench_splits)
+
+    p = sub.add_parser("negatives", help="step5 负采样：逐用户循环对比批量抽样")
+    p.add_argument("--users", type=int, nargs="+", default=[10_000, 1_000_000])
+    p.add_argument("--per-user", type=int, default=5)
+    p.add_argument("--items", type=int, default=50_000)
+    p.add_argument("--k", type=int, default=50)
+    p.add_argument("--legacy-max-users", type=int, default=10_000, help="旧版只在用户数不超过该值时运行")
+    p.add_argument("--seed", type=int, default=42)
+    p.set_defaults(func=bench_negatives)
+
+    p = sub.add_parser("stream", help="整条流水线：整表读入对比流式分片（子进程的耗时与峰值内存）")
+    p.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 5_000_000])
+    p.add_argument("--items", type=int, default=50_000)
+    p.add_argument("--users", type=int, default=200_000)
+    p.add_argument("--chunksize", type=int, default=tv.STREAM_CHUNK_ROWS)
+    p.add_argument("--shards", type=int, default=None)
+    p.add_argument("--memory-max-rows", type=int, default=5_000_000, help="整表模式只在不超过该行数时运行")
+    p.add_argument("--seed", type=int, default=42)
+    p.set_defaults(func=bench_stream)
+
+    p = sub.add_parser("formats", help="产出文件格式：CSV / Parquet / Feather 的大小与读写耗时")
+    p.add_argument("--users", type=int, nargs="+", default=[100_000, 1_000_000])
+    p.add_argument("--per-user", type=int, default=10)
+    p.add_argument("--items", type=int, default=50_000)
+    p.add_argument("--seed", type=int, default=42)
+    p.set_defaults(func=bench_formats)
+
+    args = parser.parse_args()
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
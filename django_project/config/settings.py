@@ -130,11 +130,29 @@ CACHES = {
         'LOCATION': BASE_DIR.parent / 'django_cache', # 将缓存文件存放在项目根目录下的 'django_cache' 文件夹中
         'TIMEOUT': 60 * 60 * 24 * 7, # 缓存有效期7天
         'OPTIONS': {
-            'MAX_ENTRIES': 1000  # 缓存条目上限
+            # 缓存条目上限：推荐卡片、用户排除集合等按电影/用户分别缓存，上限过低会随机淘汰模型资产
+            'MAX_ENTRIES': 20000
         }
     }
 }
 
+# 异步推荐视图中用于 numpy 打分的线程池大小
+RECOMMENDATION_SCORING_WORKERS = 4
+
+# 实时推荐召回阶段启用的候选生成器（按顺序执行，见 candidate_pipeline.py），为空列表时不使用召回+精排流程
+RECOMMENDATION_CANDIDATE_GENERATORS = [
+    'item_neighbors', 'co_interest', 'user_knn', 'session_history', 'genre_lists', 'trending'
+]
+# 每个候选生成器最多返回的电影数
+RECOMMENDATION_CANDIDATES_PER_GENERATOR = 200
+# 实时推荐的单次请求延迟预算（毫秒），各阶段之间检查，超出后降级返回预计算/偏好/全局列表；None 表示不限时
+RECOMMENDATION_LATENCY_BUDGET_MS = 50
+# 推荐流（游标分页）一次计算并缓存的排序长度
+RECOMMENDATION_FEED_LENGTH = 200
+# 分片打分服务：generate_recommendations --shards N 写入的向量分片目录，以及打分进程池大小（0 表示在请求进程内打分）
+RECOMMENDATION_SHARD_DIR = BASE_DIR.parent / 'model_shards'
+RECOMMENDATION_SHARD_WORKERS = 0
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class FilmsRecommenderSystemConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'films_recommender_system'
+
+    def ready(self):
+        # 注册信号处理器
+        from . import signals  # noqa: F401
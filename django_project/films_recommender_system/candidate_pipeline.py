@@ -0,0 +1,202 @@
+# films_recommender_system/candidate_pipeline.py
+
+import logging
+import time
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from .recommendation_utils import (
+    get_user_exclusion_parts, get_recent_viewed_imdb_ids, get_user_preference_ids, merge_candidate_lists,
+    get_item_ids, top_k_indices, CANDIDATE_LISTS_CACHE_KEY, SESSION_DECAY
+)
+from .trending import get_trending_imdb_ids
+from .cooccurrence import get_co_interest, merge_co_interest
+from .user_knn import get_user_neighbors, score_user_knn
+
+logger = logging.getLogger(__name__)
+
+# 精排打分 = 与用户兴趣向量的余弦相似度 × similarity + 召回名次先验 × prior
+RERANK_WEIGHTS = {'similarity': 1.0, 'prior': 0.2}
+
+# 已注册的候选生成器：名称 -> fn(context, limit)，返回按生成器自身优先级排序的 imdb_id 列表
+CANDIDATE_GENERATORS = {}
+
+
+def candidate_generator(name):
+    """注册候选生成器的装饰器，settings.RECOMMENDATION_CANDIDATE_GENERATORS 中按名称启用"""
+    def decorator(func):
+        CANDIDATE_GENERATORS[name] = func
+        return func
+    return decorator
+
+
+class CandidateContext:
+    """
+    一次推荐请求中各阶段共享的数据
+    用户的排除集合与近期浏览在构造时读取；偏好等只有个别生成器需要的数据由生成器自行读取（均有缓存）
+    """
+
+    def __init__(self, user_id, model_assets):
+        self.user_id = user_id
+        self.model_assets = model_assets
+        self.exclusion_parts = get_user_exclusion_parts(user_id)
+        self.recent_imdb_ids = get_recent_viewed_imdb_ids(user_id)
+        self.excluded = {imdb_id for ids in self.exclusion_parts.values() for imdb_id in ids}
+
+
+def _neighbor_candidates(model_assets, seed_imdb_ids, seed_weights, limit):
+    """
+    从预计算的近邻矩阵（build_similar_movies 写入 model_assets['neighbors']）召回：
+    每个种子的第 r 个近邻得分 = 种子权重 / (r + 1)，被多个种子召回的电影得分累加
+    """
+    neighbors = model_assets.get('neighbors') if model_assets else None
+    if neighbors is None or not len(seed_imdb_ids):
+        return []
+
+    item_map = model_assets['item_map']
+    seeds = [(item_map[imdb_id], w) for imdb_id, w in zip(seed_imdb_ids, seed_weights) if imdb_id in item_map]
+    if not seeds:
+        return []
+    rows, weights = zip(*seeds)
+
+    neighbor_rows = neighbors[list(rows)]
+    contrib = np.asarray(weights)[:, None] / np.arange(1, neighbor_rows.shape[1] + 1)
+    unique_rows, inverse = np.unique(neighbor_rows.ravel(), return_inverse=True)
+    scores = np.bincount(inverse, weights=contrib.ravel())
+    top = top_k_indices(scores, limit)
+    return get_item_ids(model_assets)[unique_rows[top]].tolist()
+
+
+@candidate_generator('item_neighbors')
+def item_neighbor_candidates(context, limit):
+    """喜欢的电影的相似电影"""
+    favorites = context.exclusion_parts['favorites']
+    return _neighbor_candidates(context.model_assets, favorites, np.ones(len(favorites)), limit)
+
+
+@candidate_generator('co_interest')
+def co_interest_candidates(context, limit):
+    """“喜欢这部电影的人也喜欢”：合并喜欢/想看电影的共现 Top-K 列表"""
+    seeds = context.exclusion_parts['favorites'] + context.exclusion_parts['watchlist']
+    if not seeds:
+        return []
+    return merge_co_interest(get_co_interest(seeds), context.excluded, limit)
+
+
+@candidate_generator('user_knn')
+def user_knn_candidates(context, limit):
+    """评分相近的站内用户给出高分（高于其自身平均分）的电影"""
+    neighbor_ids, neighbor_sims = get_user_neighbors(context.user_id)
+    return score_user_knn(neighbor_ids, neighbor_sims, context.excluded, limit)
+
+
+@candidate_generator('session_history')
+def session_history_candidates(context, limit):
+    """最近浏览电影的相似电影，按新近程度衰减加权"""
+    recent = context.recent_imdb_ids
+    return _neighbor_candidates(context.model_assets, recent, SESSION_DECAY ** np.arange(len(recent)), limit)
+
+
+@candidate_generator('genre_lists')
+def genre_list_candidates(context, limit):
+    """预计算的偏好类型/影人候选列表多路归并"""
+    candidate_lists = cache.get(CANDIDATE_LISTS_CACHE_KEY)
+    if candidate_lists is None:
+        return []
+    preferences = get_user_preference_ids(context.user_id)
+    if not preferences['genres'] and not preferences['people']:
+        return []
+    return merge_candidate_lists(candidate_lists, preferences['genres'], preferences['people'],
+                                 context.excluded, limit)
+
+
+@candidate_generator('trending')
+def trending_candidates(context, limit):
+    """近期热门电影"""
+    return get_trending_imdb_ids(limit)
+
+
+def collect_candidates(user_id, model_assets, generators=None, limit=None, deadline=None):
+    """
+    召回阶段（会访问数据库和缓存）：依次运行各候选生成器，过滤已交互电影
+    返回 (context, {生成器名: imdb_id 列表}, 各阶段耗时毫秒数)；单个生成器出错不影响其他生成器
+    传入 deadline 时，超出延迟预算后不再运行剩余的生成器
+    """
+    generators = settings.RECOMMENDATION_CANDIDATE_GENERATORS if generators is None else generators
+    limit = limit or settings.RECOMMENDATION_CANDIDATES_PER_GENERATOR
+    timings = {}
+
+    start = time.perf_counter()
+    context = CandidateContext(user_id, model_assets)
+    timings['context'] = (time.perf_counter() - start) * 1000
+
+    candidates = {}
+    for name in generators:
+        if deadline is not None and deadline.expired():
+            logger.warning(f"召回阶段超出延迟预算，跳过生成器 '{name}' 及之后的生成器")
+            break
+        start = time.perf_counter()
+        try:
+            imdb_ids = CANDIDATE_GENERATORS[name](context, limit)
+        except Exception as e:
+            logger.warning(f"候选生成器 '{name}' 执行失败: {e}")
+            imdb_ids = []
+        candidates[name] = [imdb_id for imdb_id in imdb_ids if imdb_id and imdb_id not in context.excluded]
+        timings[name] = (time.perf_counter() - start) * 1000
+    return context, candidates, timings
+
+
+def build_user_vector(model_assets, exclusion_parts, recent_imdb_ids, decay=SESSION_DECAY):
+    """喜欢电影的平均向量与近期浏览的衰减加权向量各自归一化后相加；两者都没有时返回 None"""
+    if not model_assets:
+        return None
+    item_vectors = model_assets['item_vectors']
+    item_map = model_assets['item_map']
+
+    parts = []
+    favorite_rows = [item_map[imdb_id] for imdb_id in exclusion_parts['favorites'] if imdb_id in item_map]
+    if favorite_rows:
+        parts.append(item_vectors[favorite_rows].mean(axis=0))
+    positions = [pos for pos, imdb_id in enumerate(recent_imdb_ids) if imdb_id in item_map]
+    if positions:
+        weights = decay ** np.asarray(positions, dtype=np.float64)
+        parts.append(weights @ item_vectors[[item_map[recent_imdb_ids[pos]] for pos in positions]])
+
+    parts = [p / np.linalg.norm(p) for p in parts if np.linalg.norm(p) > 0]
+    return np.sum(parts, axis=0) if parts else None
+
+
+def rank_candidates(context, candidates, k=50, timings=None):
+    """
+    精排阶段（纯计算，可放入线程池）：对所有生成器的候选取并集，
+    一次矩阵乘法计算与用户兴趣向量的余弦相似度，加上召回名次先验（各生成器中 1 - 名次/列表长度 的最大值）
+    """
+    start = time.perf_counter()
+    priors = {}
+    for imdb_ids in candidates.values():
+        n = len(imdb_ids)
+        for rank, imdb_id in enumerate(imdb_ids):
+            prior = 1.0 - rank / n
+            if prior > priors.get(imdb_id, -1.0):
+                priors[imdb_id] = prior
+
+    pool = np.array(list(priors), dtype=object)
+    scores = RERANK_WEIGHTS['prior'] * np.fromiter(priors.values(), dtype=np.float64, count=len(priors))
+
+    model_assets = context.model_assets
+    user_vector = build_user_vector(model_assets, context.exclusion_parts, context.recent_imdb_ids)
+    if user_vector is not None and len(pool):
+        item_map = model_assets['item_map']
+        rows = np.fromiter((item_map.get(imdb_id, -1) for imdb_id in pool), dtype=np.int64, count=len(pool))
+        known = rows >= 0
+        vectors = np.asarray(model_assets['item_vectors'][rows[known]], dtype=np.float64)
+        norms = np.linalg.norm(vectors, axis=1)
+        norms[norms == 0] = 1.0
+        sims = vectors @ user_vector / (norms * np.linalg.norm(user_vector))
+        scores[known] += RERANK_WEIGHTS['similarity'] * sims
+
+    ranked = pool[top_k_indices(scores, k)].tolist()
+    if timings is not None:
+        timings['rerank'] = (time.perf_counter() - start) * 1000
+    return ranked
@@ -0,0 +1,61 @@
+# films_recommender_system/content_model.py
+
+import numpy as np
+from sklearn.decomposition import TruncatedSVD
+from sklearn.feature_extraction.text import TfidfVectorizer
+from tqdm import tqdm
+
+# 内容特征的种类，即特征词的前缀
+FEATURE_KINDS = ('genre', 'director', 'actor')
+
+
+def build_movie_documents(movies, progress=True):
+    """
+    为每部电影创建一个由其内容特征（类型、导演、演员）组成的“词袋”
+    movies 需预取 genres/directors/actors；返回 (documents, imdb_ids)，没有任何特征的电影被跳过
+    """
+    documents = []
+    movie_ids_in_order = []
+
+    for movie in tqdm(movies, desc="[1/2] 创建特征文档", disable=not progress):
+        if not movie.imdb_id:
+            continue
+
+        features = []
+
+        # 为特征添加前缀以避免混淆（例如，类型'Action'和演员'Action Bronson'）
+        for genre in movie.genres.all():
+            features.append(f"genre_{genre.name.replace(' ', '')}")
+
+        for director in movie.directors.all():
+            features.append(f"director_{director.name.replace(' ', '')}")
+
+        for actor in movie.actors.all():
+            features.append(f"actor_{actor.name.replace(' ', '')}")
+
+        if features:
+            documents.append(" ".join(features))
+            movie_ids_in_order.append(movie.imdb_id)
+
+    return documents, movie_ids_in_order
+
+
+def build_item_vectors(documents, max_features=1000, feature_weights=None, n_factors=0):
+    """
+    TF-IDF 向量化特征文档，返回稠密的电影向量矩阵
+      - feature_weights: {'genre': w, 'director': w, 'actor': w}，按特征种类缩放对应的列
+      - n_factors: 大于 0 时用截断 SVD 降到 n_factors 维
+    """
+    # 特征词之间只用空格分隔；默认的 token_pattern 会在 "·"、"-"、"." 处把人名拆开，导致前缀丢失
+    vectorizer = TfidfVectorizer(max_features=max_features, tokenizer=str.split, token_pattern=None)
+    vectors = vectorizer.fit_transform(documents)
+
+    if feature_weights:
+        # TfidfVectorizer 会把特征词转成小写，前缀即 "_" 之前的部分
+        column_weights = np.array([feature_weights.get(term.split('_', 1)[0], 1.0)
+                                   for term in vectorizer.get_feature_names_out()])
+        vectors = vectors.multiply(column_weights.reshape(1, -1)).tocsr()
+
+    if n_factors and n_factors < vectors.shape[1]:
+        return TruncatedSVD(n_components=n_factors, random_state=42).fit_transform(vectors)
+    return vectors.toarray()  # 转换为NumPy数组
@@ -0,0 +1,158 @@
+# films_recommender_system/cooccurrence.py
+
+from collections import Counter, defaultdict
+import numpy as np
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from .models import Movie, MovieCooccurrence, Recommendation, UserProfile
+
+# 每部电影缓存的共现 Top-K 数量
+COOCCURRENCE_TOP_K = 50
+CO_INTEREST_CACHE_KEY = 'co_interest_{imdb_id}'
+CO_INTEREST_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+
+def _co_interest_cache_key(imdb_id):
+    return CO_INTEREST_CACHE_KEY.format(imdb_id=imdb_id)
+
+
+def user_item_sets(user_ids):
+    """用户×电影矩阵 X 的若干行：{user_id: {movie_id, ...}}，即“喜欢”与“想看”列表的并集，一条 UNION 查询"""
+    user_ids = list(user_ids)
+    favorites = (Recommendation.favorite_movies.through.objects.filter(recommendation_id__in=user_ids)
+                 .values_list('recommendation_id', 'movie_id'))
+    watchlist = (UserProfile.watchlist.through.objects.filter(userprofile__user_id__in=user_ids)
+                 .values_list('userprofile__user_id', 'movie_id'))
+    sets = {user_id: set() for user_id in user_ids}
+    for user_id, movie_id in favorites.union(watchlist):
+        sets[user_id].add(movie_id)
+    return sets
+
+
+def _pair_deltas(before, after):
+    """单个用户的行从 before 变为 after 时，XᵀX 中各非对角元素 (a, b) 的变化量"""
+    deltas = Counter()
+    added, removed = after - before, before - after
+    for a in added:
+        for b in after:
+            if a != b:
+                deltas[(a, b)] += 1
+                if b not in added:
+                    deltas[(b, a)] += 1
+    for a in removed:
+        for b in before:
+            if a != b:
+                deltas[(a, b)] -= 1
+                if b not in removed:
+                    deltas[(b, a)] -= 1
+    return deltas
+
+
+def apply_cooccurrence_delta(before_sets, after_sets):
+    """
+    增量更新共现矩阵：只改动变化用户所涉及的行，不做全量重算
+    受影响电影的共现 Top-K 缓存被清除，下次读取时从索引重新取
+    """
+    deltas = Counter()
+    for user_id, before in before_sets.items():
+        deltas.update(_pair_deltas(before, after_sets.get(user_id, set())))
+    deltas = {pair: d for pair, d in deltas.items() if d}
+    if not deltas:
+        return 0
+
+    movie_ids = {a for a, _ in deltas}
+    with transaction.atomic():
+        # 先用 ignore_conflicts 补建新出现的电影对（计数为 0），再锁定全部相关行：
+        # 并发的两个用户同时新建同一对电影时，后者不会违反唯一约束，而是等前者提交后在其计数上累加
+        MovieCooccurrence.objects.bulk_create(
+            [MovieCooccurrence(movie_id=a, other_id=b, count=0) for (a, b), d in deltas.items() if d > 0],
+            batch_size=500, ignore_conflicts=True)
+        existing = {(m, o): (pk, count) for pk, m, o, count in (
+            MovieCooccurrence.objects.select_for_update()
+            .filter(movie_id__in=movie_ids, other_id__in={b for _, b in deltas})
+            .values_list('pk', 'movie_id', 'other_id', 'count'))}
+
+        to_update, to_delete = [], []
+        for pair, d in deltas.items():
+            if pair not in existing:
+                continue
+            pk, count = existing[pair]
+            if count + d > 0:
+                to_update.append(MovieCooccurrence(pk=pk, count=count + d))
+            else:
+                to_delete.append(pk)
+
+        MovieCooccurrence.objects.bulk_update(to_update, ['count'], batch_size=500)
+        MovieCooccurrence.objects.filter(pk__in=to_delete).delete()
+
+    imdb_ids = Movie.objects.filter(pk__in=movie_ids).values_list('imdb_id', flat=True)
+    cache.delete_many([_co_interest_cache_key(imdb_id) for imdb_id in imdb_ids if imdb_id])
+    return len(deltas)
+
+
+def track_user_items_change(instance, action, user_ids):
+    """
+    m2m_changed 钩子：pre_* 时记下受影响用户的列表，post_* 时与新列表比较并增量更新共现矩阵
+    user_ids 只在 pre_* 时需要
+    """
+    if action in ('pre_add', 'pre_remove', 'pre_clear'):
+        instance._cooccurrence_before = user_item_sets(user_ids)
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        before = getattr(instance, '_cooccurrence_before', None)
+        if before is None:
+            return
+        del instance._cooccurrence_before
+        apply_cooccurrence_delta(before, user_item_sets(before))
+
+
+def get_co_interest(imdb_ids, k=COOCCURRENCE_TOP_K):
+    """
+    返回 {imdb_id: (共现电影 imdb_id 列表, 共现次数列表)}，按次数降序
+    命中缓存直接返回；未命中的电影用一条窗口函数查询取每部电影的 Top-K 并写回缓存
+    """
+    imdb_ids = list(dict.fromkeys(imdb_ids))
+    keys = {_co_interest_cache_key(imdb_id): imdb_id for imdb_id in imdb_ids}
+    found = {keys[key]: value for key, value in cache.get_many(list(keys)).items()}
+
+    missing = [imdb_id for imdb_id in imdb_ids if imdb_id not in found]
+    if missing:
+        rows = (MovieCooccurrence.objects.filter(movie__imdb_id__in=missing)
+                .annotate(rank=Window(RowNumber(), partition_by=F('movie_id'), order_by=[F('count').desc(), F('pk')]))
+                .filter(rank__lte=k).order_by('movie_id', 'rank')
+                .values_list('movie__imdb_id', 'other__imdb_id', 'count'))
+        fetched = defaultdict(lambda: ([], []))
+        for imdb_id, other_imdb_id, count in rows:
+            fetched[imdb_id][0].append(other_imdb_id)
+            fetched[imdb_id][1].append(count)
+        fetched = {imdb_id: fetched.get(imdb_id, ([], [])) for imdb_id in missing}
+        cache.set_many({_co_interest_cache_key(imdb_id): value for imdb_id, value in fetched.items()},
+                       CO_INTEREST_CACHE_TIMEOUT)
+        found.update(fetched)
+    return found
+
+
+def merge_co_interest(co_interest, exclude=(), limit=200):
+    """合并若干电影的共现 Top-K 列表：同一部电影的共现次数累加，排除已交互电影后按总次数降序返回 imdb_id"""
+    scores = Counter()
+    for other_ids, counts in co_interest.values():
+        for imdb_id, count in zip(other_ids, counts):
+            scores[imdb_id] += count
+    exclude = set(exclude)
+    return [imdb_id for imdb_id, _ in scores.most_common() if imdb_id and imdb_id not in exclude][:limit]
+
+
+def cooccurrence_top_k(matrix, k):
+    """从 CSR 共现矩阵中取每行次数最高的 k 个列下标，返回 [(列下标数组, 次数数组), ...]"""
+    result = []
+    for row in range(matrix.shape[0]):
+        lo, hi = matrix.indptr[row], matrix.indptr[row + 1]
+        cols, counts = matrix.indices[lo:hi], matrix.data[lo:hi]
+        if len(counts) > k:
+            top = np.argpartition(-counts, k - 1)[:k]
+            cols, counts = cols[top], counts[top]
+        order = np.lexsort((cols, -counts))
+        result.append((cols[order], counts[order]))
+    return result
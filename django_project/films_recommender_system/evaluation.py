@@ -0,0 +1,162 @@
+# films_recommender_system/evaluation.py
+
+import importlib.util
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from scipy import sparse
+
+# Truth_value 流水线的输出目录（项目根目录下的 truth_value_out/）
+TRUTH_VALUE_OUT_DIR = settings.BASE_DIR.parent / 'truth_value_out'
+
+
+def _load_truth_value():
+    """algorithm/Truth_value.py 在 Django 项目之外，按文件路径加载；产出文件的读取逻辑只在流水线中维护一份"""
+    spec = importlib.util.spec_from_file_location(
+        'Truth_value', settings.BASE_DIR.parent / 'algorithm' / 'Truth_value.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+truth_value = _load_truth_value()
+
+
+def find_artifact(input_dir, name):
+    """返回 <input_dir>/<name>.<格式> 中最新的一个（流式模式下 Parquet/Feather 是分片目录），都不存在时返回 None"""
+    return truth_value.artifact_path(Path(input_dir), name)
+
+
+def read_artifact(input_dir, name, columns=None):
+    """按列读取 Truth_value 的产出表，与流水线读到的完全相同（见 Truth_value.read_artifact）"""
+    return truth_value.read_artifact(Path(input_dir), name, columns)
+
+
+def has_eval_data(input_dir):
+    return find_artifact(input_dir, 'splits') is not None and find_artifact(input_dir, 'eval_samples') is not None
+
+
+def load_eval_data(input_dir=TRUTH_VALUE_OUT_DIR):
+    """
+    读取 splits 与 eval_samples（CSV / Parquet / Feather）
+    返回 (train, eval_users, candidates)：
+      - train: 训练集中的正样本 (user_id, item_id, weight)
+      - eval_users: 每个评测样例的 user_id，形状 (n_cases,)
+      - candidates: 候选 imdb_id 矩阵，形状 (n_cases, 1 + K)，第 0 列是正样本
+    """
+    splits = read_artifact(input_dir, 'splits', columns=['user_id', 'item_id', 'y', 'weight', 'split'])
+    train = splits[(splits['split'] == 'train') & (splits['y'] == 1)][['user_id', 'item_id', 'weight']]
+    train = train.dropna(subset=['user_id', 'item_id'])
+    # 分类类型的 id 列转回字符串，与模型的 item_map（imdb_id -> 行号）直接对照
+    train = train.astype({'user_id': str, 'item_id': str})
+
+    eval_df = read_artifact(input_dir, 'eval_samples')
+    neg_cols = [c for c in eval_df.columns if c.startswith('neg_')]
+    candidates = eval_df[['pos_item_id'] + neg_cols].astype(object).to_numpy(dtype=object)
+    return train.reset_index(drop=True), eval_df['user_id'].astype(str).to_numpy(dtype=object), candidates
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class ContentModelScorer:
+    """
+    用内容画像模型（generate_recommendations 生成的 item_vectors）为评测样例打分
+    用户向量 = 训练集正样本对应电影向量的加权平均，与实时推荐视图的做法一致
+    """
+
+    def __init__(self, model_assets, train):
+        item_map = model_assets['item_map']
+        # 末尾追加一行零向量，模型中不存在的电影统一映射到这一行
+        item_vectors = _normalize_rows(np.asarray(model_assets['item_vectors'], dtype=np.float32))
+        self.missing_index = item_vectors.shape[0]
+        self.item_vectors = np.vstack([item_vectors, np.zeros((1, item_vectors.shape[1]), dtype=np.float32)])
+        self.item_map = item_map
+
+        train = train[train['item_id'].isin(item_map)]
+        user_codes, user_index = pd.factorize(train['user_id'])
+        item_index = train['item_id'].map(item_map).to_numpy()
+        interactions = sparse.csr_matrix(
+            (train['weight'].to_numpy(dtype=np.float32), (user_codes, item_index)),
+            shape=(len(user_index), self.missing_index))
+        user_vectors = np.asarray(interactions @ item_vectors, dtype=np.float32)
+        self.user_vectors = np.vstack([_normalize_rows(user_vectors),
+                                       np.zeros((1, item_vectors.shape[1]), dtype=np.float32)])
+        self.user_rows = {u: i for i, u in enumerate(user_index)}
+
+    def encode(self, eval_users, candidates):
+        """把 user_id / imdb_id 转换成向量矩阵中的行号"""
+        missing_user = self.user_vectors.shape[0] - 1
+        user_rows = np.fromiter((self.user_rows.get(u, missing_user) for u in eval_users),
+                                dtype=np.int64, count=len(eval_users))
+        cand_rows = (pd.Series(candidates.ravel()).map(self.item_map).fillna(self.missing_index)
+                     .to_numpy(dtype=np.int64).reshape(candidates.shape))
+        return user_rows, cand_rows
+
+    def score(self, user_rows, cand_rows):
+        """一次性为一批样例打分：收集每个用户的 1+K 个候选向量，与用户向量做批量点积"""
+        scores = np.einsum('ud,ukd->uk', self.user_vectors[user_rows], self.item_vectors[cand_rows])
+        # 模型无法表示的电影不应排在任何真实打分之前
+        scores[cand_rows == self.missing_index] = -np.inf
+        return scores
+
+
+def rank_metrics(scores, ks=(10,)):
+    """
+    scores 第 0 列为正样本。正样本名次 = 分数不低于它的负样本个数（并列按最坏情况计）
+    返回 HR@K、NDCG@K 以及 MRR
+    """
+    pos = scores[:, :1]
+    rank = (scores[:, 1:] >= pos).sum(axis=1)
+    # 正样本本身无法打分（-inf）时直接视为未命中
+    rank = np.where(np.isneginf(pos[:, 0]), scores.shape[1], rank)
+
+    metrics = {}
+    for k in ks:
+        hit = rank < k
+        metrics[f'HR@{k}'] = float(hit.mean()) if len(rank) else 0.0
+        metrics[f'NDCG@{k}'] = float(np.where(hit, 1.0 / np.log2(rank + 2), 0.0).mean()) if len(rank) else 0.0
+    metrics['MRR'] = float((1.0 / (rank + 1)).mean()) if len(rank) else 0.0
+    return metrics
+
+
+def evaluate_scorer(scorer, eval_users, candidates, ks=(10,), batch_size=4096, latency_samples=1000, seed=42):
+    """
+    批量评测一个打分器（需实现 encode/score），返回质量指标与耗时统计：
+      - 批量打分的吞吐（样例/秒）
+      - 逐个样例打分的 p50/p99 延迟（毫秒），近似线上单次请求的开销
+    """
+    user_rows, cand_rows = scorer.encode(eval_users, candidates)
+    n_cases = len(user_rows)
+
+    start = time.perf_counter()
+    scores = np.empty(cand_rows.shape, dtype=np.float64)
+    for lo in range(0, n_cases, batch_size):
+        hi = min(lo + batch_size, n_cases)
+        scores[lo:hi] = scorer.score(user_rows[lo:hi], cand_rows[lo:hi])
+    batch_seconds = time.perf_counter() - start
+
+    metrics = rank_metrics(scores, ks)
+
+    latencies = []
+    if n_cases and latency_samples:
+        rng = np.random.default_rng(seed)
+        sample = rng.choice(n_cases, size=min(latency_samples, n_cases), replace=False)
+        for i in sample:
+            t0 = time.perf_counter()
+            scorer.score(user_rows[i:i + 1], cand_rows[i:i + 1])
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    metrics.update({
+        'cases': n_cases,
+        'batch_seconds': batch_seconds,
+        'throughput': n_cases / batch_seconds if batch_seconds > 0 else float('inf'),
+        'p50_ms': float(np.percentile(latencies, 50)) if latencies else 0.0,
+        'p99_ms': float(np.percentile(latencies, 99)) if latencies else 0.0,
+    })
+    return metrics
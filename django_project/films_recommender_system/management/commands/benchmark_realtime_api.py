@@ -0,0 +1,99 @@
+# films_recommender_system/management/commands/benchmark_realtime_api.py
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import Request, urlopen
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.test import Client, AsyncClient
+from django.urls import reverse
+
+
+class Command(BaseCommand):
+    help = ('Benchmarks req/s of the realtime recommendation API (sync view vs async view). By default requests go '
+            'through the in-process test clients, with no server and sequential sync requests; pass --base-url to '
+            'send concurrent HTTP requests to a running WSGI/ASGI server instead.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', type=str, help='发起推荐请求的用户名')
+        parser.add_argument('--requests', type=int, default=200, help='每种模式发送的请求总数')
+        parser.add_argument('--concurrency', type=int, default=16,
+                            help='同时在途的请求数（进程内模式只作用于异步视图）')
+        parser.add_argument('--host', type=str, default='localhost',
+                            help='进程内模式使用的 Host 头，需在 ALLOWED_HOSTS 中')
+        parser.add_argument('--base-url', type=str, default=None,
+                            help='已启动服务的地址（如 http://127.0.0.1:8000），给定时通过真实 HTTP 并发请求压测')
+
+    def handle(self, *args, **options):
+        username, total, concurrency = options['username'], options['requests'], options['concurrency']
+        if options['base_url']:
+            self._handle_http(options['base_url'].rstrip('/'), username, total, concurrency)
+            return
+
+        headers = {'host': options['host']}
+        self.stdout.write(self.style.HTTP_INFO("--- 实时推荐 API 压测 (同步视图 vs 异步视图，进程内测试客户端) ---"))
+        self.stdout.write(self.style.WARNING(
+            "注意：请求不经过真实服务器，同步视图逐个串行执行，结果只反映视图本身的开销，"
+            "不代表部署后的并发吞吐；压测真实部署请启动 WSGI/ASGI 服务后使用 --base-url。"))
+
+        # 1. 同步视图：测试客户端一次只能处理一个请求
+        sync_url = reverse('realtime-recommendations', args=[username])
+        client = Client(headers=headers)
+        client.get(sync_url)  # 预热：加载模型缓存
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(total):
+            t0 = time.perf_counter()
+            client.get(sync_url)
+            latencies.append(time.perf_counter() - t0)
+        self._report("同步视图 (进程内, 串行)", total, time.perf_counter() - start, latencies)
+
+        # 2. 异步视图：同一个事件循环上并发处理多个请求
+        async_url = reverse('realtime-recommendations-async', args=[username])
+        duration, latencies = asyncio.run(self._run_async(async_url, headers, total, concurrency))
+        self._report(f"异步视图 (进程内, 并发 {concurrency})", total, duration, latencies)
+
+    def _handle_http(self, base_url, username, total, concurrency):
+        """对已启动的服务（如 gunicorn / uvicorn）发送真实 HTTP 请求，两个视图使用相同的并发数"""
+        self.stdout.write(self.style.HTTP_INFO(f"--- 实时推荐 API 压测 ({base_url}, 并发 {concurrency}) ---"))
+        for label, name in (("同步视图", 'realtime-recommendations'), ("异步视图", 'realtime-recommendations-async')):
+            url = base_url + reverse(name, args=[username])
+            duration, latencies = self._run_http(url, total, concurrency)
+            self._report(f"{label} (HTTP, 并发 {concurrency})", total, duration, latencies)
+
+    def _run_http(self, url, total, concurrency):
+        def one_request(_):
+            t0 = time.perf_counter()
+            with urlopen(Request(url)) as response:
+                response.read()
+            return time.perf_counter() - t0
+
+        one_request(None)  # 预热
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            latencies = list(pool.map(one_request, range(total)))
+        return time.perf_counter() - start, latencies
+
+    async def _run_async(self, url, headers, total, concurrency):
+        client = AsyncClient(headers=headers)
+        await client.get(url)  # 预热
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+
+        async def one_request():
+            async with semaphore:
+                t0 = time.perf_counter()
+                await client.get(url)
+                latencies.append(time.perf_counter() - t0)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one_request() for _ in range(total)))
+        return time.perf_counter() - start, latencies
+
+    def _report(self, label, total, duration, latencies):
+        latencies_ms = np.array(latencies) * 1000
+        self.stdout.write(f"\n{label}")
+        self.stdout.write(f"  - 吞吐: {total / duration:.1f} req/s (共 {total} 个请求, 耗时 {duration:.2f} 秒)")
+        self.stdout.write(f"  - 延迟: p50={np.percentile(latencies_ms, 50):.1f} ms, "
+                          f"p99={np.percentile(latencies_ms, 99):.1f} ms")
@@ -0,0 +1,79 @@
+# films_recommender_system/management/commands/benchmark_sharded_scoring.py
+
+import os
+import tempfile
+import time
+import numpy as np
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from films_recommender_system.recommendation_utils import top_k_indices
+from films_recommender_system.sharded_scoring import write_item_shards, ShardedScorer
+from threadpoolctl import threadpool_limits
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks single-query latency and batch throughput of sharded top-K scoring for different worker counts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='要测试的进程池大小（每个进程一个分片）')
+        parser.add_argument('--replicate', type=int, default=1,
+                            help='把模型向量复制 N 份（加入少量噪声）以模拟更大的电影库')
+        parser.add_argument('--queries', type=int, default=200, help='单次查询延迟测试的查询数')
+        parser.add_argument('--batch-size', type=int, default=64, help='吞吐测试中每批的查询数')
+        parser.add_argument('--batches', type=int, default=10, help='吞吐测试的批数')
+        parser.add_argument('--k', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        model_assets = cache.get('recommendation_model_assets')
+        if not model_assets:
+            self.stderr.write(self.style.ERROR("缓存中没有模型资产，请先运行 'generate_recommendations'。"))
+            return
+
+        rng = np.random.default_rng(options['seed'])
+        vectors = np.asarray(model_assets['item_vectors'], dtype=np.float32)
+        if options['replicate'] > 1:
+            vectors = np.vstack([vectors] + [vectors + rng.normal(0, 0.01, vectors.shape).astype(np.float32)
+                                             for _ in range(options['replicate'] - 1)])
+        k = options['k']
+        # 查询向量取自随机电影向量，近似真实用户兴趣向量的分布
+        queries = vectors[rng.integers(0, len(vectors), options['queries'])]
+        batches = [vectors[rng.integers(0, len(vectors), options['batch_size'])] for _ in range(options['batches'])]
+
+        self.stdout.write(self.style.HTTP_INFO(
+            f"--- 分片 Top-K 打分压测 (电影数 {vectors.shape[0]}, 维度 {vectors.shape[1]}, K={k}, CPU 核数 {os.cpu_count()}) ---"))
+
+        # 基线：单进程、单线程 BLAS 的全量打分
+        normalized = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        with threadpool_limits(1):
+            self._report("单进程基线", lambda q: top_k_indices(normalized @ q, k),
+                         lambda b: [top_k_indices(row, k) for row in b @ normalized.T], queries, batches)
+
+        for workers in options['workers']:
+            with tempfile.TemporaryDirectory() as shard_dir:
+                write_item_shards(vectors, shard_dir, workers)
+                scorer = ShardedScorer(shard_dir, workers)
+                try:
+                    scorer.top_k_batch(batches[0], k)  # 预热：启动 worker 并挂载共享内存
+                    self._report(f"{workers} 个分片 / {workers} 个进程", lambda q: scorer.top_k(q, k),
+                                 lambda b: scorer.top_k_batch(b, k), queries, batches)
+                finally:
+                    scorer.close()
+
+    def _report(self, label, score_one, score_batch, queries, batches):
+        latencies = []
+        for query in queries:
+            t0 = time.perf_counter()
+            score_one(query)
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+        start = time.perf_counter()
+        for batch in batches:
+            score_batch(batch)
+        duration = time.perf_counter() - start
+        n_batch_queries = sum(len(batch) for batch in batches)
+
+        self.stdout.write(f"\n{label}")
+        self.stdout.write(f"  - 单次查询延迟: p50={np.percentile(latencies, 50):.2f} ms, "
+                          f"p99={np.percentile(latencies, 99):.2f} ms")
+        self.stdout.write(f"  - 批量吞吐: {n_batch_queries / duration:.1f} 查询/秒")
@@ -0,0 +1,72 @@
+# films_recommender_system/management/commands/benchmark_truth_scores.py
+
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from films_recommender_system.models import Movie, Review, Source, UserReview
+from films_recommender_system.movie_stats import rebuild_movie_stats
+from films_recommender_system.truth_scores import compute_truth_scores, update_truth_scores
+from django.contrib.auth.models import User
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Times calculate_truth_scores on synthetic catalogs (created inside a transaction and rolled back).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000], help='合成电影库的电影数')
+        parser.add_argument('--reviews-per-movie', type=int, default=3, help='每部电影的外部评论数')
+        parser.add_argument('--user-reviews-per-movie', type=int, default=2, help='每部电影的本站评分数')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.HTTP_INFO("--- 真值分数计算压测（合成数据，结束后回滚） ---"))
+        for size in options['sizes']:
+            try:
+                with transaction.atomic():
+                    self._run(size, options)
+                    raise _Rollback
+            except _Rollback:
+                pass
+
+    def _run(self, size, options):
+        rng = np.random.default_rng(options['seed'])
+        setup_start = time.perf_counter()
+
+        sources = [Source.objects.create(name=f'bench_source_{i}', base_url='https://example.com',
+                                         credibility_level=int(rng.integers(1, 11)), score_max=float(score_max))
+                   for i, score_max in enumerate((5, 10, 100))]
+        users = [User.objects.create(username=f'bench_user_{i}') for i in range(options['user_reviews_per_movie'])]
+        # 已有电影保留，合成电影的标题加前缀以避开 (original_title, release_year) 唯一约束
+        Movie.objects.bulk_create((Movie(original_title=f'bench_movie_{i}', release_year=2000) for i in range(size)),
+                                  batch_size=5000)
+        movie_ids = list(Movie.objects.filter(original_title__startswith='bench_movie_').values_list('id', flat=True))
+
+        Review.objects.bulk_create(
+            (Review(movie_id=movie_id, source=sources[j % len(sources)], content='',
+                    score=float(rng.uniform(0, sources[j % len(sources)].score_max)))
+             for movie_id in movie_ids for j in range(options['reviews_per_movie'])), batch_size=5000)
+        UserReview.objects.bulk_create(
+            (UserReview(movie_id=movie_id, user=user, rating=float(rng.integers(1, 11)), review='')
+             for movie_id in movie_ids for user in users), batch_size=5000)
+        # bulk_create 不触发信号，统计表需要全量重建
+        rebuild_movie_stats()
+        setup_seconds = time.perf_counter() - setup_start
+
+        start = time.perf_counter()
+        compute_truth_scores()
+        compute_seconds = time.perf_counter() - start
+
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            updated = len(update_truth_scores())
+            duration = time.perf_counter() - start
+
+        self.stdout.write(f"\n{size} 部合成电影（构造数据 {setup_seconds:.1f} 秒）")
+        self.stdout.write(f"  - 只计算（读取统计表 + numpy）: {compute_seconds:.2f} 秒")
+        self.stdout.write(f"  - 计算并写回: {duration:.2f} 秒，更新 {updated} 部电影，共 {len(queries)} 条 SQL")
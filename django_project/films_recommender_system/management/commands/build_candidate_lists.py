@@ -0,0 +1,70 @@
+# films_recommender_system/management/commands/build_candidate_lists.py
+
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.core.cache import cache
+from films_recommender_system.models import Movie
+from films_recommender_system.recommendation_utils import CANDIDATE_LISTS_CACHE_KEY
+
+
+def _build_csr(entity_ids, movie_ranks):
+    """把 (实体ID, 电影名次) 对压缩成 CSR：每个实体对应一段按名次升序、去重的数组"""
+    entity_ids = np.asarray(entity_ids, dtype=np.int64)
+    movie_ranks = np.asarray(movie_ranks, dtype=np.int64)
+    order = np.lexsort((movie_ranks, entity_ids))
+    entity_ids, movie_ranks = entity_ids[order], movie_ranks[order]
+
+    # 同一影人可能同时是导演和演员，去掉重复的 (实体, 电影) 对
+    keep = np.ones(len(entity_ids), dtype=bool)
+    keep[1:] = (entity_ids[1:] != entity_ids[:-1]) | (movie_ranks[1:] != movie_ranks[:-1])
+    entity_ids, movie_ranks = entity_ids[keep], movie_ranks[keep]
+
+    ids, starts = np.unique(entity_ids, return_index=True)
+    indptr = np.append(starts, len(entity_ids)).astype(np.int64)
+    return ids, indptr, movie_ranks.astype(np.int32)
+
+
+class Command(BaseCommand):
+    help = 'Materializes truth_score-sorted candidate lists per genre, per person and globally for cold-start recommendations.'
+
+    def handle(self, *args, **options):
+        self.stdout.write("开始构建冷启动候选列表...")
+        start_time = time.time()
+
+        # 1. 全局列表：所有电影按真值分数降序排列，名次即数组下标
+        movies = list(Movie.objects.exclude(imdb_id__isnull=True).exclude(imdb_id='')
+                      .order_by('-truth_score', 'id').values_list('id', 'imdb_id'))
+        if not movies:
+            self.stderr.write(self.style.ERROR("数据库中没有带 IMDb ID 的电影，任务中止。"))
+            return
+
+        rank_of = {pk: rank for rank, (pk, _) in enumerate(movies)}
+        item_ids = np.array([imdb_id for _, imdb_id in movies], dtype=str)
+
+        def _pairs(through, entity_field):
+            return [(entity_id, rank_of[movie_id])
+                    for entity_id, movie_id in through.objects.values_list(entity_field, 'movie_id').iterator()
+                    if movie_id in rank_of]
+
+        # 2. 每个类型 / 每个影人（导演、演员、编剧）各自的列表
+        genre_pairs = _pairs(Movie.genres.through, 'genre_id')
+        person_pairs = (_pairs(Movie.directors.through, 'person_id') + _pairs(Movie.actors.through, 'person_id')
+                        + _pairs(Movie.scriptwriters.through, 'person_id'))
+
+        genre_ids, genre_indptr, genre_items = _build_csr(*zip(*genre_pairs)) if genre_pairs else _build_csr([], [])
+        person_ids, person_indptr, person_items = _build_csr(*zip(*person_pairs)) if person_pairs else _build_csr([], [])
+
+        candidate_lists = {
+            'item_ids': item_ids,
+            'genre_ids': genre_ids, 'genre_indptr': genre_indptr, 'genre_items': genre_items,
+            'person_ids': person_ids, 'person_indptr': person_indptr, 'person_items': person_items,
+        }
+        cache.set(CANDIDATE_LISTS_CACHE_KEY, candidate_lists, timeout=None)
+
+        duration = time.time() - start_time
+        self.stdout.write(self.style.SUCCESS(f"冷启动候选列表构建完成并已缓存！耗时 {duration:.2f} 秒。"))
+        self.stdout.write(f"  - 全局列表长度: {len(item_ids)}")
+        self.stdout.write(f"  - 类型列表数: {len(genre_ids)}")
+        self.stdout.write(f"  - 影人列表数: {len(person_ids)}")
+        self.stdout.write("  - 提示: 重新计算真值分数后需要重新运行本命令。")
@@ -0,0 +1,30 @@
+# films_recommender_system/management/commands/build_movie_cards.py
+
+import time
+from django.core.management.base import BaseCommand
+from films_recommender_system.models import Movie
+from films_recommender_system.recommendation_utils import build_movie_cards, cache_movie_cards
+
+
+class Command(BaseCommand):
+    help = 'Precomputes and caches the card data used to render recommendation results.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='每批写入缓存的电影数量')
+
+    def handle(self, *args, **options):
+        self.stdout.write("开始预计算推荐卡片缓存...")
+        start_time = time.time()
+        chunk_size = options['chunk_size']
+
+        movie_ids = list(Movie.objects.exclude(imdb_id__isnull=True).exclude(imdb_id='')
+                         .order_by('id').values_list('id', flat=True))
+        total = 0
+        for i in range(0, len(movie_ids), chunk_size):
+            movies = list(Movie.objects.filter(id__in=movie_ids[i:i + chunk_size]).prefetch_related('titles'))
+            cards = build_movie_cards(movies)
+            cache_movie_cards(cards)
+            total += len(cards)
+
+        duration = time.time() - start_time
+        self.stdout.write(self.style.SUCCESS(f"推荐卡片缓存构建完成！共 {total} 部电影，耗时 {duration:.2f} 秒。"))
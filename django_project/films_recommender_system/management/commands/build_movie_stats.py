@@ -0,0 +1,21 @@
+# films_recommender_system/management/commands/build_movie_stats.py
+
+import time
+from django.core.management.base import BaseCommand
+from films_recommender_system.movie_stats import rebuild_movie_stats
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the denormalized MovieStats / MovieSourceStats tables (migration 0015 fills them; run to repair).'
+
+    def handle(self, *args, **options):
+        self.stdout.write("开始重建电影统计表...")
+        start_time = time.time()
+
+        movie_rows, source_rows = rebuild_movie_stats()
+
+        duration = time.time() - start_time
+        self.stdout.write(self.style.SUCCESS(f"电影统计表重建完成！耗时 {duration:.2f} 秒。"))
+        self.stdout.write(f"  - 电影统计行数: {movie_rows}")
+        self.stdout.write(f"  - 来源统计行数: {source_rows}")
+        self.stdout.write("  - 提示: 之后的评论、喜欢、想看与浏览会在写入时自动计入，无需再次运行。")
@@ -0,0 +1,73 @@
+# films_recommender_system/management/commands/build_similar_movies.py
+
+import time
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.core.cache import cache
+from films_recommender_system.models import Movie
+from films_recommender_system.recommendation_utils import (
+    get_item_ids, similar_movies_cache_key, SIMILAR_MOVIES_CACHE_TIMEOUT
+)
+from tqdm import tqdm
+
+
+def top_k_neighbors(item_vectors, k, batch_size=1024):
+    """
+    分块计算余弦相似度，返回每部电影最相似的 k 部电影的下标（不含自身），形状 (n_items, k)
+    每块只占用 batch_size × n_items 的内存
+    """
+    vectors = np.asarray(item_vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    vectors = vectors / norms
+
+    n_items = vectors.shape[0]
+    k = min(k, n_items - 1)
+    neighbors = np.empty((n_items, max(k, 0)), dtype=np.int32)
+    if k <= 0:
+        return neighbors
+
+    for lo in tqdm(range(0, n_items, batch_size), desc="计算相似电影"):
+        hi = min(lo + batch_size, n_items)
+        sims = vectors[lo:hi] @ vectors.T
+        sims[np.arange(hi - lo), np.arange(lo, hi)] = -np.inf  # 排除自身
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(sims, top, axis=1), axis=1, kind='stable')
+        neighbors[lo:hi] = np.take_along_axis(top, order, axis=1)
+    return neighbors
+
+
+class Command(BaseCommand):
+    help = 'Computes per-movie top-K similar movies from the recommendation item vectors.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, default=20, help='每部电影保留的相似电影数量')
+        parser.add_argument('--batch-size', type=int, default=1024, help='分块计算相似度时每块的电影数')
+
+    def handle(self, *args, **options):
+        self.stdout.write("开始计算相似电影...")
+        start_time = time.time()
+
+        model_assets = cache.get('recommendation_model_assets')
+        if not model_assets:
+            self.stderr.write(self.style.ERROR("缓存中没有模型资产，请先运行 'generate_recommendations'。"))
+            return
+
+        item_ids = get_item_ids(model_assets)
+        neighbors = top_k_neighbors(model_assets['item_vectors'], options['k'], options['batch_size'])
+        similar_map = {imdb_id: item_ids[row].tolist() for imdb_id, row in zip(item_ids.tolist(), neighbors)}
+
+        # 写入 JSON 字段，并同步刷新每部电影的缓存条目
+        movies = list(Movie.objects.filter(imdb_id__in=list(similar_map)).only('id', 'imdb_id'))
+        for movie in movies:
+            movie.similar_imdb_ids = similar_map[movie.imdb_id]
+        Movie.objects.bulk_update(movies, ['similar_imdb_ids'], batch_size=500)
+        cache.set_many({similar_movies_cache_key(movie.id): movie.similar_imdb_ids for movie in movies},
+                       SIMILAR_MOVIES_CACHE_TIMEOUT)
+
+        # 近邻下标矩阵随模型资产一起缓存，供实时推荐的召回阶段使用；重新生成模型后需重新运行本命令
+        model_assets['neighbors'] = neighbors
+        cache.set('recommendation_model_assets', model_assets, timeout=None)
+
+        duration = time.time() - start_time
+        self.stdout.write(self.style.SUCCESS(f"相似电影计算完成！共更新 {len(movies)} 部电影，耗时 {duration:.2f} 秒。"))
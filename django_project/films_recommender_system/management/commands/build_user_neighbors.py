@@ -0,0 +1,55 @@
+# films_recommender_system/management/commands/build_user_neighbors.py
+
+import os
+import time
+import numpy as np
+import pandas as pd
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from films_recommender_system.user_knn import (
+    load_ratings, centered_rows, compute_user_neighbors, USER_KNN_K, USER_KNN_MODEL_CACHE_KEY,
+    USER_NEIGHBORS_CACHE_KEY, USER_NEIGHBORS_CACHE_TIMEOUT
+)
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the user-kNN model: mean-centered rating matrix and per-user top-K neighbors (blocked, parallel).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=int, default=USER_KNN_K, help='每个用户保留的近邻数量')
+        parser.add_argument('--block-size', type=int, default=512, help='分块计算相似度时每块的用户数')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='并行计算的进程数')
+
+    def handle(self, *args, **options):
+        self.stdout.write("开始构建用户近邻模型...")
+        start_time = time.time()
+
+        ratings = load_ratings()
+        if ratings.empty:
+            self.stderr.write(self.style.ERROR("没有任何用户评分，任务中止。"))
+            return
+
+        # 1. 中心化、归一化的用户×电影稀疏评分矩阵
+        user_codes, user_ids = pd.factorize(ratings['user_id'])
+        item_codes, item_ids = pd.factorize(ratings['movie_id'])
+        matrix = centered_rows(user_codes, item_codes, ratings['rating'].to_numpy(), (len(user_ids), len(item_ids)))
+
+        # 2. 分块稀疏乘积求每个用户的 Top-K 近邻
+        neighbors = compute_user_neighbors(matrix, options['k'], options['block_size'], options['workers'])
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+
+        # 3. 矩阵留在缓存中供在线折叠使用，近邻列表按用户写入缓存
+        cache.set(USER_KNN_MODEL_CACHE_KEY, {
+            'matrix': matrix,
+            'user_ids': user_ids,
+            'user_index': {int(user_id): i for i, user_id in enumerate(user_ids)},
+            'item_index': {int(movie_id): i for i, movie_id in enumerate(item_ids)},
+        }, timeout=None)
+        cache.set_many({USER_NEIGHBORS_CACHE_KEY.format(user_id=int(user_id)): (user_ids[rows].tolist(), sims.tolist())
+                        for user_id, (rows, sims) in zip(user_ids, neighbors)}, USER_NEIGHBORS_CACHE_TIMEOUT)
+
+        duration = time.time() - start_time
+        with_neighbors = sum(1 for rows, _ in neighbors if len(rows))
+        self.stdout.write(self.style.SUCCESS(f"用户近邻模型构建完成！耗时 {duration:.2f} 秒。"))
+        self.stdout.write(f"  - 用户数: {len(user_ids)}，电影数: {len(item_ids)}，评分数: {len(ratings)}")
+        self.stdout.write(f"  - 有近邻的用户数: {with_neighbors}")
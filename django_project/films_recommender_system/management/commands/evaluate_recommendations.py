@@ -0,0 +1,51 @@
+# films_recommender_system/management/commands/evaluate_recommendations.py
+
+from pathlib import Path
+from django.core.management.base import BaseCommand
+from django.core.cache import cache
+from films_recommender_system.evaluation import (
+    TRUTH_VALUE_OUT_DIR, has_eval_data, load_eval_data, ContentModelScorer, evaluate_scorer
+)
+
+
+class Command(BaseCommand):
+    help = 'Evaluates the cached recommendation model against Truth_value eval samples (HR@K, NDCG@K, MRR, latency).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--input-dir', type=str, default=str(TRUTH_VALUE_OUT_DIR),
+                            help='Truth_value 输出目录，需包含 splits 与 eval_samples（CSV / Parquet / Feather）')
+        parser.add_argument('--k', type=int, nargs='+', default=[5, 10, 20], help='HR@K / NDCG@K 的 K 值')
+        parser.add_argument('--batch-size', type=int, default=4096, help='每批打分的样例数')
+        parser.add_argument('--latency-samples', type=int, default=1000, help='用于统计单次打分延迟的样例数')
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.HTTP_INFO("--- 推荐模型离线评测 ---"))
+
+        model_assets = cache.get('recommendation_model_assets')
+        if not model_assets:
+            self.stderr.write(self.style.ERROR("缓存中没有模型资产，请先运行 'generate_recommendations'。"))
+            return
+
+        input_dir = Path(options['input_dir'])
+        if not has_eval_data(input_dir):
+            self.stderr.write(self.style.ERROR(f"{input_dir} 下缺少评测文件，请先运行 algorithm/Truth_value.py。"))
+            return
+
+        train, eval_users, candidates = load_eval_data(input_dir)
+        self.stdout.write(f"  - 训练正样本: {len(train)}")
+        self.stdout.write(f"  - 评测样例: {len(eval_users)} (每例 1 正 + {candidates.shape[1] - 1} 负)")
+
+        scorer = ContentModelScorer(model_assets, train)
+        metrics = evaluate_scorer(scorer, eval_users, candidates, ks=options['k'],
+                                  batch_size=options['batch_size'], latency_samples=options['latency_samples'])
+
+        self.stdout.write(self.style.HTTP_INFO("\n--- 质量指标 ---"))
+        for k in options['k']:
+            self.stdout.write(f"  HR@{k}: {metrics[f'HR@{k}']:.4f}    NDCG@{k}: {metrics[f'NDCG@{k}']:.4f}")
+        self.stdout.write(f"  MRR: {metrics['MRR']:.4f}")
+
+        self.stdout.write(self.style.HTTP_INFO("\n--- 性能指标 ---"))
+        self.stdout.write(f"  批量打分耗时: {metrics['batch_seconds']:.3f} 秒")
+        self.stdout.write(f"  吞吐: {metrics['throughput']:.0f} 样例/秒")
+        self.stdout.write(f"  单次打分延迟: p50={metrics['p50_ms']:.3f} ms, p99={metrics['p99_ms']:.3f} ms")
+        self.stdout.write("-" * 25)
@@ -3,17 +3,30 @@
 import os
 
 os.environ['OPENBLAS_NUM_THREADS'] = '1'
+import numpy as np
 import pandas as pd
 from django.core.management.base import BaseCommand
 from django.core.cache import cache
+from django.conf import settings
 from films_recommender_system.models import Movie
-from sklearn.feature_extraction.text import TfidfVectorizer
-from tqdm import tqdm
+from films_recommender_system.content_model import build_movie_documents, build_item_vectors, FEATURE_KINDS
+from films_recommender_system.sharded_scoring import write_item_shards
 
 
 class Command(BaseCommand):
     help = 'Builds and caches content-based feature vectors for all movies.'
 
+    def add_arguments(self, parser):
+        # 模型超参数，可先用 sweep_recommendations 选出合适的取值
+        parser.add_argument('--max-features', type=int, default=1000, help='TF-IDF 保留的特征词数量')
+        for kind in FEATURE_KINDS:
+            parser.add_argument(f'--{kind}-weight', type=float, default=1.0, help=f'{kind} 类特征列的权重')
+        parser.add_argument('--factors', type=int, default=0, help='截断 SVD 的维度（0 表示不降维）')
+        parser.add_argument('--shards', type=int, default=0,
+                            help='将电影向量按行切成 N 个连续分片写入分片目录，供分片打分服务使用（0 表示不写）')
+        parser.add_argument('--shard-dir', type=str, default=None,
+                            help='分片目录，默认为 settings.RECOMMENDATION_SHARD_DIR')
+
     def handle(self, *args, **options):
         self.stdout.write("开始为所有电影构建内容画像向量...")
 
@@ -24,29 +37,7 @@ class Command(BaseCommand):
             self.stderr.write(self.style.ERROR("数据库中没有电影，任务中止。"))
             return
 
-        documents = []
-        movie_ids_in_order = []
-
-        for movie in tqdm(movies, desc="[1/2] 创建特征文档"):
-            if not movie.imdb_id:
-                continue
-
-            # 为每部电影创建一个由其内容特征（类型、导演、演员）组成的“词袋”
-            features = []
-
-            # 为特征添加前缀以避免混淆（例如，类型'Action'和演员'Action Bronson'）
-            for genre in movie.genres.all():
-                features.append(f"genre_{genre.name.replace(' ', '')}")
-
-            for director in movie.directors.all():
-                features.append(f"director_{director.name.replace(' ', '')}")
-
-            for actor in movie.actors.all():
-                features.append(f"actor_{actor.name.replace(' ', '')}")
-
-            if features:
-                documents.append(" ".join(features))
-                movie_ids_in_order.append(movie.imdb_id)
+        documents, movie_ids_in_order = build_movie_documents(movies)
 
         if not documents:
             self.stderr.write(self.style.ERROR("没有任何电影有关联的内容特征，无法构建模型。"))
@@ -54,8 +45,8 @@ class Command(BaseCommand):
 
         # 2. 使用TF-IDF将“词袋”转换为数学向量
         self.stdout.write("[2/2] 正在使用TF-IDF进行向量化...")
-        vectorizer = TfidfVectorizer(max_features=1000)  # 限制特征维度，防止过大
-        movie_vectors = vectorizer.fit_transform(documents).toarray()  # 转换为NumPy数组
+        feature_weights = {kind: options[f'{kind}_weight'] for kind in FEATURE_KINDS}
+        movie_vectors = build_item_vectors(documents, options['max_features'], feature_weights, options['factors'])
 
         # 3. 构建并缓存资产
         # 现在的item_map是imdb_id到向量数组行索引的映射
@@ -64,9 +55,18 @@ class Command(BaseCommand):
         model_assets = {
             'item_vectors': movie_vectors,
             'item_map': item_map,
+            # 按向量行顺序排列的 imdb_id，用于把 Top-K 下标直接映射回电影
+            'item_ids': np.array(movie_ids_in_order, dtype=object),
             # 在这个模型中，我们不再需要 reverse_item_map，因为ID本身就是名称
         }
 
+        if options['shards'] > 0:
+            shard_dir = options['shard_dir'] or settings.RECOMMENDATION_SHARD_DIR
+            manifest = write_item_shards(movie_vectors, shard_dir, options['shards'])
+            # 实时打分只在分片版本与模型资产一致时才使用分片
+            model_assets['shard_version'] = manifest['version']
+            self.stdout.write(f"  - 已写入 {len(manifest['shards'])} 个向量分片到 {shard_dir}")
+
         cache.set('recommendation_model_assets', model_assets, timeout=None)
 
         self.stdout.write(self.style.SUCCESS("内容画像向量构建完成并已成功缓存！"))
@@ -0,0 +1,25 @@
+# films_recommender_system/management/commands/recommendation_tier_stats.py
+
+from django.core.management.base import BaseCommand
+from films_recommender_system.serving import get_tier_counts, reset_tier_counts
+
+
+class Command(BaseCommand):
+    help = 'Shows how often each realtime recommendation tier was served, including deadline-degraded responses.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='输出后清零计数')
+
+    def handle(self, *args, **options):
+        counts = get_tier_counts()
+        total = sum(counts.values())
+        if not total:
+            self.stdout.write("暂无实时推荐的服务记录。")
+        else:
+            self.stdout.write(self.style.HTTP_INFO(f"实时推荐共服务 {total} 次："))
+            for tier, count in sorted(counts.items(), key=lambda item: -item[1]):
+                self.stdout.write(f"  - {tier:<32} {count:>8}  ({count / total:.1%})")
+
+        if options['reset']:
+            reset_tier_counts()
+            self.stdout.write(self.style.SUCCESS("计数已清零。"))
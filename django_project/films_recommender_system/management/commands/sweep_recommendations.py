@@ -0,0 +1,136 @@
+# films_recommender_system/management/commands/sweep_recommendations.py
+
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import pandas as pd
+from django.core.management.base import BaseCommand
+from films_recommender_system.content_model import build_movie_documents, build_item_vectors, FEATURE_KINDS
+from films_recommender_system.evaluation import (
+    TRUTH_VALUE_OUT_DIR, has_eval_data, load_eval_data, ContentModelScorer, evaluate_scorer
+)
+from films_recommender_system.models import Movie
+from threadpoolctl import threadpool_limits
+
+# 可扫描的超参数及其默认值（与 generate_recommendations 的默认值一致）
+DEFAULT_PARAMS = {
+    'max_features': 1000,
+    'genre_weight': 1.0,
+    'director_weight': 1.0,
+    'actor_weight': 1.0,
+    'factors': 0,
+}
+
+# --- 进程池 worker：数据在 initializer 中传入一次，之后每个任务只传一组参数 ---
+_WORKER_DATA = {}
+
+
+def _init_worker(data, blas_threads):
+    threadpool_limits(blas_threads)
+    _WORKER_DATA.update(data)
+
+
+def _run_config(params):
+    """训练一组参数对应的模型并在留出集上评测，返回一行结果（参数 + 质量指标 + 训练/推断开销）"""
+    data = _WORKER_DATA
+    start = time.perf_counter()
+    feature_weights = {kind: params[f'{kind}_weight'] for kind in FEATURE_KINDS}
+    item_vectors = build_item_vectors(data['documents'], params['max_features'], feature_weights, params['factors'])
+    train_seconds = time.perf_counter() - start
+
+    model_assets = {'item_vectors': item_vectors, 'item_map': data['item_map']}
+    scorer = ContentModelScorer(model_assets, data['train'])
+    metrics = evaluate_scorer(scorer, data['eval_users'], data['candidates'], ks=data['ks'],
+                              latency_samples=data['latency_samples'])
+    metrics.pop('cases')
+    return {**params, 'dims': item_vectors.shape[1], 'train_seconds': train_seconds, **metrics}
+
+
+class Command(BaseCommand):
+    help = 'Runs a parallel hyperparameter sweep of the content model and evaluates every configuration on the holdout.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grid', type=str, required=True,
+                            help='参数网格：JSON 字符串或 JSON 文件路径，如 \'{"max_features": [500, 1000], "factors": [0, 64]}\'')
+        parser.add_argument('--input-dir', type=str, default=str(TRUTH_VALUE_OUT_DIR),
+                            help='Truth_value 输出目录，需包含 splits 与 eval_samples（CSV / Parquet / Feather）')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='并行训练的进程数')
+        parser.add_argument('--blas-threads', type=int, default=1, help='每个进程的 BLAS 线程数上限')
+        parser.add_argument('--k', type=int, nargs='+', default=[10], help='HR@K / NDCG@K 的 K 值')
+        parser.add_argument('--latency-samples', type=int, default=500, help='用于统计单次打分延迟的样例数')
+        parser.add_argument('--metric', type=str, default=None, help='质量门槛使用的指标，默认为 NDCG@<第一个 K>')
+        parser.add_argument('--min-quality', type=float, default=None, help='质量门槛，选出满足门槛的最快配置')
+        parser.add_argument('--output', type=str, default=None, help='结果表输出路径（CSV）')
+
+    def handle(self, *args, **options):
+        grid = self._parse_grid(options['grid'])
+        if grid is None:
+            return
+        configs = [dict(DEFAULT_PARAMS, **dict(zip(grid, values))) for values in itertools.product(*grid.values())]
+        metric = options['metric'] or f"NDCG@{options['k'][0]}"
+
+        input_dir = Path(options['input_dir'])
+        if not has_eval_data(input_dir):
+            self.stderr.write(self.style.ERROR(f"{input_dir} 下缺少评测文件，请先运行 algorithm/Truth_value.py。"))
+            return
+
+        self.stdout.write(self.style.HTTP_INFO(f"--- 超参数扫描：{len(configs)} 组配置，{options['workers']} 个进程 ---"))
+
+        # 数据库与评测文件只在主进程中读取一次
+        movies = Movie.objects.prefetch_related('genres', 'directors', 'actors').all()
+        documents, imdb_ids = build_movie_documents(movies, progress=False)
+        if not documents:
+            self.stderr.write(self.style.ERROR("没有任何电影有关联的内容特征，无法构建模型。"))
+            return
+        train, eval_users, candidates = load_eval_data(input_dir)
+
+        data = {
+            'documents': documents, 'item_map': {imdb_id: i for i, imdb_id in enumerate(imdb_ids)},
+            'train': train, 'eval_users': eval_users, 'candidates': candidates,
+            'ks': options['k'], 'latency_samples': options['latency_samples'],
+        }
+
+        start = time.time()
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=_init_worker,
+                                 initargs=(data, options['blas_threads'])) as pool:
+            rows = []
+            for i, row in enumerate(pool.map(_run_config, configs), 1):
+                rows.append(row)
+                self.stdout.write(f"  [{i}/{len(configs)}] {metric}={row[metric]:.4f}  "
+                                  f"训练 {row['train_seconds']:.2f} 秒  p50={row['p50_ms']:.3f} ms")
+
+        results = pd.DataFrame(rows).sort_values(metric, ascending=False).reset_index(drop=True)
+        self.stdout.write(self.style.HTTP_INFO(f"\n--- 扫描结果（按 {metric} 降序，共耗时 {time.time() - start:.1f} 秒） ---"))
+        with pd.option_context('display.max_columns', None, 'display.width', 200):
+            self.stdout.write(results.to_string(float_format=lambda v: f"{v:.4f}"))
+
+        if options['output']:
+            results.to_csv(options['output'], index=False)
+            self.stdout.write(f"\n结果已写入 {options['output']}")
+
+        if options['min_quality'] is not None:
+            passing = results[results[metric] >= options['min_quality']]
+            if passing.empty:
+                self.stdout.write(self.style.ERROR(f"\n没有配置满足 {metric} >= {options['min_quality']}。"))
+            else:
+                # 满足质量门槛的配置中，先看线上打分延迟，再看训练耗时
+                best = passing.sort_values(['p50_ms', 'train_seconds']).index[0]
+                params = ', '.join(f"{name}={results.at[best, name]}" for name in DEFAULT_PARAMS)
+                self.stdout.write(self.style.SUCCESS(f"\n满足 {metric} >= {options['min_quality']} 的最快配置：{params}"))
+
+    def _parse_grid(self, value):
+        path = Path(value)
+        try:
+            grid = json.loads(path.read_text() if path.suffix == '.json' and path.exists() else value)
+        except json.JSONDecodeError as e:
+            self.stderr.write(self.style.ERROR(f"无法解析参数网格: {e}"))
+            return None
+        unknown = set(grid) - set(DEFAULT_PARAMS)
+        if unknown:
+            self.stderr.write(self.style.ERROR(
+                f"未知的参数: {', '.join(sorted(unknown))}；可选: {', '.join(DEFAULT_PARAMS)}"))
+            return None
+        return {name: values if isinstance(values, list) else [values] for name, values in grid.items()}
@@ -0,0 +1,21 @@
+# films_recommender_system/management/commands/update_trending.py
+
+import time
+from django.core.management.base import BaseCommand
+from films_recommender_system.models import MovieTrend
+from films_recommender_system.trending import update_trending, get_trending_movies_qs
+
+
+class Command(BaseCommand):
+    help = 'Folds newly closed hourly activity buckets into the decayed trending scores (run periodically, e.g. hourly).'
+
+    def handle(self, *args, **options):
+        self.stdout.write("正在更新电影热度...")
+        start_time = time.time()
+
+        processed = update_trending()
+
+        duration = time.time() - start_time
+        self.stdout.write(self.style.SUCCESS(f"热度更新完成！计入 {processed} 个行为分桶，耗时 {duration:.2f} 秒。"))
+        self.stdout.write(f"  - 热度表电影数: {MovieTrend.objects.count()}")
+        self.stdout.write(f"  - 窗口内热门电影数: {get_trending_movies_qs().count()}")
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('films_recommender_system', '0008_alter_movietitle_title_text_alter_person_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='similar_imdb_ids',
+            field=models.JSONField(blank=True, help_text='由内容向量离线计算的相似电影 imdb_id 列表（按相似度降序）', null=True),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('films_recommender_system', '0009_movie_similar_imdb_ids'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='browsinghistory',
+            index=models.Index(fields=['user', '-viewed_on'], name='history_user_recent_idx'),
+        ),
+    ]
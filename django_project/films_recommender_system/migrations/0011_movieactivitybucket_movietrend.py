@@ -0,0 +1,36 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('films_recommender_system', '0010_browsinghistory_user_recent_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieTrend',
+            fields=[
+                ('movie', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trend', serialize=False, to='films_recommender_system.movie')),
+                ('score', models.FloatField(db_index=True, help_text='log2(按固定起点归一化的衰减热度)，只用于排序')),
+                ('last_bucket', models.DateTimeField(db_index=True, help_text='最近一次计入的行为分桶')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MovieActivityBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField(db_index=True, help_text='所在小时的起始时间')),
+                ('views', models.PositiveIntegerField(default=0, help_text='浏览次数')),
+                ('favorites', models.PositiveIntegerField(default=0, help_text='被加入“喜欢”的次数')),
+                ('reviews', models.PositiveIntegerField(default=0, help_text='新增评论数')),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity_buckets', to='films_recommender_system.movie')),
+            ],
+            options={
+                'unique_together': {('movie', 'bucket')},
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('films_recommender_system', '0011_movieactivitybucket_movietrend'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieCooccurrence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0, help_text='同时出现在同一用户列表中的次数')),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cooccurrences', to='films_recommender_system.movie')),
+                ('other', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='films_recommender_system.movie')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['movie', '-count'], name='cooccurrence_movie_count_idx')],
+                'unique_together': {('movie', 'other')},
+            },
+        ),
+    ]
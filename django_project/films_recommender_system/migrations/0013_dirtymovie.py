@@ -0,0 +1,20 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('films_recommender_system', '0012_moviecooccurrence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DirtyMovie',
+            fields=[
+                ('movie_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('marked_at', models.DateTimeField(db_index=True, help_text='最近一次登记的时间')),
+            ],
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('films_recommender_system', '0013_dirtymovie'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MovieStats',
+            fields=[
+                ('movie', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='films_recommender_system.movie')),
+                ('review_count', models.PositiveIntegerField(default=0, help_text='本站用户评分数')),
+                ('rating_sum', models.FloatField(default=0.0, help_text='本站用户评分之和')),
+                ('rating_sum_sq', models.FloatField(default=0.0, help_text='本站用户评分的平方和，用于计算方差')),
+                ('favorite_count', models.PositiveIntegerField(default=0, help_text='被加入“喜欢”的次数')),
+                ('watchlist_count', models.PositiveIntegerField(default=0, help_text='被加入“想看”的次数')),
+                ('view_count', models.PositiveIntegerField(default=0, help_text='浏览次数')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MovieSourceStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('review_count', models.PositiveIntegerField(default=0, help_text='该来源有分数的评论数')),
+                ('score_sum', models.FloatField(default=0.0, help_text='该来源评论的原始分数之和')),
+                ('movie', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='source_stats', to='films_recommender_system.movie')),
+                ('source', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='films_recommender_system.source')),
+            ],
+            options={
+                'unique_together': {('movie', 'source')},
+            },
+        ),
+    ]
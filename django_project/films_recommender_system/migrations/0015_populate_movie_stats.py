@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-19 12:10
+
+from django.db import migrations
+
+from films_recommender_system.movie_stats import rebuild_movie_stats
+
+
+def populate_movie_stats(apps, schema_editor):
+    # 0014 只建表；已有数据库需在此回填，否则全量重算真值分数时所有电影都会得 0 分
+    rebuild_movie_stats(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('films_recommender_system', '0014_moviestats'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_movie_stats, migrations.RunPython.noop),
+    ]
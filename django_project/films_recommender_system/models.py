@@ -1,6 +1,6 @@
 # films_recommender_system/models.py
 
-from django.db import models
+from django.db import models, router, transaction
 from django.contrib.auth.models import User
 
 
@@ -44,6 +44,9 @@ class Movie(models.Model):
     # --- 新增：用于冷启动推荐的真值分数 ---
     truth_score = models.FloatField(default=0.0, db_index=True, help_text="根据多源评分计算的全局真值分数")
 
+    # --- 新增：离线计算的相似电影，用于详情页“更多相似电影” ---
+    similar_imdb_ids = models.JSONField(null=True, blank=True, help_text="由内容向量离线计算的相似电影 imdb_id 列表（按相似度降序）")
+
     # 电影标识
     class Meta:
         # 为original_title和release_year添加一个联合唯一约束，以此作为电影唯一标识(优先使用IMDb ID)
@@ -84,8 +87,20 @@ class Source(models.Model):
     def __str__(self): return self.name
 
 
+# 保存与 post_save 信号处理器在同一事务中执行：信号里维护的 MovieStats 计数与原始写入一起提交或回滚
+# （删除本来就在 Collector 的事务中发送 post_delete 信号）
+class StatsTrackedModel(models.Model):
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(type(self), instance=self)
+        with transaction.atomic(using=using):
+            super().save(*args, **kwargs)
+
+
 # 电影评价信息
-class Review(models.Model):
+class Review(StatsTrackedModel):
     movie = models.ForeignKey(Movie, on_delete=models.CASCADE, help_text='关联的电影')
     source = models.ForeignKey(Source, on_delete=models.CASCADE, help_text='评论来源')
 
@@ -124,7 +139,7 @@ class UserProfile(models.Model):
 
 
 # 真值电影推荐网站用户评价信息
-class UserReview(models.Model):
+class UserReview(StatsTrackedModel):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reviews', help_text='评分用户')
     movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='user_reviews', help_text='评价的电影')
     rating = models.FloatField(help_text='用户评分 (e.g. 1.0-10.0)')
@@ -146,7 +161,7 @@ class UserReview(models.Model):
 
 
 # 用户浏览历史模型
-class BrowsingHistory(models.Model):
+class BrowsingHistory(StatsTrackedModel):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='browsing_history')
     movie = models.ForeignKey(Movie, on_delete=models.CASCADE)
     viewed_on = models.DateTimeField(auto_now=True, help_text="最近浏览时间")
@@ -154,6 +169,8 @@ class BrowsingHistory(models.Model):
     class Meta:
         unique_together = ('user', 'movie')  # 一个用户对一个电影只有一条历史记录，时间会自动更新
         ordering = ['-viewed_on']
+        # 会话推荐按用户取最近浏览记录
+        indexes = [models.Index(fields=['user', '-viewed_on'], name='history_user_recent_idx')]
 
     def __str__(self):
         return f"{self.user.username} viewed {self.movie} on {self.viewed_on}"
@@ -174,4 +191,89 @@ class Recommendation(models.Model):
     last_update = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return f"Recommendation settings for {self.user.username}"
\ No newline at end of file
+        return f"Recommendation settings for {self.user.username}"
+
+# ------ 热度模型 ------
+
+# 电影行为计数（按小时分桶），由浏览/喜欢/评论时的信号累加
+class MovieActivityBucket(models.Model):
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='activity_buckets')
+    bucket = models.DateTimeField(db_index=True, help_text='所在小时的起始时间')
+    views = models.PositiveIntegerField(default=0, help_text='浏览次数')
+    favorites = models.PositiveIntegerField(default=0, help_text='被加入“喜欢”的次数')
+    reviews = models.PositiveIntegerField(default=0, help_text='新增评论数')
+
+    class Meta:
+        unique_together = ('movie', 'bucket')
+
+    def __str__(self):
+        return f"Activity of movie {self.movie_id} at {self.bucket}"
+
+
+# 电影热度分数（滑动窗口 + 指数衰减），由 update_trending 命令增量维护
+class MovieTrend(models.Model):
+    movie = models.OneToOneField(Movie, on_delete=models.CASCADE, primary_key=True, related_name='trend')
+    score = models.FloatField(db_index=True, help_text='log2(按固定起点归一化的衰减热度)，只用于排序')
+    last_bucket = models.DateTimeField(db_index=True, help_text='最近一次计入的行为分桶')
+
+    def __str__(self):
+        return f"Trend of movie {self.movie_id}: {self.score:.3f}"
+
+
+# 电影共现次数：同一用户的“喜欢”与“想看”列表中同时出现的次数，即物品×物品矩阵 XᵀX 的非对角非零元
+# 对称矩阵的 (a, b) 与 (b, a) 各存一行；由 build_cooccurrence 全量构建，用户列表变化时增量更新
+class MovieCooccurrence(models.Model):
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='cooccurrences')
+    other = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='+')
+    count = models.PositiveIntegerField(default=0, help_text='同时出现在同一用户列表中的次数')
+
+    class Meta:
+        unique_together = ('movie', 'other')
+        indexes = [models.Index(fields=['movie', '-count'], name='cooccurrence_movie_count_idx')]
+
+    def __str__(self):
+        return f"Cooccurrence of movies {self.movie_id} and {self.other_id}: {self.count}"
+
+
+# 待重算真值分数的电影队列：外部评论 / 本站评分写入或删除时登记，由 calculate_truth_scores --dirty 消费
+# 只存电影 ID 而不建外键：级联删除电影时，评论的删除信号仍会登记该电影，不能因此违反外键约束
+class DirtyMovie(models.Model):
+    movie_id = models.BigIntegerField(primary_key=True)
+    marked_at = models.DateTimeField(db_index=True, help_text='最近一次登记的时间')
+
+    def __str__(self):
+        return f"Dirty movie {self.movie_id} marked at {self.marked_at}"
+
+
+# 电影统计信息的反范式副本，由评论 / 喜欢 / 想看 / 浏览的信号在原始写入的同一事务中用 F 表达式累加
+# 热点读取路径（真值分数、详情页）只需读一行，无需聚合评论表
+class MovieStats(models.Model):
+    movie = models.OneToOneField(Movie, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    review_count = models.PositiveIntegerField(default=0, help_text='本站用户评分数')
+    rating_sum = models.FloatField(default=0.0, help_text='本站用户评分之和')
+    rating_sum_sq = models.FloatField(default=0.0, help_text='本站用户评分的平方和，用于计算方差')
+    favorite_count = models.PositiveIntegerField(default=0, help_text='被加入“喜欢”的次数')
+    watchlist_count = models.PositiveIntegerField(default=0, help_text='被加入“想看”的次数')
+    view_count = models.PositiveIntegerField(default=0, help_text='浏览次数')
+
+    @property
+    def average_rating(self):
+        return self.rating_sum / self.review_count if self.review_count else None
+
+    def __str__(self):
+        return f"Stats of movie {self.movie_id}: {self.review_count} ratings"
+
+
+# 每部电影在每个外部来源上的评分统计（只统计有分数的评论）
+# 存原始分数之和而不预先加权：来源的可信度与满分值调整后无需回填
+class MovieSourceStats(models.Model):
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name='source_stats')
+    source = models.ForeignKey(Source, on_delete=models.CASCADE, related_name='+')
+    review_count = models.PositiveIntegerField(default=0, help_text='该来源有分数的评论数')
+    score_sum = models.FloatField(default=0.0, help_text='该来源评论的原始分数之和')
+
+    class Meta:
+        unique_together = ('movie', 'source')
+
+    def __str__(self):
+        return f"Stats of movie {self.movie_id} from source {self.source_id}: {self.review_count} reviews"
@@ -0,0 +1,116 @@
+# films_recommender_system/movie_stats.py
+
+from functools import partial
+
+from django.apps import apps as global_apps
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+from .models import MovieSourceStats, MovieStats
+
+
+def _increment(queryset, new_rows, deltas):
+    """
+    对统计行做 F 表达式累加。增量为正时先用 ignore_conflicts 补建缺失的行（并发创建也安全）；
+    扣减时只更新已存在的行，不会为级联删除中的电影重新建行
+    """
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    if new_rows and any(delta > 0 for delta in deltas.values()):
+        queryset.model.objects.bulk_create(new_rows, ignore_conflicts=True)
+    queryset.update(**{field: F(field) + delta for field, delta in deltas.items()})
+
+
+def increment_movie_stats(movie_ids, **deltas):
+    movie_ids = list(movie_ids)
+    if movie_ids:
+        _increment(MovieStats.objects.filter(movie_id__in=movie_ids),
+                   [MovieStats(movie_id=movie_id) for movie_id in movie_ids], deltas)
+
+
+def record_user_rating(movie_id, rating, sign=1):
+    """计入（sign=1）或扣除（sign=-1）一条本站用户评分"""
+    increment_movie_stats([movie_id], review_count=sign, rating_sum=sign * rating,
+                          rating_sum_sq=sign * rating * rating)
+
+
+def record_external_score(movie_id, source_id, score, sign=1):
+    """计入或扣除一条外部评论的分数；没有分数的评论不参与统计"""
+    if score is None:
+        return
+    _increment(MovieSourceStats.objects.filter(movie_id=movie_id, source_id=source_id),
+               [MovieSourceStats(movie_id=movie_id, source_id=source_id)],
+               {'review_count': sign, 'score_sum': sign * score})
+
+
+def record_list_change(through, owner_field, count_field, instance, action, reverse, pk_set):
+    """
+    “喜欢”/“想看”多对多变化时更新电影计数
+    新增在 post_add 计入（此时 pk_set 已去掉原本就存在的关系）；
+    移除与清空在 pre_* 阶段按实际存在的关系扣减（pk_set 可能包含本不在列表中的对象）
+    """
+    if action == 'post_add' and pk_set:
+        if reverse:
+            increment_movie_stats([instance.pk], **{count_field: len(pk_set)})
+        else:
+            increment_movie_stats(pk_set, **{count_field: 1})
+        return
+    if action not in ('pre_remove', 'pre_clear'):
+        return
+
+    rows = through.objects.filter(**{'movie_id' if reverse else owner_field: instance.pk})
+    if action == 'pre_remove':
+        rows = rows.filter(**{f'{owner_field}__in' if reverse else 'movie_id__in': pk_set or []})
+    removed = {}
+    for movie_id, n in rows.order_by().values('movie_id').annotate(n=Count('id')).values_list('movie_id', 'n'):
+        removed.setdefault(n, []).append(movie_id)
+    for n, movie_ids in removed.items():
+        increment_movie_stats(movie_ids, **{count_field: -n})
+
+
+def rebuild_movie_stats(apps=global_apps):
+    """
+    从评论、列表与浏览记录全量重建统计表，返回 (电影统计行数, 来源统计行数)
+    浏览次数无法从一人一条的浏览记录中还原：已有的计数保留，新建的行以浏览过的用户数起步
+    apps: 模型注册表，数据迁移中传入历史模型的注册表
+    """
+    model = partial(apps.get_model, 'films_recommender_system')
+    MovieStats, MovieSourceStats = model('MovieStats'), model('MovieSourceStats')
+    Review, UserReview, BrowsingHistory = model('Review'), model('UserReview'), model('BrowsingHistory')
+    Recommendation, UserProfile = model('Recommendation'), model('UserProfile')
+    stats = {}
+
+    def _row(movie_id):
+        return stats.setdefault(movie_id, MovieStats(movie_id=movie_id))
+
+    ratings = (UserReview.objects.order_by().values('movie_id')
+               .annotate(n=Count('id'), s=Sum('rating'), sq=Sum(F('rating') * F('rating')))
+               .values_list('movie_id', 'n', 's', 'sq'))
+    for movie_id, n, rating_sum, rating_sum_sq in ratings:
+        row = _row(movie_id)
+        row.review_count, row.rating_sum, row.rating_sum_sq = n, rating_sum, rating_sum_sq
+
+    for through, field in ((Recommendation.favorite_movies.through, 'favorite_count'),
+                           (UserProfile.watchlist.through, 'watchlist_count')):
+        counts = through.objects.order_by().values('movie_id').annotate(n=Count('id')).values_list('movie_id', 'n')
+        for movie_id, n in counts:
+            setattr(_row(movie_id), field, n)
+
+    sources = [MovieSourceStats(movie_id=movie_id, source_id=source_id, review_count=n, score_sum=score_sum)
+               for movie_id, source_id, n, score_sum in
+               Review.objects.filter(score__isnull=False).order_by().values('movie_id', 'source_id')
+               .annotate(n=Count('id'), s=Sum('score')).values_list('movie_id', 'source_id', 'n', 's')]
+
+    with transaction.atomic():
+        views = dict(BrowsingHistory.objects.order_by().values('movie_id').annotate(n=Count('id'))
+                     .values_list('movie_id', 'n'))
+        views.update(MovieStats.objects.select_for_update().values_list('movie_id', 'view_count'))
+        for movie_id, n in views.items():
+            _row(movie_id).view_count = n
+
+        MovieStats.objects.all().delete()
+        MovieSourceStats.objects.all().delete()
+        MovieStats.objects.bulk_create(stats.values(), batch_size=1000)
+        MovieSourceStats.objects.bulk_create(sources, batch_size=1000)
+    return len(stats), len(sources)
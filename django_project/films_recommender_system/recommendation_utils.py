@@ -0,0 +1,331 @@
+# films_recommender_system/recommendation_utils.py
+
+import secrets
+import time
+import numpy as np
+from django.core.cache import cache
+from django.db.models import CharField, Value
+from sklearn.metrics.pairwise import cosine_similarity
+
+from .models import Movie, Recommendation, UserProfile, UserReview, BrowsingHistory
+from .serializers import RecommendationMovieSerializer
+from .sharded_scoring import get_sharded_scorer
+
+# 用户已交互电影的来源，顺序即缓存中各部分的顺序
+EXCLUSION_SOURCES = ('favorites', 'reviews', 'watchlist', 'history')
+EXCLUSION_CACHE_KEY = 'rec_exclusions_{user_id}'
+EXCLUSION_CACHE_TIMEOUT = 60 * 30
+
+# 用户偏好（喜欢的类型/影人）缓存
+PREFERENCE_CACHE_KEY = 'rec_preferences_{user_id}'
+PREFERENCE_CACHE_TIMEOUT = 60 * 30
+
+# 会话推荐：取最近浏览的电影数量，以及按新近程度的衰减系数
+SESSION_HISTORY_LENGTH = 20
+SESSION_DECAY = 0.8
+
+# 冷启动候选列表：由 build_candidate_lists 命令预先生成
+CANDIDATE_LISTS_CACHE_KEY = 'cold_start_candidate_lists'
+
+# 推荐卡片缓存：每部电影一条，渲染推荐页所需的最少字段
+MOVIE_CARD_CACHE_KEY = 'movie_card_{imdb_id}'
+MOVIE_CARD_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+# 相似电影缓存：每部电影一条，由 build_similar_movies 命令写入
+SIMILAR_MOVIES_CACHE_KEY = 'similar_movies_{movie_id}'
+SIMILAR_MOVIES_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+
+# 推荐流游标：每个用户最多保留 FEED_MAX_CURSORS 份完整排序，每份在 FEED_CURSOR_TIMEOUT 秒后失效
+FEED_CACHE_KEY = 'rec_feed_{user_key}'
+FEED_CURSOR_TIMEOUT = 60 * 10
+FEED_MAX_CURSORS = 3
+
+
+def _exclusion_cache_key(user_id):
+    return EXCLUSION_CACHE_KEY.format(user_id=user_id)
+
+
+def _preference_cache_key(user_id):
+    return PREFERENCE_CACHE_KEY.format(user_id=user_id)
+
+
+def get_user_exclusion_parts(user_id):
+    """
+    返回用户已交互过的电影 imdb_id，按来源分组：{'favorites': [...], 'reviews': [...], ...}
+    四个来源通过一条 UNION ALL 查询取回，结果按用户缓存，重复请求无需再查库
+    """
+    key = _exclusion_cache_key(user_id)
+    parts = cache.get(key)
+    if parts is not None:
+        return parts
+
+    def _tagged(qs, kind):
+        return qs.annotate(kind=Value(kind, output_field=CharField())).values_list('kind', 'movie__imdb_id')
+
+    favorites = _tagged(Recommendation.favorite_movies.through.objects.filter(recommendation_id=user_id), 'favorites')
+    reviews = _tagged(UserReview.objects.filter(user_id=user_id).order_by(), 'reviews')
+    watchlist = _tagged(UserProfile.watchlist.through.objects.filter(userprofile__user_id=user_id), 'watchlist')
+    history = _tagged(BrowsingHistory.objects.filter(user_id=user_id).order_by(), 'history')
+
+    parts = {kind: [] for kind in EXCLUSION_SOURCES}
+    for kind, imdb_id in favorites.union(reviews, watchlist, history, all=True):
+        if imdb_id:
+            parts[kind].append(imdb_id)
+
+    cache.set(key, parts, EXCLUSION_CACHE_TIMEOUT)
+    return parts
+
+
+def invalidate_user_exclusions(*user_ids):
+    """用户的喜欢/评分/收藏/浏览发生变化时，清除其排除集合缓存"""
+    cache.delete_many([_exclusion_cache_key(user_id) for user_id in user_ids])
+
+
+def get_user_preference_ids(user_id):
+    """返回用户喜欢的类型和影人 ID：{'genres': [...], 'people': [...]}，一条 UNION ALL 查询，按用户缓存"""
+    key = _preference_cache_key(user_id)
+    prefs = cache.get(key)
+    if prefs is not None:
+        return prefs
+
+    genres = (UserProfile.favorite_genres.through.objects.filter(userprofile__user_id=user_id)
+              .annotate(kind=Value('genres', output_field=CharField())).values_list('kind', 'genre_id'))
+    people = (UserProfile.favorite_people.through.objects.filter(userprofile__user_id=user_id)
+              .annotate(kind=Value('people', output_field=CharField())).values_list('kind', 'person_id'))
+
+    prefs = {'genres': [], 'people': []}
+    for kind, entity_id in genres.union(people, all=True):
+        prefs[kind].append(entity_id)
+
+    cache.set(key, prefs, PREFERENCE_CACHE_TIMEOUT)
+    return prefs
+
+
+def invalidate_user_preferences(*user_ids):
+    """用户喜欢的类型/影人发生变化时，清除其偏好缓存"""
+    cache.delete_many([_preference_cache_key(user_id) for user_id in user_ids])
+
+
+def build_exclusion_mask(parts, item_map, n_items):
+    """把已交互电影映射成与模型向量行对齐的布尔掩码，True 表示需要排除"""
+    mask = np.zeros(n_items, dtype=bool)
+    indices = [item_map[imdb_id] for ids in parts.values() for imdb_id in ids if imdb_id in item_map]
+    if indices:
+        mask[indices] = True
+    return mask
+
+
+def get_item_ids(model_assets):
+    """返回按向量行排列的 imdb_id 数组；兼容未存储 item_ids 的旧版缓存"""
+    item_ids = model_assets.get('item_ids')
+    if item_ids is None:
+        item_map = model_assets['item_map']
+        item_ids = np.empty(len(item_map), dtype=object)
+        for imdb_id, i in item_map.items():
+            item_ids[i] = imdb_id
+    return item_ids
+
+
+def top_k_indices(scores, k, exclude_mask=None):
+    """在排除掩码之后取分数最高的 k 个下标（argpartition，O(n)），按分数从高到低返回"""
+    scores = np.asarray(scores, dtype=np.float64)
+    if exclude_mask is not None:
+        scores = np.where(exclude_mask, -np.inf, scores)
+        k = min(k, int((~exclude_mask).sum()))
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.intp)
+
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind='stable')]
+
+
+def _rank_by_user_vector(model_assets, user_vector, exclusion_parts, k):
+    """用户向量与全部电影向量做余弦相似度，用布尔掩码排除已交互电影后取 Top-K imdb_id"""
+    # 启用分片打分服务时，各分片在进程池中并行取局部 Top-K 后归并
+    scorer = get_sharded_scorer(model_assets.get('shard_version'))
+    if scorer is not None:
+        item_map = model_assets['item_map']
+        exclude_rows = [item_map[imdb_id] for ids in exclusion_parts.values() for imdb_id in ids if imdb_id in item_map]
+        return get_item_ids(model_assets)[scorer.top_k(user_vector, k, exclude_rows)].tolist()
+
+    item_vectors = model_assets['item_vectors']
+    scores = cosine_similarity(user_vector.reshape(1, -1), item_vectors)[0]
+    exclude_mask = build_exclusion_mask(exclusion_parts, model_assets['item_map'], len(scores))
+    top_indices = top_k_indices(scores, k, exclude_mask)
+    return get_item_ids(model_assets)[top_indices].tolist()
+
+
+def score_content_based(model_assets, exclusion_parts, k=50):
+    """
+    纯计算部分（不访问数据库）：用喜欢电影的平均向量与全部电影向量做余弦相似度，
+    排除已交互电影后返回 Top-K imdb_id。可以安全地放到线程池中执行
+    """
+    item_vectors = model_assets['item_vectors']
+    item_map = model_assets['item_map']
+
+    if not exclusion_parts['favorites']: raise ValueError("用户无喜好电影")
+    favorite_indices = [item_map[imdb_id] for imdb_id in exclusion_parts['favorites'] if imdb_id in item_map]
+    if not favorite_indices: raise ValueError("喜好电影均不在模型中")
+
+    # 用户的平均兴趣向量
+    user_vector = item_vectors[favorite_indices].mean(axis=0)
+    return _rank_by_user_vector(model_assets, user_vector, exclusion_parts, k)
+
+
+def get_recent_viewed_imdb_ids(user_id, n=SESSION_HISTORY_LENGTH):
+    """最近浏览的 n 部电影 imdb_id（由新到旧），走 (user, -viewed_on) 索引的一次查询"""
+    recent = (BrowsingHistory.objects.filter(user_id=user_id).order_by('-viewed_on')
+              .values_list('movie__imdb_id', flat=True)[:n])
+    return [imdb_id for imdb_id in recent if imdb_id]
+
+
+def score_session_based(model_assets, recent_imdb_ids, exclusion_parts, k=50, decay=SESSION_DECAY):
+    """
+    基于会话的推荐（不访问数据库）：最近浏览的电影按新近程度指数衰减加权（第 i 部权重 decay^i），
+    加权平均得到会话向量，再与全部电影向量做余弦相似度
+    """
+    item_vectors = model_assets['item_vectors']
+    item_map = model_assets['item_map']
+
+    positions = [pos for pos, imdb_id in enumerate(recent_imdb_ids) if imdb_id in item_map]
+    if not positions: raise ValueError("近期浏览的电影均不在模型中")
+    indices = [item_map[recent_imdb_ids[pos]] for pos in positions]
+
+    weights = decay ** np.asarray(positions, dtype=np.float64)
+    session_vector = weights @ item_vectors[indices] / weights.sum()
+    return _rank_by_user_vector(model_assets, session_vector, exclusion_parts, k)
+
+
+def _candidate_rows(entity_ids, indptr, items, wanted):
+    """从 CSR 结构中取出若干实体对应的候选排名数组"""
+    wanted = np.asarray(list(wanted), dtype=entity_ids.dtype)
+    if not len(wanted) or not len(entity_ids):
+        return []
+    pos = np.searchsorted(entity_ids, wanted)
+    pos = pos[pos < len(entity_ids)]
+    pos = pos[np.isin(entity_ids[pos], wanted)]
+    return [items[indptr[p]:indptr[p + 1]] for p in pos]
+
+
+def merge_candidate_lists(candidate_lists, genre_ids=(), person_ids=(), exclude=(), k=50):
+    """
+    多路归并若干预计算的候选列表，排除已交互电影后返回前 k 个 imdb_id
+    列表中存的是电影在全局真值排序中的名次，合并去重后依然按 truth_score 降序
+    不传类型和影人时，直接使用全局列表
+    """
+    item_ids = candidate_lists['item_ids']
+    exclude = set(exclude)
+    limit = k + len(exclude)
+
+    if not genre_ids and not person_ids:
+        top_ids = item_ids[:limit]
+    else:
+        rows = _candidate_rows(candidate_lists['genre_ids'], candidate_lists['genre_indptr'],
+                               candidate_lists['genre_items'], genre_ids)
+        rows += _candidate_rows(candidate_lists['person_ids'], candidate_lists['person_indptr'],
+                                candidate_lists['person_items'], person_ids)
+        if not rows:
+            return []
+        ranks = np.unique(np.concatenate(rows))
+        top_ids = item_ids[ranks[:limit]]
+
+    return [imdb_id for imdb_id in top_ids.tolist() if imdb_id not in exclude][:k]
+
+
+def _movie_card_cache_key(imdb_id):
+    return MOVIE_CARD_CACHE_KEY.format(imdb_id=imdb_id)
+
+
+def build_movie_cards(movies):
+    """把电影对象序列化为卡片数据 {imdb_id: card}"""
+    data = RecommendationMovieSerializer(movies, many=True).data
+    return {movie.imdb_id: dict(card) for movie, card in zip(movies, data) if movie.imdb_id}
+
+
+def cache_movie_cards(cards):
+    cache.set_many({_movie_card_cache_key(imdb_id): card for imdb_id, card in cards.items()},
+                   MOVIE_CARD_CACHE_TIMEOUT)
+
+
+def get_movie_cards(imdb_ids):
+    """
+    按给定顺序返回电影卡片数据（id, imdb_id, display_title, release_year, poster_url）
+    先一次 get_many 读取卡片缓存，只有未命中的电影才查库并回填缓存
+    """
+    keys = {_movie_card_cache_key(imdb_id): imdb_id for imdb_id in imdb_ids}
+    cards = {keys[key]: card for key, card in cache.get_many(list(keys)).items()}
+
+    missing = [imdb_id for imdb_id in imdb_ids if imdb_id not in cards]
+    if missing:
+        # 卡片的 display_title 目前直接取 original_title（见 MovieListSerializer），无需预取 titles，只查一次库
+        movies = list(Movie.objects.filter(imdb_id__in=missing)
+                      .only('id', 'imdb_id', 'original_title', 'release_year', 'poster_url'))
+        fresh_cards = build_movie_cards(movies)
+        cache_movie_cards(fresh_cards)
+        cards.update(fresh_cards)
+
+    return [cards[imdb_id] for imdb_id in imdb_ids if imdb_id in cards]
+
+
+def invalidate_movie_cards(*imdb_ids):
+    """电影信息或标题变化时，清除对应的卡片缓存"""
+    cache.delete_many([_movie_card_cache_key(imdb_id) for imdb_id in imdb_ids if imdb_id])
+
+
+def similar_movies_cache_key(movie_id):
+    return SIMILAR_MOVIES_CACHE_KEY.format(movie_id=movie_id)
+
+
+def get_similar_imdb_ids(movie_id, stored=None):
+    """
+    返回某部电影的相似电影 imdb_id 列表
+    调用方已加载电影对象时传入 stored（即 movie.similar_imdb_ids），无需再读缓存或查库
+    """
+    if stored is not None:
+        return stored
+
+    key = similar_movies_cache_key(movie_id)
+    imdb_ids = cache.get(key)
+    if imdb_ids is None:
+        imdb_ids = Movie.objects.filter(pk=movie_id).values_list('similar_imdb_ids', flat=True).first() or []
+        cache.set(key, imdb_ids, SIMILAR_MOVIES_CACHE_TIMEOUT)
+    return imdb_ids
+
+
+def get_similar_movie_cards(movie_id, k=12, stored=None):
+    """相似电影的卡片数据：一次卡片缓存 get_many，未命中时一次批量查询"""
+    return get_movie_cards(get_similar_imdb_ids(movie_id, stored)[:k])
+
+
+def _feed_cache_key(user_key):
+    return FEED_CACHE_KEY.format(user_key=user_key)
+
+
+def save_feed(user_key, feed):
+    """
+    保存一次完整排序（{'source': ..., 'recommendations': [...]}），返回游标 token
+    同一用户的全部游标存在一个缓存条目中，超过 FEED_MAX_CURSORS 份时淘汰最早的
+    """
+    key = _feed_cache_key(user_key)
+    now = time.time()
+    feeds = {token: f for token, f in (cache.get(key) or {}).items() if f['expires'] > now}
+    token = secrets.token_urlsafe(8)
+    feeds[token] = dict(feed, expires=now + FEED_CURSOR_TIMEOUT)
+    while len(feeds) > FEED_MAX_CURSORS:
+        feeds.pop(next(iter(feeds)))
+    cache.set(key, feeds, FEED_CURSOR_TIMEOUT)
+    return token
+
+
+def load_feed(user_key, token):
+    """取回游标对应的排序；游标不存在或已过期时返回 None"""
+    feed = (cache.get(_feed_cache_key(user_key)) or {}).get(token)
+    if feed is None or feed['expires'] <= time.time():
+        return None
+    return feed
+
+
+def invalidate_user_feeds(*user_ids):
+    """用户的“喜欢”发生变化时，丢弃其全部推荐流游标"""
+    cache.delete_many([_feed_cache_key(user_id) for user_id in user_ids])
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Movie, MovieTitle, Genre, Person, Source, Review, UserReview
+from .models import Movie, MovieTitle, Genre, Person, Source, Review, UserReview, MovieStats
 from django.contrib.auth.models import User
 
 
@@ -49,6 +49,14 @@ class ReviewSerializer(serializers.ModelSerializer):
         fields = ['source', 'author', 'content', 'score', 'score_max']
 
 
+class MovieStatsSerializer(serializers.ModelSerializer):
+    average_rating = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = MovieStats
+        fields = ['review_count', 'average_rating', 'favorite_count', 'watchlist_count', 'view_count']
+
+
 # ------ 核心的、用于API端点的Serializer ------
 
 class MovieListSerializer(serializers.ModelSerializer):
@@ -98,13 +106,15 @@ class MovieDetailSerializer(MovieListSerializer):
     titles = MovieTitleSerializer(many=True, read_only=True)
     # Django默认的反向关系名是 'review_set'
     reviews = ReviewSerializer(many=True, read_only=True, source='review_set')
+    # 反范式统计表中的一行，无需聚合评论与列表
+    stats = MovieStatsSerializer(read_only=True)
 
     class Meta(MovieListSerializer.Meta):
         # 继承父类的字段，并添加详情页专属字段
         fields = MovieListSerializer.Meta.fields + [
             'titles', 'genres', 'language', 'length',
             'directors', 'actors', 'scriptwriters',
-            'summary', 'reviews'
+            'summary', 'reviews', 'stats'
         ]
 
 
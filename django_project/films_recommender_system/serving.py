@@ -0,0 +1,50 @@
+# films_recommender_system/serving.py
+
+import time
+from django.core.cache import cache
+
+# 实时推荐可能返回的各层结果（即响应中的 source 字段），按代价从高到低排列
+SERVING_TIERS = (
+    'candidate_pipeline', 'content_based_inference', 'session_based',
+    'precomputed', 'cold_start_profile', 'cold_start_trending', 'cold_start_global',
+)
+TIER_COUNTER_KEY = 'rec_tier_served_{tier}'
+
+
+class Deadline:
+    """请求级延迟预算：创建时开始计时，服务流程在各阶段之间调用 expired() 检查；budget_ms 为 None 时不限时"""
+
+    def __init__(self, budget_ms):
+        self.budget_ms = budget_ms
+        self.start = time.perf_counter()
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.start) * 1000
+
+    def expired(self):
+        return self.budget_ms is not None and self.elapsed_ms() > self.budget_ms
+
+
+def _tier_counter_key(source, degraded=False):
+    return TIER_COUNTER_KEY.format(tier=f"{source}_degraded" if degraded else source)
+
+
+def record_tier_served(source, degraded=False):
+    """对应层级的计数加一；因超时降级返回的结果单独计数"""
+    key = _tier_counter_key(source, degraded)
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:  # 条目在 add 与 incr 之间被淘汰
+            cache.set(key, 1, timeout=None)
+
+
+def get_tier_counts():
+    """返回 {层级: 次数}，降级计数的键带 _degraded 后缀"""
+    keys = {_tier_counter_key(tier, degraded): (f"{tier}_degraded" if degraded else tier)
+            for tier in SERVING_TIERS for degraded in (False, True)}
+    return {keys[key]: count for key, count in cache.get_many(list(keys)).items()}
+
+
+def reset_tier_counts():
+    cache.delete_many([_tier_counter_key(tier, degraded) for tier in SERVING_TIERS for degraded in (False, True)])
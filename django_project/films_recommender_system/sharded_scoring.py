@@ -0,0 +1,167 @@
+# films_recommender_system/sharded_scoring.py
+
+import atexit
+import heapq
+import json
+import multiprocessing
+import threading
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from multiprocessing import shared_memory
+from pathlib import Path
+import numpy as np
+from django.conf import settings
+from threadpoolctl import threadpool_limits
+
+SHARD_MANIFEST = 'manifest.json'
+
+
+def write_item_shards(item_vectors, shard_dir, n_shards):
+    """
+    把行归一化后的电影向量（float32）按行切成 n_shards 个连续分片写入 shard_dir
+    manifest 记录每个分片的全局行号范围以及本次写入的版本号，返回 manifest
+    """
+    vectors = np.asarray(item_vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    vectors = vectors / norms
+
+    shard_dir = Path(shard_dir)
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    for old in shard_dir.glob('shard_*.npy'):
+        old.unlink()
+
+    n_items = vectors.shape[0]
+    bounds = np.linspace(0, n_items, max(n_shards, 1) + 1).astype(int)
+    shards = []
+    for i, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:])):
+        name = f'shard_{i:03d}.npy'
+        np.save(shard_dir / name, vectors[lo:hi])
+        shards.append({'file': name, 'start': int(lo), 'stop': int(hi)})
+
+    manifest = {'version': uuid.uuid4().hex, 'n_items': n_items, 'dim': int(vectors.shape[1]), 'shards': shards}
+    (shard_dir / SHARD_MANIFEST).write_text(json.dumps(manifest))
+    return manifest
+
+
+def read_shard_manifest(shard_dir):
+    path = Path(shard_dir) / SHARD_MANIFEST
+    return json.loads(path.read_text()) if path.exists() else None
+
+
+# --- 进程池 worker 内的状态：分片在共享内存中的只读视图 ---
+_WORKER_SHARDS = []
+
+
+def _attach_shards(specs):
+    """进程池 initializer：按名称挂载共享内存中的分片（不复制数据），并把 BLAS 限制为单线程，进程数即并行度"""
+    threadpool_limits(1)
+    for shm_name, shape, start in specs:
+        shm = shared_memory.SharedMemory(name=shm_name)
+        _WORKER_SHARDS.append((shm, np.ndarray(shape, dtype=np.float32, buffer=shm.buf), start))
+
+
+def _shard_top_k(shard_idx, queries, k, exclude_rows=None):
+    """
+    在单个分片内为一批查询向量取局部 Top-K
+    返回按分数降序排列的 (scores, 全局行号)，形状均为 (n_queries, k')；被排除的电影分数为 -inf
+    """
+    _, vectors, start = _WORKER_SHARDS[shard_idx]
+    scores = queries @ vectors.T
+    if exclude_rows is not None:
+        for q, rows in enumerate(exclude_rows):
+            local = np.asarray(rows, dtype=np.int64) - start
+            scores[q, local[(local >= 0) & (local < vectors.shape[0])]] = -np.inf
+
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        empty = np.empty((len(queries), 0))
+        return empty, empty.astype(np.int64)
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    return np.take_along_axis(top_scores, order, axis=1), np.take_along_axis(top, order, axis=1) + start
+
+
+class ShardedScorer:
+    """
+    分片打分服务：主进程把各分片载入共享内存，常驻进程池中的 worker 直接读取；
+    一次查询分发到所有分片各取局部 Top-K，再在主进程中归并各分片已排序的结果
+    """
+
+    def __init__(self, shard_dir, workers):
+        shard_dir = Path(shard_dir)
+        manifest = read_shard_manifest(shard_dir)
+        if manifest is None:
+            raise FileNotFoundError(f"分片目录 {shard_dir} 中没有 {SHARD_MANIFEST}")
+        self.version = manifest['version']
+        self.n_items = manifest['n_items']
+        self.dim = manifest['dim']
+
+        self._shms = []
+        specs = []
+        for shard in manifest['shards']:
+            data = np.load(shard_dir / shard['file'], mmap_mode='r')
+            shm = shared_memory.SharedMemory(create=True, size=max(data.nbytes, 1))
+            np.ndarray(data.shape, dtype=np.float32, buffer=shm.buf)[:] = data
+            self._shms.append(shm)
+            specs.append((shm.name, data.shape, shard['start']))
+        self.n_shards = len(specs)
+
+        # 使用 spawn 启动 worker，避免在多线程的 Web 进程中 fork
+        self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=_attach_shards, initargs=(specs,))
+
+    def top_k_batch(self, queries, k, exclude_rows=None):
+        """为一批查询向量（n_queries, dim）返回各自的 Top-K 全局行号列表；exclude_rows 为每个查询需排除的行号"""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        queries = queries / norms
+
+        futures = [self.pool.submit(_shard_top_k, i, queries, k, exclude_rows) for i in range(self.n_shards)]
+        parts = [future.result() for future in futures]
+
+        results = []
+        for q in range(len(queries)):
+            streams = [zip(scores[q].tolist(), rows[q].tolist()) for scores, rows in parts]
+            merged = heapq.merge(*streams, key=lambda item: -item[0])
+            results.append([row for score, row in islice((item for item in merged if item[0] > -np.inf), k)])
+        return results
+
+    def top_k(self, query, k, exclude_rows=None):
+        return self.top_k_batch(query, k, None if exclude_rows is None else [exclude_rows])[0]
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+        for shm in self._shms:
+            shm.close()
+            shm.unlink()
+        self._shms = []
+
+
+_scorer = None
+_scorer_lock = threading.Lock()
+
+
+def get_sharded_scorer(version):
+    """
+    返回本进程共享的分片打分服务（首次调用时启动进程池）
+    仅当 settings.RECOMMENDATION_SHARD_WORKERS > 0 且磁盘上分片的版本与模型资产一致时可用，否则返回 None
+    """
+    global _scorer
+    if not settings.RECOMMENDATION_SHARD_WORKERS or version is None:
+        return None
+    with _scorer_lock:
+        if _scorer is not None and _scorer.version == version:
+            return _scorer
+        manifest = read_shard_manifest(settings.RECOMMENDATION_SHARD_DIR)
+        if manifest is None or manifest['version'] != version:
+            return None
+        if _scorer is not None:
+            _scorer.close()
+        else:
+            atexit.register(lambda: _scorer and _scorer.close())
+        _scorer = ShardedScorer(settings.RECOMMENDATION_SHARD_DIR, settings.RECOMMENDATION_SHARD_WORKERS)
+        return _scorer
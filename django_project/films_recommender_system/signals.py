@@ -0,0 +1,206 @@
+# films_recommender_system/signals.py
+
+from django.db.models.signals import m2m_changed, pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Movie, MovieTitle, Recommendation, Review, UserProfile, UserReview, BrowsingHistory
+from .recommendation_utils import (
+    invalidate_user_exclusions, invalidate_user_preferences, invalidate_movie_cards, invalidate_user_feeds
+)
+from .trending import record_movie_activity
+from .cooccurrence import track_user_items_change
+from .user_knn import invalidate_user_neighbors
+from .truth_scores import mark_truth_scores_dirty
+from .movie_stats import increment_movie_stats, record_external_score, record_list_change, record_user_rating
+
+
+def _profile_user_ids(instance, reverse, pk_set):
+    """取出 UserProfile 多对多变化所涉及的用户 ID"""
+    if not reverse:
+        return [instance.user_id]
+    if not pk_set:
+        return []
+    return list(UserProfile.objects.filter(pk__in=pk_set).values_list('user_id', flat=True))
+
+
+# 评分所依赖的字段；save(update_fields=...) 只写其他列（如点赞数）时，评分统计、真值队列与推荐缓存都不受影响
+RATING_FIELDS = {
+    UserReview: {'movie', 'movie_id', 'rating'},
+    Review: {'movie', 'movie_id', 'source', 'source_id', 'score'},
+}
+
+
+def _rating_fields_saved(sender, update_fields=None, **kwargs):
+    """本次保存 / 删除是否可能改变评分；update_fields 为 None 表示整行保存"""
+    return update_fields is None or not RATING_FIELDS[sender].isdisjoint(update_fields)
+
+
+# --- 用户交互变化时，清除推荐排除集合缓存 ---
+
+def _favorite_user_ids(instance, action, reverse, pk_set):
+    """取出“喜欢”多对多变化所涉及的用户 ID（Recommendation 的主键就是 user_id）"""
+    if not reverse:
+        return [instance.pk]
+    if action == 'pre_clear':
+        return list(Recommendation.favorite_movies.through.objects.filter(movie_id=instance.pk)
+                    .values_list('recommendation_id', flat=True))
+    return list(pk_set or [])
+
+
+def _watchlist_user_ids(instance, action, reverse, pk_set):
+    if reverse and action == 'pre_clear':
+        return list(UserProfile.watchlist.through.objects.filter(movie_id=instance.pk)
+                    .values_list('userprofile__user_id', flat=True))
+    return _profile_user_ids(instance, reverse, pk_set)
+
+
+@receiver(m2m_changed, sender=Recommendation.favorite_movies.through)
+def favorites_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # 共现矩阵的增量更新需要变化前后的列表，pre_* 阶段也要处理
+    record_list_change(sender, 'recommendation_id', 'favorite_count', instance, action, reverse, pk_set)
+    if action.startswith('pre_'):
+        track_user_items_change(instance, action, _favorite_user_ids(instance, action, reverse, pk_set))
+        return
+    track_user_items_change(instance, action, None)
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    # Recommendation 的主键就是 user_id
+    if reverse:
+        if pk_set:
+            invalidate_user_exclusions(*pk_set)
+            invalidate_user_feeds(*pk_set)
+    else:
+        invalidate_user_exclusions(instance.pk)
+        invalidate_user_feeds(instance.pk)
+
+    # 新增的“喜欢”计入电影热度
+    if action == 'post_add' and pk_set:
+        if reverse:
+            record_movie_activity([instance.pk], 'favorites', count=len(pk_set))
+        else:
+            record_movie_activity(pk_set, 'favorites')
+
+
+@receiver(m2m_changed, sender=UserProfile.watchlist.through)
+def watchlist_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    record_list_change(sender, 'userprofile_id', 'watchlist_count', instance, action, reverse, pk_set)
+    if action.startswith('pre_'):
+        track_user_items_change(instance, action, _watchlist_user_ids(instance, action, reverse, pk_set))
+        return
+    track_user_items_change(instance, action, None)
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    invalidate_user_exclusions(*_profile_user_ids(instance, reverse, pk_set))
+
+
+@receiver(m2m_changed, sender=UserProfile.favorite_genres.through)
+@receiver(m2m_changed, sender=UserProfile.favorite_people.through)
+def preferences_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    invalidate_user_preferences(*_profile_user_ids(instance, reverse, pk_set))
+
+
+@receiver(post_save, sender=UserReview)
+@receiver(post_delete, sender=UserReview)
+def user_review_changed(sender, instance, **kwargs):
+    if not _rating_fields_saved(sender, **kwargs):
+        return
+    invalidate_user_exclusions(instance.user_id)
+    # 评分变化后，下次推荐时在线折叠该用户的最新评分
+    invalidate_user_neighbors(instance.user_id)
+    if kwargs.get('created'):
+        record_movie_activity([instance.movie_id], 'reviews')
+
+
+# --- 评分变化时，登记电影等待增量重算真值分数 ---
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+@receiver(post_save, sender=UserReview)
+@receiver(post_delete, sender=UserReview)
+def movie_ratings_changed(sender, instance, **kwargs):
+    if not _rating_fields_saved(sender, **kwargs):
+        return
+    # 评论被改到另一部电影时，原电影的分数也要重算；
+    # _stats_previous 由下方的 pre_save 记下，本处理器先于 *_saved_stats 注册，读取时尚未被清空
+    previous = getattr(instance, '_stats_previous', None)
+    movie_ids = [instance.movie_id, previous[0]] if previous else [instance.movie_id]
+    mark_truth_scores_dirty(movie_ids)
+
+
+# --- 评分写入时，在同一事务中维护 MovieStats / MovieSourceStats ---
+
+@receiver(pre_save, sender=UserReview)
+def user_review_saving(sender, instance, **kwargs):
+    if not _rating_fields_saved(sender, **kwargs):
+        return
+    # 修改已有评分时记下旧值，保存后先扣除旧值再计入新值
+    if not instance._state.adding and instance.pk:
+        instance._stats_previous = (UserReview.objects.filter(pk=instance.pk)
+                                    .values_list('movie_id', 'rating').first())
+
+
+@receiver(post_save, sender=UserReview)
+def user_review_saved_stats(sender, instance, **kwargs):
+    if not _rating_fields_saved(sender, **kwargs):
+        return
+    previous = getattr(instance, '_stats_previous', None)
+    if previous:
+        record_user_rating(*previous, sign=-1)
+    record_user_rating(instance.movie_id, instance.rating)
+    instance._stats_previous = None
+
+
+@receiver(post_delete, sender=UserReview)
+def user_review_deleted_stats(sender, instance, **kwargs):
+    record_user_rating(instance.movie_id, instance.rating, sign=-1)
+
+
+@receiver(pre_save, sender=Review)
+def review_saving(sender, instance, **kwargs):
+    if not _rating_fields_saved(sender, **kwargs):
+        return
+    if not instance._state.adding and instance.pk:
+        instance._stats_previous = (Review.objects.filter(pk=instance.pk)
+                                    .values_list('movie_id', 'source_id', 'score').first())
+
+
+@receiver(post_save, sender=Review)
+def review_saved_stats(sender, instance, **kwargs):
+    if not _rating_fields_saved(sender, **kwargs):
+        return
+    previous = getattr(instance, '_stats_previous', None)
+    if previous:
+        record_external_score(*previous, sign=-1)
+    record_external_score(instance.movie_id, instance.source_id, instance.score)
+    instance._stats_previous = None
+
+
+@receiver(post_delete, sender=Review)
+def review_deleted_stats(sender, instance, **kwargs):
+    record_external_score(instance.movie_id, instance.source_id, instance.score, sign=-1)
+
+
+@receiver(post_save, sender=BrowsingHistory)
+def browsing_history_saved(sender, instance, created, **kwargs):
+    # 每次浏览都计入电影热度与浏览次数
+    record_movie_activity([instance.movie_id], 'views')
+    increment_movie_stats([instance.movie_id], view_count=1)
+    # 重复浏览只会刷新 viewed_on，已浏览集合不变
+    if created:
+        invalidate_user_exclusions(instance.user_id)
+
+
+# --- 电影信息变化时，清除推荐卡片缓存 ---
+
+@receiver(post_save, sender=Movie)
+@receiver(post_delete, sender=Movie)
+def movie_changed(sender, instance, **kwargs):
+    invalidate_movie_cards(instance.imdb_id)
+
+
+@receiver(post_save, sender=MovieTitle)
+@receiver(post_delete, sender=MovieTitle)
+def movie_title_changed(sender, instance, **kwargs):
+    invalidate_movie_cards(*Movie.objects.filter(pk=instance.movie_id).values_list('imdb_id', flat=True))
@@ -1,3 +1,589 @@
-from django.test import TestCase
+# films_recommender_system/tests.py
 
-# Create your tests here.
+import random
+import tempfile
+from contextlib import redirect_stdout
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from . import evaluation
+from .cooccurrence import apply_cooccurrence_delta, get_co_interest
+from .content_model import build_item_vectors
+from .models import (
+    BrowsingHistory, DirtyMovie, Movie, MovieCooccurrence, MovieSourceStats, MovieStats, MovieTitle, Recommendation,
+    Review, Source, UserProfile, UserReview
+)
+from .movie_stats import rebuild_movie_stats
+from .recommendation_utils import build_exclusion_mask, get_user_exclusion_parts, top_k_indices
+from .truth_scores import compute_truth_scores, update_dirty_truth_scores
+
+# 测试使用进程内缓存，不读写 settings 中的文件缓存目录
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def make_movies(n):
+    """创建 n 部电影，truth_score 各不相同（第 i 部为 i），按创建顺序返回"""
+    return [Movie.objects.create(imdb_id=f'tt{i:07d}', original_title=f'Movie {i}', release_year=2000,
+                                 truth_score=float(i)) for i in range(n)]
+
+
+def make_user(username):
+    """创建用户及其“喜欢”列表与个人资料"""
+    user = User.objects.create_user(username, password='pass')
+    Recommendation.objects.create(user=user)
+    UserProfile.objects.create(user=user)
+    return user
+
+
+def make_sources():
+    return [Source.objects.create(name='豆瓣', base_url='https://movie.douban.com', credibility_level=8, score_max=10),
+            Source.objects.create(name='IMDb', base_url='https://www.imdb.com', credibility_level=6, score_max=5)]
+
+
+def random_review_changes(rng, movies, users, sources, steps):
+    """
+    对外部评论与本站评分做随机的增、删、改，其中包括把评论改到另一部电影
+    分数都是 0.5 的倍数，各种求和顺序得到的浮点结果完全相同
+    """
+    scores = [None, 1.0, 2.5, 4.0, 5.0, 7.5, 9.0]
+    for _ in range(steps):
+        model = rng.choice([Review, UserReview])
+        existing = list(model.objects.order_by('pk'))
+        op = rng.randrange(4) if existing else 0
+        if op == 0 and model is Review:
+            Review.objects.create(movie=rng.choice(movies), source=rng.choice(sources), content='评论',
+                                  score=rng.choice(scores))
+        elif op == 0:
+            UserReview.objects.create(user=rng.choice(users), movie=rng.choice(movies),
+                                      rating=rng.choice(scores[1:]), review='评论')
+        elif op == 1:
+            review = rng.choice(existing)
+            if model is Review:
+                review.score = rng.choice(scores)
+            else:
+                review.rating = rng.choice(scores[1:])
+            review.save()
+        elif op == 2:
+            review = rng.choice(existing)
+            review.movie = rng.choice(movies)
+            review.save()
+        else:
+            rng.choice(existing).delete()
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+
+class ExclusionMaskTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.movies = make_movies(6)
+        self.user = make_user('alice')
+        self.item_map = {movie.imdb_id: i for i, movie in enumerate(self.movies)}
+
+    def test_mask_covers_every_source(self):
+        m = self.movies
+        self.user.recommendation.favorite_movies.add(m[0])
+        self.user.profile.watchlist.add(m[1])
+        UserReview.objects.create(user=self.user, movie=m[2], rating=8.0, review='不错')
+        BrowsingHistory.objects.create(user=self.user, movie=m[3])
+
+        parts = get_user_exclusion_parts(self.user.id)
+        self.assertEqual(parts, {'favorites': [m[0].imdb_id], 'reviews': [m[2].imdb_id],
+                                 'watchlist': [m[1].imdb_id], 'history': [m[3].imdb_id]})
+        mask = build_exclusion_mask(parts, self.item_map, len(m))
+        self.assertEqual(mask.tolist(), [True, True, True, True, False, False])
+
+    def test_movies_outside_the_model_are_ignored(self):
+        mask = build_exclusion_mask({'favorites': ['tt9999999', self.movies[5].imdb_id]}, self.item_map, 6)
+        self.assertEqual(np.flatnonzero(mask).tolist(), [5])
+        self.assertFalse(build_exclusion_mask({'favorites': []}, self.item_map, 6).any())
+
+    def test_cached_parts_are_invalidated_on_change(self):
+        self.assertEqual(get_user_exclusion_parts(self.user.id)['favorites'], [])
+        self.user.recommendation.favorite_movies.add(self.movies[4])
+        self.assertEqual(get_user_exclusion_parts(self.user.id)['favorites'], [self.movies[4].imdb_id])
+        BrowsingHistory.objects.create(user=self.user, movie=self.movies[1])
+        self.assertEqual(get_user_exclusion_parts(self.user.id)['history'], [self.movies[1].imdb_id])
+
+    def test_top_k_skips_excluded_items(self):
+        scores = np.array([6.0, 5.0, 4.0, 3.0, 2.0, 1.0])
+        mask = np.array([True, True, False, False, False, False])
+        self.assertEqual(top_k_indices(scores, 3, mask).tolist(), [2, 3, 4])
+        # k 大于未排除的电影数时，只返回未排除的电影
+        self.assertEqual(top_k_indices(scores, 10, mask).tolist(), [2, 3, 4, 5])
+        self.assertEqual(top_k_indices(scores, 2).tolist(), [0, 1])
+
+
+class ContentModelTests(SimpleTestCase):
+    def test_names_with_punctuation_stay_one_feature(self):
+        documents = ['genre_Drama actor_Jean-Pierre·Léaud', 'genre_Comedy actor_J.K.Simmons']
+        vectors = build_item_vectors(documents, feature_weights={'genre': 1.0, 'director': 1.0, 'actor': 0.0})
+        # 演员权重为 0 时，人名中的 "-"、"·"、"." 不应让其片段漏到权重为 1 的列里
+        self.assertEqual(vectors.shape[1], 4)
+        self.assertEqual(np.count_nonzero(vectors, axis=1).tolist(), [1, 1])
+
+
+class RecommendationFeedTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        movies = make_movies(25)
+        # 未注册用户走全局回退：按真值分数降序
+        self.expected = [movie.imdb_id for movie in reversed(movies)]
+        self.url = reverse('recommendation-feed', args=['visitor'])
+
+    def test_cursor_walks_the_whole_feed_once(self):
+        pages, cursor = [], None
+        while True:
+            params = {'page_size': 10, **({'cursor': cursor} if cursor else {})}
+            data = self.client.get(self.url, params).json()
+            pages.append(data['recommendations'])
+            cursor = data['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual([len(page) for page in pages], [10, 10, 5])
+        self.assertEqual(sum(pages, []), self.expected)
+
+    def test_pages_come_from_the_saved_ranking(self):
+        first = self.client.get(self.url, {'page_size': 10}).json()
+        # 排序在翻页期间发生变化，游标仍在第一次请求时的排序上继续
+        Movie.objects.update(truth_score=0.0)
+        second = self.client.get(self.url, {'page_size': 10, 'cursor': first['next_cursor']}).json()
+        self.assertEqual(first['recommendations'] + second['recommendations'], self.expected[:20])
+
+    def test_unknown_cursor_restarts_from_the_top(self):
+        data = self.client.get(self.url, {'page_size': 5, 'cursor': 'expired:10'}).json()
+        self.assertTrue(data['cursor_expired'])
+        self.assertEqual(data['recommendations'], self.expected[:5])
+        self.assertTrue(data['next_cursor'].endswith(':5'))
+        data = self.client.get(self.url, {'page_size': 5, 'cursor': data['next_cursor']}).json()
+        self.assertFalse(data['cursor_expired'])
+        self.assertEqual(data['recommendations'], self.expected[5:10])
+
+    def test_bad_parameters_return_400(self):
+        for params in ({'cursor': 'no-offset'}, {'cursor': 'token:abc'}, {'page_size': 'ten'}):
+            self.assertEqual(self.client.get(self.url, params).status_code, 400, params)
+
+
+class SimilarMoviesViewTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        movies = make_movies(6)
+        self.similar = [movie.imdb_id for movie in movies[1:]]
+        Movie.objects.filter(pk=movies[0].pk).update(similar_imdb_ids=self.similar)
+        self.url = reverse('similar-movies', args=[movies[0].pk])
+
+    def _similar(self, k):
+        response = self.client.get(self.url, {'k': k})
+        return [card['imdb_id'] for card in response.json()['similar']]
+
+    def test_k_is_clamped(self):
+        self.assertEqual(self._similar(2), self.similar[:2])
+        self.assertEqual(self._similar(-3), self.similar[:1])
+        self.assertEqual(self._similar(0), self.similar[:1])
+        self.assertEqual(self._similar(500), self.similar)
+
+    def test_non_integer_k_returns_400(self):
+        self.assertEqual(self.client.get(self.url, {'k': 'many'}).status_code, 400)
+
+    def test_detail_page_shows_localized_titles(self):
+        movie = Movie.objects.get(imdb_id=self.similar[0])
+        MovieTitle.objects.create(movie=movie, title_text='电影一', language='zh-CN', is_primary=True)
+        source = Movie.objects.get(imdb_id='tt0000000')
+        response = self.client.get(reverse('movie_frontend:movie_detail', args=[source.pk]))
+        titles = [card['display_title'] for card in response.context['similar_movies']]
+        self.assertEqual(titles, ['电影一', 'Movie 2', 'Movie 3', 'Movie 4', 'Movie 5'])
+
+
+class CooccurrenceDeltaTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.movies = make_movies(8)
+        self.users = [make_user(f'user{i}') for i in range(5)]
+
+    def _matrix(self):
+        return set(MovieCooccurrence.objects.values_list('movie_id', 'other_id', 'count'))
+
+    def _assert_matches_rebuild(self):
+        incremental = self._matrix()
+        call_command('build_cooccurrence', stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(incremental, self._matrix())
+
+    def test_random_list_changes_match_full_rebuild(self):
+        rng = random.Random(7)
+        for _ in range(120):
+            user, movie = rng.choice(self.users), rng.choice(self.movies)
+            movies = rng.sample(self.movies, rng.randint(1, 3))
+            favorites, watchlist = user.recommendation.favorite_movies, user.profile.watchlist
+            op = rng.randrange(8)
+            if op == 0:
+                favorites.add(*movies)
+            elif op == 1:
+                favorites.remove(*movies)
+            elif op == 2:
+                watchlist.add(*movies)
+            elif op == 3:
+                watchlist.remove(*movies)
+            elif op == 4:
+                # 从电影一侧修改（reverse=True）
+                movie.favorited_by.add(*(u.recommendation for u in rng.sample(self.users, 2)))
+            elif op == 5:
+                movie.watchlisted_by.remove(*(u.profile for u in rng.sample(self.users, 2)))
+            elif op == 6:
+                (favorites if rng.random() < 0.5 else watchlist).clear()
+            elif rng.random() < 0.3:
+                movie.favorited_by.clear()
+        self.assertTrue(self._matrix())
+        self._assert_matches_rebuild()
+
+    def test_two_users_creating_the_same_new_pair(self):
+        a, b = self.movies[:2]
+        u1, u2 = self.users[:2]
+        apply_cooccurrence_delta({u1.id: set(), u2.id: set()}, {u1.id: {a.pk, b.pk}, u2.id: {a.pk, b.pk}})
+        self.assertEqual(self._matrix(), {(a.pk, b.pk, 2), (b.pk, a.pk, 2)})
+
+        # 另一个用户的事务在本次写入之前抢先提交了同一对新电影
+        c, d = self.movies[2:4]
+        bulk_create = MovieCooccurrence.objects.bulk_create
+
+        def racing_bulk_create(objs, *args, **kwargs):
+            MovieCooccurrence.objects.create(movie=c, other=d, count=1)
+            MovieCooccurrence.objects.create(movie=d, other=c, count=1)
+            return bulk_create(objs, *args, **kwargs)
+
+        with mock.patch.object(MovieCooccurrence.objects, 'bulk_create', side_effect=racing_bulk_create):
+            apply_cooccurrence_delta({u1.id: set()}, {u1.id: {c.pk, d.pk}})
+        self.assertEqual(MovieCooccurrence.objects.get(movie=c, other=d).count, 2)
+        self.assertEqual(MovieCooccurrence.objects.get(movie=d, other=c).count, 2)
+
+    def test_pair_counts_follow_both_lists(self):
+        a, b, c = self.movies[:3]
+        u1, u2 = self.users[:2]
+        u1.recommendation.favorite_movies.add(a, b)
+        u2.profile.watchlist.add(a, b, c)
+        self.assertEqual(get_co_interest([a.imdb_id])[a.imdb_id], ([b.imdb_id, c.imdb_id], [2, 1]))
+        # 同一部电影同时在“喜欢”与“想看”中只计一次
+        u1.profile.watchlist.add(a)
+        u2.profile.watchlist.remove(b)
+        self.assertEqual(get_co_interest([a.imdb_id])[a.imdb_id], ([b.imdb_id, c.imdb_id], [1, 1]))
+        self._assert_matches_rebuild()
+
+
+class TruthScoreQueueTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.movies = make_movies(20)
+        Movie.objects.update(truth_score=0.0)
+        self.users = [make_user(f'user{i}') for i in range(3)]
+        self.sources = make_sources()
+
+    def _full_recompute(self):
+        rebuild_movie_stats()
+        ids, scores = compute_truth_scores()
+        return dict(zip(ids.tolist(), scores.tolist()))
+
+    def test_dirty_queue_matches_full_recompute(self):
+        rng = random.Random(11)
+        for _ in range(8):
+            random_review_changes(rng, self.movies, self.users, self.sources, 15)
+            update_dirty_truth_scores()
+            self.assertFalse(DirtyMovie.objects.exists())
+            incremental = dict(Movie.objects.values_list('id', 'truth_score'))
+            self.assertEqual(incremental, self._full_recompute())
+
+    def test_moving_a_review_rescores_both_movies(self):
+        a, b = self.movies[:2]
+        review = UserReview.objects.create(user=self.users[0], movie=a, rating=8.0, review='评论')
+        update_dirty_truth_scores()
+        self.assertEqual(Movie.objects.get(pk=a.pk).truth_score, 8.0)
+
+        review.movie = b
+        review.save()
+        self.assertEqual(set(DirtyMovie.objects.values_list('movie_id', flat=True)), {a.pk, b.pk})
+        processed, changed = update_dirty_truth_scores()
+        self.assertEqual((processed, changed), (2, {a.pk: 0.0, b.pk: 8.0}))
+
+
+class MovieStatsTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.movies = make_movies(10)
+        self.users = [make_user(f'user{i}') for i in range(3)]
+        self.sources = make_sources()
+
+    def _stats(self):
+        """两张统计表的内容；全为 0 的行与不存在的行等价"""
+        fields = ('review_count', 'rating_sum', 'rating_sum_sq', 'favorite_count', 'watchlist_count', 'view_count')
+        movie_stats = {row[0]: row[1:] for row in MovieStats.objects.values_list('movie_id', *fields) if any(row[1:])}
+        source_stats = {(movie_id, source_id): (n, score_sum) for movie_id, source_id, n, score_sum in
+                        MovieSourceStats.objects.values_list('movie_id', 'source_id', 'review_count', 'score_sum')
+                        if n or score_sum}
+        return movie_stats, source_stats
+
+    def test_signal_counters_match_rebuild(self):
+        rng = random.Random(5)
+        random_review_changes(rng, self.movies, self.users, self.sources, 120)
+        for _ in range(40):
+            user, movies = rng.choice(self.users), rng.sample(self.movies, 2)
+            op = rng.randrange(5)
+            if op == 0:
+                user.recommendation.favorite_movies.add(*movies)
+            elif op == 1:
+                user.recommendation.favorite_movies.remove(*movies)
+            elif op == 2:
+                user.profile.watchlist.add(*movies)
+            elif op == 3:
+                movies[0].watchlisted_by.clear()
+            else:
+                BrowsingHistory.objects.update_or_create(user=user, movie=movies[0])
+
+        incremental = self._stats()
+        self.assertTrue(incremental[0] and incremental[1])
+        rebuild_movie_stats()
+        self.assertEqual(incremental, self._stats())
+
+    def test_moving_a_review_moves_its_counts(self):
+        a, b = self.movies[:2]
+        review = Review.objects.create(movie=a, source=self.sources[0], content='评论', score=7.5)
+        rating = UserReview.objects.create(user=self.users[0], movie=a, rating=9.0, review='评论')
+        review.movie = rating.movie = b
+        review.save()
+        rating.save()
+        self.assertEqual(MovieStats.objects.get(movie=a).review_count, 0)
+        self.assertEqual(MovieStats.objects.get(movie=b).rating_sum, 9.0)
+        self.assertEqual(MovieSourceStats.objects.get(movie=a).review_count, 0)
+        self.assertEqual(MovieSourceStats.objects.get(movie=b).score_sum, 7.5)
+
+    def test_liking_a_review_leaves_ratings_alone(self):
+        review = UserReview.objects.create(user=self.users[0], movie=self.movies[0], rating=9.0, review='评论')
+        DirtyMovie.objects.all().delete()
+        stats = self._stats()
+        self.client.login(username='user1', password='pass')
+        with mock.patch('films_recommender_system.signals.invalidate_user_neighbors') as invalidate:
+            response = self.client.post(reverse('movie_frontend:like_review', args=[review.pk]))
+        self.assertEqual(response.json()['likes_count'], 1)
+        self.assertEqual(self._stats(), stats)
+        self.assertFalse(DirtyMovie.objects.exists())
+        invalidate.assert_not_called()
+
+
+class TruthValueTestCase(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tv = evaluation.truth_value
+
+
+class TimeSplitTests(TruthValueTestCase):
+    def test_last_positive_is_test_and_the_one_before_is_val(self):
+        rows = [
+            (0, 10, '2024-01-01', 1), (0, 11, '2024-01-03', 1), (0, 12, '2024-01-02', 0),
+            (0, 13, '2024-01-05', 1), (0, 14, '2024-01-06', 0),
+            (1, 10, '2024-02-02', 1), (1, 11, '2024-02-01', 0),
+            (2, 12, '2024-03-01', 0),
+        ]
+        df = pd.DataFrame(rows, columns=['user_id', 'item_id', 'ts', 'y']).assign(ts=lambda d: pd.to_datetime(d['ts']))
+        splits = self.tv.assign_time_splits(df)
+        self.assertEqual(dict(zip(zip(splits['user_id'], splits['item_id']), splits['split'])), {
+            (0, 10): 'train', (0, 11): 'val', (0, 12): 'train', (0, 13): 'test', (0, 14): 'train',
+            (1, 10): 'test', (1, 11): 'train',
+            (2, 12): 'train',
+        })
+
+    def test_matches_per_user_reference(self):
+        rng = np.random.default_rng(3)
+        n = 2000
+        df = pd.DataFrame({
+            'user_id': rng.integers(0, 150, n), 'item_id': np.arange(n),
+            'ts': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.permutation(n), unit='min'),
+            'y': rng.integers(0, 2, n),
+        })
+        splits = self.tv.assign_time_splits(df).sort_index()
+
+        # 逐用户的参考实现：按时间排序后取最后两个正样本
+        expected = pd.Series('train', index=df.index)
+        for _, group in df.sort_values('ts').groupby('user_id'):
+            positives = group.index[group['y'] == 1]
+            expected[positives[-1:]] = 'test'
+            expected[positives[-2:-1]] = 'val'
+        pd.testing.assert_series_equal(splits['split'], expected, check_names=False, check_dtype=False)
+
+
+class NegativeSamplingTests(TruthValueTestCase):
+    def _interactions(self, n_items=40, n_users=30, seed=0):
+        """随机的交互表（已编码、已切分），其中有一部不在电影表中的电影"""
+        rng = np.random.default_rng(seed)
+        movies = pd.DataFrame({'imdb_id': [f'tt{i:07d}' for i in range(n_items)]})
+        rows = []
+        for user in range(n_users):
+            items = rng.choice(n_items, size=rng.integers(2, 12), replace=False)
+            rows += [(f'u{user:03d}', f'tt{item:07d}') for item in items]
+        rows.append(('u000', 'tt9999999'))
+        raw = pd.DataFrame(rows, columns=['user_id', 'item_id'])
+        raw['ts'] = pd.Timestamp('2024-01-01') + pd.to_timedelta(np.arange(len(raw)), unit='min')
+        raw['y'] = 1
+        df, users, items = self.tv.encode_ids(raw)
+        return movies, self.tv.assign_time_splits(df), users, items
+
+    def test_negatives_are_unseen_catalog_items(self):
+        movies, df, users, items = self._interactions()
+        K = 10
+        eval_df = self.tv.sample_eval_negatives(movies, df, items, K=K, seed=1)
+
+        test = df[df['split'] == 'test']
+        self.assertEqual(eval_df['user_id'].tolist(), test['user_id'].tolist())
+        self.assertEqual(eval_df['pos_item_id'].tolist(), test['item_id'].tolist())
+        seen = df.groupby('user_id')['item_id'].agg(lambda codes: set(items[codes]))
+        catalog = set(movies['imdb_id'])
+        negatives = eval_df.filter(like='neg_').to_numpy()
+        self.assertEqual(negatives.shape, (len(test), K))
+        # 与逐用户的旧实现一样是有放回抽样，同一行内允许重复
+        for user, row in zip(eval_df['user_id'], negatives):
+            self.assertLessEqual(set(row), catalog)
+            self.assertFalse(set(row) & seen[user])
+
+    def test_same_seed_gives_the_same_sample(self):
+        movies, df, _, items = self._interactions()
+        first = self.tv.sample_eval_negatives(movies, df, items, K=10, seed=1)
+        pd.testing.assert_frame_equal(first, self.tv.sample_eval_negatives(movies, df, items, K=10, seed=1))
+        self.assertFalse(first.equals(self.tv.sample_eval_negatives(movies, df, items, K=10, seed=2)))
+
+    def _single_user_sample(self, n_items, n_seen, K):
+        movies = pd.DataFrame({'imdb_id': [f'tt{i:07d}' for i in range(n_items)]})
+        raw = pd.DataFrame({'user_id': 'u0', 'item_id': [f'tt{i:07d}' for i in range(n_seen)]})
+        raw['ts'] = pd.Timestamp('2024-01-01') + pd.to_timedelta(np.arange(n_seen), unit='min')
+        raw['y'] = 1
+        df, _, items = self.tv.encode_ids(raw)
+        eval_df = self.tv.sample_eval_negatives(movies, self.tv.assign_time_splits(df), items, K=K, seed=0)
+        return eval_df.filter(like='neg_').iloc[0].tolist()
+
+    def test_user_short_of_unseen_items(self):
+        # 只剩 3 部没看过的电影：K 个负例都从这 3 部中抽取
+        negatives = self._single_user_sample(n_items=8, n_seen=5, K=5)
+        self.assertEqual(len(negatives), 5)
+        self.assertLessEqual(set(negatives), {'tt0000005', 'tt0000006', 'tt0000007'})
+        # 看过全部电影的用户没有可用的负例
+        self.assertEqual(self._single_user_sample(n_items=4, n_seen=4, K=3), [None, None, None])
+
+
+class ArtifactReaderTests(TruthValueTestCase):
+    def _frames(self):
+        splits = pd.DataFrame({
+            'user_id': ['u1', 'u2', 'u2', 'u3'], 'item_id': ['tt01', 'tt02', 'tt01', 'tt03'],
+            'ts': pd.to_datetime(['2024-01-01 08:00', '2024-01-02 09:30', '2024-01-03 00:00', '2024-01-04 12:00']),
+            'y': [1.0, 0.0, 1.0, 1.0], 'weight': [1.0, 1.0, 0.6, 1.0], 'split': ['train', 'train', 'test', 'train'],
+        })
+        eval_samples = pd.DataFrame({'user_id': ['u1', 'u2'], 'pos_item_id': ['tt01', 'tt01'],
+                                     'neg_1': ['tt02', 'tt03'], 'neg_2': ['tt03', None]})
+        return {'splits': splits, 'eval_samples': eval_samples}
+
+    def test_frames_survive_a_round_trip_in_every_format(self):
+        formats = self.tv.ARTIFACT_FORMATS if self.tv.HAS_PYARROW else ('csv',)
+        for fmt in formats:
+            for sharded in (False, True):
+                with self.subTest(fmt=fmt, sharded=sharded), tempfile.TemporaryDirectory() as tmp:
+                    out_dir = Path(tmp)
+                    for name, df in self._frames().items():
+                        if sharded:
+                            for part, lo in enumerate(range(0, len(df), 2)):
+                                self.tv.write_artifact(df.iloc[lo:lo + 2], out_dir, name, fmt, part=part)
+                        else:
+                            self.tv.write_artifact(df, out_dir, name, fmt)
+                        # Parquet/Feather 的 id 列读回为分类类型，按取值比较
+                        pd.testing.assert_frame_equal(evaluation.read_artifact(out_dir, name).astype(object),
+                                                      df.astype(object), check_dtype=False)
+                    train, eval_users, candidates = evaluation.load_eval_data(out_dir)
+                    self.assertEqual(train['user_id'].tolist(), ['u1', 'u3'])
+                    self.assertEqual(eval_users.tolist(), ['u1', 'u2'])
+                    self.assertEqual(candidates.shape, (2, 3))
+
+    def test_csv_keeps_ids_that_look_like_missing_values(self):
+        df = pd.DataFrame({'user_id': ['NA', 'null', 'None', ''], 'item_id': ['nan', 'N/A', 'tt01', 'tt02'],
+                           'y': [1.0, None, 0.0, 1.0]})
+        with tempfile.TemporaryDirectory() as tmp:
+            self.tv.write_artifact(df, Path(tmp), 'splits', 'csv')
+            read = evaluation.read_artifact(tmp, 'splits')
+        self.assertEqual(read['user_id'].tolist()[:3], ['NA', 'null', 'None'])
+        self.assertTrue(pd.isna(read['user_id'][3]))
+        self.assertEqual(read['item_id'].tolist(), ['nan', 'N/A', 'tt01', 'tt02'])
+        self.assertTrue(pd.isna(read['y'][1]))
+
+    def test_reviews_keep_authors_named_like_missing_values(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'reviews.csv'
+            path.write_text('imdb_id,author,user_status,score,comment_time\n'
+                            'tt01,NA,看过,4,2024-01-01\ntt02,null,看过,,\ntt03,,看过,3,2024-01-02\n', encoding='utf-8')
+            reviews = self.tv.load_reviews(path)
+        self.assertEqual(reviews['user_id'].tolist()[:2], ['NA', 'null'])
+        self.assertTrue(pd.isna(reviews['score'][1]) and pd.isna(reviews['ts'][1]))
+
+
+class StreamingModeTests(TruthValueTestCase):
+    def _write_inputs(self, data_dir, n_movies=30, n_reviews=600):
+        rng = np.random.default_rng(4)
+        imdb_ids = [f'tt{i:07d}' for i in range(n_movies)]
+        pd.DataFrame({
+            'imdb_id': imdb_ids, 'original_title': [f'Movie {i}' for i in range(n_movies)], 'release_year': 2000,
+            'genres': '剧情', 'douban_average_score': rng.uniform(5, 9, n_movies).round(1),
+            'douban_star_rating': '', 'number_of_ratings': rng.integers(10, 5000, n_movies),
+        }).to_csv(data_dir / 'movies.csv', index=False)
+        times = pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.permutation(n_reviews), unit='h')
+        pd.DataFrame({
+            'imdb_id': rng.choice(imdb_ids, n_reviews), 'author': [f'user{u}' for u in rng.integers(0, 60, n_reviews)],
+            'user_status': rng.choice(['看过', '想看'], n_reviews),
+            'score': rng.choice(['1', '2', '3', '4', '5', '无评分'], n_reviews),
+            'comment_time': times.strftime('%Y-%m-%d %H:%M:%S'),
+        }).to_csv(data_dir / 'reviews.csv', index=False)
+        return data_dir / 'movies.csv', data_dir / 'reviews.csv'
+
+    def test_sharded_run_matches_in_memory_run(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = Path(tmp)
+            movies_path, reviews_path = self._write_inputs(tmp)
+            with redirect_stdout(StringIO()):
+                self.tv.main(movies_path, reviews_path, out_dir=tmp / 'memory', fmt='csv')
+                self.tv.main(movies_path, reviews_path, out_dir=tmp / 'stream', fmt='csv',
+                             stream=True, chunksize=100, shards=3)
+
+            def read(run, name):
+                df = self.tv.read_artifact(tmp / run, name)
+                return df.sort_values(list(df.columns[:2])).reset_index(drop=True)
+
+            for name in ('interactions_gt', 'splits'):
+                pd.testing.assert_frame_equal(read('memory', name), read('stream', name), check_like=True)
+
+            # 负例按分片各自抽样，只检查评测样例相同、负例都没看过
+            memory, stream = read('memory', 'eval_samples'), read('stream', 'eval_samples')
+            pd.testing.assert_frame_equal(memory[['user_id', 'pos_item_id']], stream[['user_id', 'pos_item_id']])
+            seen = read('stream', 'interactions_gt').groupby('user_id')['item_id'].agg(set)
+            for user, row in zip(stream['user_id'], stream.filter(like='neg_').to_numpy()):
+                self.assertFalse(set(row) & seen[user])
+
+            # 各分片的用户编码依次接续，合并后仍是稠密编码
+            user_map = read('stream', 'user_map')
+            self.assertEqual(sorted(user_map['code']), list(range(len(user_map))))
+            self.assertEqual(set(user_map['id']), set(read('memory', 'user_map')['id']))
+
+    def test_empty_reviews_match_in_memory_run(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = Path(tmp)
+            movies_path, reviews_path = self._write_inputs(tmp, n_reviews=0)
+            with redirect_stdout(StringIO()):
+                self.tv.main(movies_path, reviews_path, out_dir=tmp / 'memory', fmt='csv')
+                self.tv.main(movies_path, reviews_path, out_dir=tmp / 'stream', fmt='csv', stream=True, shards=3)
+            for name in ('interactions_gt', 'splits', 'user_map', 'item_map', 'eval_samples'):
+                memory, stream = (self.tv.read_artifact(tmp / run, name) for run in ('memory', 'stream'))
+                self.assertTrue(stream.empty, name)
+                self.assertEqual(list(stream.columns), list(memory.columns), name)
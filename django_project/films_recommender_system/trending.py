@@ -0,0 +1,113 @@
+# films_recommender_system/trending.py
+
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max
+from django.utils import timezone
+
+from .models import MovieActivityBucket, MovieTrend
+
+# 各类行为的权重
+TRENDING_WEIGHTS = {'views': 1.0, 'favorites': 3.0, 'reviews': 2.0}
+# 热度半衰期：一天前的行为只算一半
+TRENDING_HALF_LIFE = timedelta(hours=24)
+# 滑动窗口：超过这个时间没有任何行为的电影不再出现在热门中
+TRENDING_WINDOW = timedelta(days=7)
+# 衰减的固定起点。分数存为 log2(Σ w·2^((t-起点)/半衰期))，随时间线性增长，
+# 排序与“按当前时刻衰减后的热度”排序完全一致，因此更新时无需对全表做衰减
+TRENDING_EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def _bucket_start(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def record_movie_activity(movie_ids, kind, count=1):
+    """为若干电影的当前小时分桶累加一次行为计数（F 表达式原子更新，不存在时创建）"""
+    bucket = _bucket_start(timezone.now())
+    for movie_id in movie_ids:
+        updated = MovieActivityBucket.objects.filter(movie_id=movie_id, bucket=bucket).update(
+            **{kind: F(kind) + count})
+        if updated:
+            continue
+        try:
+            with transaction.atomic():
+                MovieActivityBucket.objects.create(movie_id=movie_id, bucket=bucket, **{kind: count})
+        except IntegrityError:
+            # 并发请求已经创建了这个分桶
+            MovieActivityBucket.objects.filter(movie_id=movie_id, bucket=bucket).update(**{kind: F(kind) + count})
+
+
+def update_trending(now=None):
+    """
+    把上次更新之后、已经结束的小时分桶计入热度，开销只与新增分桶数量有关
+    返回本次计入的分桶数
+    """
+    now = now or timezone.now()
+    watermark = MovieTrend.objects.aggregate(m=Max('last_bucket'))['m']
+    buckets = MovieActivityBucket.objects.filter(bucket__lt=_bucket_start(now))
+    if watermark:
+        buckets = buckets.filter(bucket__gt=watermark)
+    rows = list(buckets.order_by('movie_id', 'bucket').values_list('movie_id', 'bucket', *TRENDING_WEIGHTS))
+    if not rows:
+        return 0
+
+    half_life = TRENDING_HALF_LIFE.total_seconds()
+    movie_ids = np.array([row[0] for row in rows], dtype=np.int64)
+    offsets = np.array([(row[1] - TRENDING_EPOCH).total_seconds() / half_life for row in rows])
+    counts = np.array([row[2:] for row in rows], dtype=np.float64)
+    weighted = counts @ np.array(list(TRENDING_WEIGHTS.values()))
+
+    keep = np.flatnonzero(weighted > 0)
+    if not len(keep):
+        return 0
+    movie_ids, offsets, weighted = movie_ids[keep], offsets[keep], weighted[keep]
+
+    # 每个分桶的贡献取对数：log2(w) + (t - 起点) / 半衰期
+    log_contrib = np.log2(weighted) + offsets
+
+    # 按电影分组做 log-sum-exp（先减去组内最大值保证数值稳定）
+    ids, inverse = np.unique(movie_ids, return_inverse=True)
+    group_max = np.full(len(ids), -np.inf)
+    np.maximum.at(group_max, inverse, log_contrib)
+    new_scores = group_max + np.log2(np.bincount(inverse, weights=np.exp2(log_contrib - group_max[inverse])))
+
+    # 行已按 (movie_id, bucket) 排序，每组最后一行就是该电影最新的分桶
+    group_last = np.append(np.flatnonzero(np.diff(movie_ids)), len(movie_ids) - 1)
+    last_buckets = [rows[keep[i]][1] for i in group_last]
+
+    with transaction.atomic():
+        existing = MovieTrend.objects.in_bulk(ids.tolist())
+        to_update, to_create = [], []
+        for movie_id, score, last_bucket in zip(ids.tolist(), new_scores.tolist(), last_buckets):
+            trend = existing.get(movie_id)
+            if trend:
+                trend.score = float(np.logaddexp2(trend.score, score))
+                trend.last_bucket = last_bucket
+                to_update.append(trend)
+            else:
+                to_create.append(MovieTrend(movie_id=movie_id, score=score, last_bucket=last_bucket))
+        MovieTrend.objects.bulk_update(to_update, ['score', 'last_bucket'], batch_size=500)
+        MovieTrend.objects.bulk_create(to_create, batch_size=500)
+
+        # 已计入且超出窗口的分桶不再需要
+        MovieActivityBucket.objects.filter(bucket__lt=now - TRENDING_WINDOW).delete()
+
+    return len(rows)
+
+
+def get_trending_movies_qs(now=None):
+    """窗口内按热度降序排列的 MovieTrend 查询集（score 上有索引）"""
+    since = (now or timezone.now()) - TRENDING_WINDOW
+    return MovieTrend.objects.filter(last_bucket__gte=since).order_by('-score')
+
+
+def get_trending_movie_ids(n=12, now=None):
+    return list(get_trending_movies_qs(now).values_list('movie_id', flat=True)[:n])
+
+
+def get_trending_imdb_ids(n=50, now=None):
+    imdb_ids = get_trending_movies_qs(now).values_list('movie__imdb_id', flat=True)[:n]
+    return [imdb_id for imdb_id in imdb_ids if imdb_id]
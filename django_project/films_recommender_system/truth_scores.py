@@ -0,0 +1,127 @@
+# films_recommender_system/truth_scores.py
+
+import numpy as np
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, FloatField, Sum
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .models import DirtyMovie, Movie, MovieSourceStats, MovieStats
+
+# 本站用户评分的基础权重（高度信任我们自己的用户），以及评分数量带来的权重加成上限
+USER_BASE_WEIGHT = 7
+USER_COUNT_WEIGHT_CAP = 3
+# build_search_index 写入的结构化搜索索引，其中带有 truth_score 作为排序的次关键字
+SEARCH_INDEX_CACHE_KEY = 'global_search_index'
+
+
+def _aligned(movie_ids, rows):
+    """把 GROUP BY 结果 [(movie_id, v1, v2), ...] 对齐到 movie_ids（已排序），缺失的电影填 0"""
+    values = np.zeros((len(movie_ids), 2), dtype=np.float64)
+    if rows:
+        data = np.array(rows, dtype=np.float64)
+        pos = np.searchsorted(movie_ids, data[:, 0].astype(np.int64))
+        values[pos] = np.nan_to_num(data[:, 1:3])
+    return values[:, 0], values[:, 1]
+
+
+def combine_truth_scores(external_weighted_sum, external_weight, user_avg, user_count):
+    """
+    外部评分（已按可信度加权的 10 分制分数之和及权重之和）与本站用户平均分合并为加权平均分
+    本站权重 = 7 + min(2·log10(评分数 + 1), 3)：评分数量的影响随着增长而减弱，防止评论多的电影完全主导
+    没有任何评分的电影得 0 分
+    """
+    user_weight = np.where(user_count > 0,
+                           USER_BASE_WEIGHT + np.minimum(np.log10(user_count + 1) * 2, USER_COUNT_WEIGHT_CAP), 0.0)
+    total_score = external_weighted_sum + user_avg * user_weight
+    total_weight = external_weight + user_weight
+    scores = np.divide(total_score, total_weight, out=np.zeros_like(total_score), where=total_weight > 0)
+    return np.round(scores, 2)
+
+
+def compute_truth_scores(movie_ids=None):
+    """
+    集合式计算真值分数：从反范式统计表 MovieSourceStats / MovieStats 各读一次，再用 numpy 合并
+    每部电影只需读取 (来源数 + 1) 行，不再聚合评论表；统计表由 build_movie_stats 构建、写评论时维护
+    movie_ids 为 None 时计算全部电影；返回 (排序后的 movie_id 数组, 分数数组)
+    """
+    movies = Movie.objects.order_by('id')
+    source_stats = MovieSourceStats.objects.filter(review_count__gt=0)
+    movie_stats = MovieStats.objects.filter(review_count__gt=0)
+    if movie_ids is not None:
+        movie_ids = list(movie_ids)
+        movies = movies.filter(id__in=movie_ids)
+        source_stats = source_stats.filter(movie_id__in=movie_ids)
+        movie_stats = movie_stats.filter(movie_id__in=movie_ids)
+    ids = np.fromiter(movies.values_list('id', flat=True), dtype=np.int64)
+
+    # 1. 外部源评论：归一化到 10 分制后按源的可信度加权（每条评论的权重为其来源的可信度）
+    credibility = Cast('source__credibility_level', FloatField())
+    external = (source_stats.order_by().values('movie_id')
+                .annotate(weighted_sum=Sum(F('score_sum') / F('source__score_max') * 10 * credibility),
+                          weight=Sum(F('review_count') * credibility))
+                .values_list('movie_id', 'weighted_sum', 'weight'))
+    external_weighted_sum, external_weight = _aligned(ids, list(external))
+
+    # 2. 本站用户评分：平均分与评分数
+    users = (movie_stats.annotate(avg_rating=F('rating_sum') / F('review_count'))
+             .values_list('movie_id', 'avg_rating', 'review_count'))
+    user_avg, user_count = _aligned(ids, list(users))
+
+    return ids, combine_truth_scores(external_weighted_sum, external_weight, user_avg, user_count)
+
+
+def update_truth_scores(movie_ids=None, batch_size=2000):
+    """计算并写回真值分数，只更新分数发生变化的电影，分块 bulk_update；返回 {movie_id: 新分数}"""
+    ids, scores = compute_truth_scores(movie_ids)
+    current = Movie.objects.all() if movie_ids is None else Movie.objects.filter(id__in=ids.tolist())
+    current = dict(current.values_list('id', 'truth_score'))
+    changed = [Movie(id=movie_id, truth_score=score) for movie_id, score in zip(ids.tolist(), scores.tolist())
+               if current.get(movie_id) != score]
+    for lo in range(0, len(changed), batch_size):
+        Movie.objects.bulk_update(changed[lo:lo + batch_size], ['truth_score'])
+    changed = {movie.id: movie.truth_score for movie in changed}
+    _refresh_search_index(changed)
+    return changed
+
+
+def _refresh_search_index(changed):
+    """把新的真值分数写进已缓存的搜索索引，搜索结果的次序无需重建索引即可跟上"""
+    if not changed:
+        return
+    search_index = cache.get(SEARCH_INDEX_CACHE_KEY)
+    if not search_index:
+        return
+    for item in search_index:
+        if item['id'] in changed:
+            item['truth_score'] = changed[item['id']]
+    cache.set(SEARCH_INDEX_CACHE_KEY, search_index, timeout=None)
+
+
+# --- 新增：增量更新。评论写入时登记电影，消费者只重算被登记的电影 ---
+
+def mark_truth_scores_dirty(movie_ids):
+    """登记需要重算真值分数的电影；重复登记只刷新登记时间"""
+    now = timezone.now()
+    DirtyMovie.objects.bulk_create([DirtyMovie(movie_id=movie_id, marked_at=now) for movie_id in set(movie_ids)],
+                                   update_conflicts=True, unique_fields=['movie_id'], update_fields=['marked_at'])
+
+
+def update_dirty_truth_scores(limit=None, batch_size=2000):
+    """
+    取出队列中的电影并只重算它们，开销只与变化的电影数有关；返回 (处理的电影数, {movie_id: 新分数})
+    出队与写回在同一事务中：重算失败时登记不会丢失；重算期间新的登记会在出队提交后重新写入队列
+    """
+    with transaction.atomic():
+        queue = DirtyMovie.objects.select_for_update().order_by('marked_at').values_list('movie_id', flat=True)
+        movie_ids = list(queue[:limit] if limit else queue)
+        if not movie_ids:
+            return 0, {}
+        DirtyMovie.objects.filter(movie_id__in=movie_ids).delete()
+        return len(movie_ids), update_truth_scores(movie_ids, batch_size)
+
+
+def clear_dirty_truth_scores(before):
+    """全量重算前清空在此之前登记的电影"""
+    DirtyMovie.objects.filter(marked_at__lte=before).delete()
@@ -1,6 +1,7 @@
 from django.urls import path
 from rest_framework.routers import DefaultRouter
-from .views import MovieViewSet, UserReviewViewSet, RealtimeRecommendationView, BatchMovieDetailView # 导入新视图
+from .views import (MovieViewSet, UserReviewViewSet, RealtimeRecommendationView, AsyncRealtimeRecommendationView,
+                    RecommendationFeedView, BatchMovieDetailView, SimilarMoviesView)  # 导入新视图
 
 # 创建一个路由器
 router = DefaultRouter()
@@ -14,8 +15,15 @@ urlpatterns = [
     # 为实时推荐API添加的路由
     # 将 URL 'recommendations/realtime/<user_id>/' 映射到 RealtimeRecommendationView 视图
     path('recommendations/realtime/<str:user_id>/', RealtimeRecommendationView.as_view(), name='realtime-recommendations'),
+    # 异步版本，部署在 ASGI 下时使用
+    path('recommendations/realtime-async/<str:user_id>/', AsyncRealtimeRecommendationView.as_view(),
+         name='realtime-recommendations-async'),
+    # 游标分页的推荐流（无限滚动），?cursor= 取下一页
+    path('recommendations/feed/<str:user_id>/', RecommendationFeedView.as_view(), name='recommendation-feed'),
     # MODIFIED: 使用新的批量获取URL，替换掉旧的单个获取URL
     path('movies/batch-details/', BatchMovieDetailView.as_view(), name='batch-movie-details'),
+    # 相似电影（“更多相似电影”面板）
+    path('movies/<int:movie_id>/similar/', SimilarMoviesView.as_view(), name='similar-movies'),
 ]
 
 urlpatterns += router.urls
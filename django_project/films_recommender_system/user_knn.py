@@ -0,0 +1,157 @@
+# films_recommender_system/user_knn.py
+
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from django.core.cache import cache
+from scipy import sparse
+
+from .models import UserReview
+
+# 离线构建的用户评分模型（中心化并行归一化的稀疏评分矩阵），由 build_user_neighbors 命令写入
+USER_KNN_MODEL_CACHE_KEY = 'user_knn_model'
+# 每个用户的近邻列表缓存：(近邻 user_id 列表, 相似度列表)
+USER_NEIGHBORS_CACHE_KEY = 'user_neighbors_{user_id}'
+USER_NEIGHBORS_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+USER_KNN_K = 30
+# 预测分数的收缩项：只有少数近邻评过的电影，分数向 0 收缩
+USER_KNN_SHRINK = 1.0
+
+
+def _user_neighbors_cache_key(user_id):
+    return USER_NEIGHBORS_CACHE_KEY.format(user_id=user_id)
+
+
+def load_ratings(user_ids=None):
+    """读取站内用户评分，同一用户对同一电影的多条评论取平均分，返回 DataFrame(user_id, movie_id, rating)"""
+    qs = UserReview.objects.order_by()
+    if user_ids is not None:
+        qs = qs.filter(user_id__in=list(user_ids))
+    ratings = pd.DataFrame(list(qs.values_list('user_id', 'movie_id', 'rating')),
+                           columns=['user_id', 'movie_id', 'rating'])
+    return ratings.groupby(['user_id', 'movie_id'], as_index=False)['rating'].mean()
+
+
+def centered_rows(rows, cols, ratings, shape):
+    """按行减去用户平均分并做 L2 归一化，返回 CSR；中心化后的点积即皮尔逊相关系数"""
+    matrix = sparse.csr_matrix((np.asarray(ratings, dtype=np.float64), (rows, cols)), shape=shape)
+    counts = np.diff(matrix.indptr)
+    means = np.divide(np.asarray(matrix.sum(axis=1)).ravel(), counts, out=np.zeros(shape[0]), where=counts > 0)
+    matrix.data -= np.repeat(means, counts)
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    matrix.data /= np.repeat(np.where(norms > 0, norms, 1.0), counts)
+    matrix.eliminate_zeros()
+    return matrix
+
+
+def _row_top_k(sims, k, exclude=None):
+    """从一行稀疏相似度中取相似度最高的 k 个正相关列，返回 (列下标, 相似度)"""
+    cols, vals = sims.indices, sims.data
+    keep = vals > 0
+    if exclude is not None:
+        keep &= cols != exclude
+    cols, vals = cols[keep], vals[keep]
+    if len(vals) > k:
+        top = np.argpartition(-vals, k - 1)[:k]
+        cols, vals = cols[top], vals[top]
+    order = np.argsort(-vals, kind='stable')
+    return cols[order], vals[order]
+
+
+# --- 进程池 worker：每个进程持有一份矩阵，按用户分块计算相似度 ---
+_WORKER_MATRIX = None
+
+
+def _init_worker(matrix):
+    global _WORKER_MATRIX
+    _WORKER_MATRIX = matrix
+
+
+def _block_neighbors(lo, hi, k):
+    """一块用户 [lo, hi) 与全部用户的稀疏乘积，每行取 Top-K（排除自身）"""
+    block = (_WORKER_MATRIX[lo:hi] @ _WORKER_MATRIX.T).tocsr()
+    return lo, [_row_top_k(block[i], k, exclude=lo + i) for i in range(hi - lo)]
+
+
+def compute_user_neighbors(matrix, k=USER_KNN_K, block_size=512, workers=1):
+    """分块计算所有用户的 Top-K 近邻；workers > 1 时各块在进程池中并行"""
+    n_users = matrix.shape[0]
+    blocks = [(lo, min(lo + block_size, n_users)) for lo in range(0, n_users, block_size)]
+    results = [None] * n_users
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(matrix,)) as pool:
+            for lo, rows in pool.map(_block_neighbors, *zip(*blocks), [k] * len(blocks)):
+                results[lo:lo + len(rows)] = rows
+    else:
+        _init_worker(matrix)
+        for lo, hi in blocks:
+            results[lo:hi] = _block_neighbors(lo, hi, k)[1]
+    return results
+
+
+def fold_in_user(user_id, model=None, k=USER_KNN_K):
+    """
+    在线折叠：只读取该用户自己的最新评分，中心化后与离线矩阵做一次稀疏向量乘积得到近邻，
+    不重建矩阵；离线模型不存在时返回空列表
+    """
+    model = model or cache.get(USER_KNN_MODEL_CACHE_KEY)
+    if model is None:
+        return [], []
+    ratings = load_ratings([user_id])
+    item_index = model['item_index']
+    ratings = ratings[ratings['movie_id'].isin(item_index)]
+    if ratings.empty:
+        return [], []
+
+    cols = ratings['movie_id'].map(item_index).to_numpy()
+    vector = centered_rows(np.zeros(len(cols), dtype=np.int64), cols, ratings['rating'].to_numpy(),
+                           (1, model['matrix'].shape[1]))
+    sims = (vector @ model['matrix'].T).tocsr()
+    self_row = model['user_index'].get(user_id)
+    rows, values = _row_top_k(sims[0], k, exclude=self_row)
+    return model['user_ids'][rows].tolist(), values.tolist()
+
+
+def get_user_neighbors(user_id):
+    """用户的近邻列表：优先读缓存；缓存被新评分清除或用户不在离线模型中时，在线折叠计算并写回缓存"""
+    key = _user_neighbors_cache_key(user_id)
+    neighbors = cache.get(key)
+    if neighbors is None:
+        neighbors = fold_in_user(user_id)
+        cache.set(key, neighbors, USER_NEIGHBORS_CACHE_TIMEOUT)
+    return neighbors
+
+
+def invalidate_user_neighbors(*user_ids):
+    """用户评分变化时清除其近邻缓存，下次请求时在线折叠最新评分"""
+    cache.delete_many([_user_neighbors_cache_key(user_id) for user_id in user_ids])
+
+
+def score_user_knn(neighbor_ids, neighbor_sims, exclude=(), limit=200):
+    """
+    近邻评分加权：电影 i 的分数 = Σ sim(u, v)·(r_vi − mean_v) / (Σ|sim(u, v)| + USER_KNN_SHRINK)
+    一次查询取回全部近邻的评分，返回分数为正的电影 imdb_id（降序）
+    """
+    if not neighbor_ids:
+        return []
+    rows = list(UserReview.objects.filter(user_id__in=neighbor_ids).order_by()
+                .values_list('user_id', 'movie__imdb_id', 'rating'))
+    if not rows:
+        return []
+    ratings = pd.DataFrame(rows, columns=['user_id', 'imdb_id', 'rating'])
+    ratings = ratings.groupby(['user_id', 'imdb_id'], as_index=False)['rating'].mean()
+    # 先按近邻自己的全部评分中心化，再排除目标用户已交互的电影
+    ratings['centered'] = ratings['rating'] - ratings.groupby('user_id')['rating'].transform('mean')
+    ratings = ratings[~ratings['imdb_id'].isin(set(exclude))]
+    if ratings.empty:
+        return []
+
+    sims = ratings['user_id'].map(dict(zip(neighbor_ids, neighbor_sims))).to_numpy()
+    item_codes, item_ids = pd.factorize(ratings['imdb_id'])
+    numerator = np.bincount(item_codes, weights=sims * ratings['centered'].to_numpy())
+    denominator = np.bincount(item_codes, weights=np.abs(sims))
+    scores = numerator / (denominator + USER_KNN_SHRINK)
+
+    order = np.argsort(-scores, kind='stable')
+    order = order[scores[order] > 0][:limit]
+    return item_ids[order].tolist()
@@ -8,14 +8,25 @@ from .serializers import MovieListSerializer, MovieDetailSerializer, UserReviewS
 from rest_framework import generics
 from rest_framework.permissions import AllowAny
 from .serializers import RegisterSerializer
+from .recommendation_utils import (
+    get_user_exclusion_parts, score_content_based, get_recent_viewed_imdb_ids, score_session_based,
+    get_user_preference_ids, merge_candidate_lists,
+    get_movie_cards, get_similar_movie_cards, save_feed, load_feed, CANDIDATE_LISTS_CACHE_KEY
+)
+from .trending import get_trending_imdb_ids
+from .candidate_pipeline import collect_candidates, rank_candidates
+from .serving import Deadline, record_tier_served
 from rest_framework.views import APIView
 from rest_framework import status
 from rest_framework.response import Response
+import asyncio
 import logging
-import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.core.cache import cache
-# --- 新增：导入余弦相似度计算工具 ---
-from sklearn.metrics.pairwise import cosine_similarity
+from django.http import JsonResponse
+from django.views import View
 
 logger = logging.getLogger(__name__)
 
@@ -36,6 +47,10 @@ class MovieViewSet(viewsets.ReadOnlyModelViewSet):
         if self.action == 'retrieve': return MovieDetailSerializer
         return MovieListSerializer
 
+    def get_queryset(self):
+        if self.action == 'retrieve': return super().get_queryset().select_related('stats')
+        return super().get_queryset()
+
 
 class UserReviewViewSet(viewsets.ModelViewSet):
     serializer_class = UserReviewSerializer
@@ -49,8 +64,25 @@ class UserReviewViewSet(viewsets.ModelViewSet):
 # --- 混合式实时推荐 API 视图 (最终三层健壮版) ---
 class RealtimeRecommendationView(APIView):
     permission_classes = [AllowAny]
+    # 每次返回的推荐数量
+    k = 50
 
     def get(self, request, user_id, *args, **kwargs):
+        # ?debug=1 时返回召回/精排各阶段耗时
+        response = self.get_recommendations(user_id, debug=request.query_params.get('debug') == '1')
+        # ?include=cards 时直接附带渲染卡片所需的数据，前端无需再请求 batch-details
+        if request.query_params.get('include') == 'cards':
+            response.data['cards'] = get_movie_cards(response.data['recommendations'])
+        return response
+
+    def get_recommendations(self, user_id, debug=False):
+        # 每个请求有固定的延迟预算，超出后直接返回更廉价的结果，并按层级计数
+        deadline = Deadline(settings.RECOMMENDATION_LATENCY_BUDGET_MS)
+        response = self.serve_recommendations(user_id, deadline, debug)
+        record_tier_served(response.data['source'], response.data.get('degraded', False))
+        return response
+
+    def serve_recommendations(self, user_id, deadline, debug=False):
         logger.info(f"收到用户 '{user_id}' 的实时推荐请求")
         try:
             user = User.objects.get(username=user_id)
@@ -58,13 +90,33 @@ class RealtimeRecommendationView(APIView):
             user = None
 
         model_assets = cache.get('recommendation_model_assets')
+        if user and settings.RECOMMENDATION_CANDIDATE_GENERATORS:
+            if deadline.expired():
+                return self.get_degraded_recommendations(user, deadline)
+            try:
+                response = self.get_pipeline_recommendations(user, model_assets, deadline, debug)
+                if response:
+                    return response
+            except Exception as e:
+                logger.warning(f"召回+精排推荐失败: {e}。将尝试备用方案。")
+
         if model_assets and user:
+            if deadline.expired():
+                return self.get_degraded_recommendations(user, deadline)
             try:
                 response = self.get_content_based_recommendations(user, model_assets)
                 return response
             except Exception as e:
                 logger.warning(f"内容模型实时推断失败: {e}。将尝试备用方案。")
 
+        if model_assets and user:
+            if deadline.expired():
+                return self.get_degraded_recommendations(user, deadline)
+            try:
+                return self.get_session_based_recommendations(user, model_assets)
+            except Exception as e:
+                logger.warning(f"会话推荐失败: {e}。将尝试备用方案。")
+
         if user:
             response = self.get_profile_based_recommendations(user)
             if response:
@@ -72,45 +124,81 @@ class RealtimeRecommendationView(APIView):
 
         return self.get_global_fallback_recommendations()
 
+    def get_pipeline_recommendations(self, user, model_assets, deadline=None, debug=False):
+        # 召回：各候选生成器只返回几百部电影；精排：仅对候选并集做一次向量化打分
+        context, candidates, timings = collect_candidates(user.id, model_assets, deadline=deadline)
+        if deadline is not None and deadline.expired():
+            return self.get_degraded_recommendations(user, deadline)
+        if not any(candidates.values()):
+            return None
+        recommended_imdb_ids = rank_candidates(context, candidates, self.k, timings)
+
+        logger.info(f"成功为用户 '{user.username}' 生成召回+精排推荐。")
+        return Response(pipeline_payload(user, recommended_imdb_ids, candidates, timings, debug))
+
     def get_content_based_recommendations(self, user, model_assets):
-        item_vectors = model_assets['item_vectors']
-        item_map = model_assets['item_map']
-
-        rec_profile = Recommendation.objects.get(user=user)
-        favorite_movie_pks = list(rec_profile.favorite_movies.values_list('id', flat=True))
-        if not favorite_movie_pks: raise ValueError("用户无喜好电影")
-
-        favorite_movies_imdb_ids = list(
-            Movie.objects.filter(pk__in=favorite_movie_pks).values_list('imdb_id', flat=True))
-        favorite_indices = [item_map[imdb_id] for imdb_id in favorite_movies_imdb_ids if imdb_id in item_map]
-        if not favorite_indices: raise ValueError("喜好电影均不在模型中")
-
-        # 1. 计算用户的平均兴趣向量
-        user_vector = item_vectors[favorite_indices].mean(axis=0).reshape(1, -1)
-
-        # 2. 计算用户向量与所有电影向量的余弦相似度
-        scores = cosine_similarity(user_vector, item_vectors)[0]
-
-        # 3. 获取分数最高的电影的索引
-        # argsort返回的是从小到大的索引，所以需要反转
-        top_indices = np.argsort(scores)[::-1]
-
-        # 4. 结果过滤
-        favorite_imdb_set = set(favorite_movies_imdb_ids)
-        # 反向映射现在可以直接从 item_map 创建
-        reverse_item_map = {i: imdb_id for imdb_id, i in item_map.items()}
-        recommended_imdb_ids = []
-        for index in top_indices:
-            imdb_id = reverse_item_map.get(index)
-            if imdb_id and imdb_id not in favorite_imdb_set:
-                recommended_imdb_ids.append(imdb_id)
-            if len(recommended_imdb_ids) >= 50: break
+        # 喜欢/评分/收藏/浏览过的电影通过一次查询取回，并按用户缓存
+        exclusion_parts = get_user_exclusion_parts(user.id)
+        recommended_imdb_ids = score_content_based(model_assets, exclusion_parts, self.k)
 
         logger.info(f"成功为用户 '{user.username}' 生成基于内容的推荐。")
         return Response(
             {"user_id": user.username, "source": "content_based_inference", "recommendations": recommended_imdb_ids})
 
-    def get_profile_based_recommendations(self, user):
+    def get_session_based_recommendations(self, user, model_assets):
+        # 没有喜欢的电影时，用最近浏览记录推断当前兴趣
+        recent_imdb_ids = get_recent_viewed_imdb_ids(user.id)
+        if not recent_imdb_ids: raise ValueError("用户无浏览记录")
+        exclusion_parts = get_user_exclusion_parts(user.id)
+        recommended_imdb_ids = score_session_based(model_assets, recent_imdb_ids, exclusion_parts, self.k)
+
+        logger.info(f"成功为用户 '{user.username}' 生成基于浏览会话的推荐。")
+        return Response({"user_id": user.username, "source": "session_based", "recommendations": recommended_imdb_ids})
+
+    def get_degraded_recommendations(self, user, deadline):
+        """超出延迟预算：依次尝试预计算列表、偏好类型/影人候选列表、全局列表，均只读缓存或单条索引查询"""
+        logger.warning(f"实时推荐超出延迟预算（已耗时 {deadline.elapsed_ms():.1f} ms），降级返回。")
+        response = None
+        if user:
+            response = (self.get_precomputed_recommendations(user)
+                        or self.get_profile_based_recommendations(user, allow_db=False))
+        response = response or self.get_global_fallback_recommendations()
+        response.data['degraded'] = True
+        return response
+
+    def get_precomputed_recommendations(self, user):
+        # 离线生成并保存在 Recommendation.recommended_movie_ids 中的列表，过滤掉之后新交互过的电影
+        imdb_ids = Recommendation.objects.filter(user=user).values_list('recommended_movie_ids', flat=True).first()
+        if not imdb_ids:
+            return None
+        exclusion_parts = get_user_exclusion_parts(user.id)
+        excluded = {imdb_id for ids in exclusion_parts.values() for imdb_id in ids}
+        imdb_ids = [imdb_id for imdb_id in imdb_ids if imdb_id not in excluded][:self.k]
+        if imdb_ids:
+            return Response({"user_id": user.username, "source": "precomputed", "recommendations": imdb_ids})
+        return None
+
+    def get_profile_based_recommendations(self, user, allow_db=True):
+        candidate_lists = cache.get(CANDIDATE_LISTS_CACHE_KEY)
+        if candidate_lists is None:
+            return self.get_profile_based_recommendations_from_db(user) if allow_db else None
+
+        # 预计算的类型/影人列表多路归并，请求期间不再执行排序查询
+        preferences = get_user_preference_ids(user.id)
+        if not preferences['genres'] and not preferences['people']:
+            return None
+
+        exclusion_parts = get_user_exclusion_parts(user.id)
+        excluded = {imdb_id for ids in exclusion_parts.values() for imdb_id in ids}
+        imdb_ids = merge_candidate_lists(candidate_lists, preferences['genres'], preferences['people'], excluded,
+                                         self.k)
+        if imdb_ids:
+            logger.info(f"为用户 '{user.username}' 生成基于偏好类型/影人的备用推荐。")
+            return Response({"user_id": user.username, "source": "cold_start_profile", "recommendations": imdb_ids})
+        return None
+
+    def get_profile_based_recommendations_from_db(self, user):
+        # 降级方案：候选列表缓存不存在时，直接查询数据库
         try:
             profile = UserProfile.objects.get(user=user)
             f_genres = profile.favorite_genres.all()
@@ -120,7 +208,7 @@ class RealtimeRecommendationView(APIView):
                 liked_movies = Recommendation.objects.get(user=user).favorite_movies.all()
                 movies_qs = movies_qs.exclude(pk__in=liked_movies)
 
-                imdb_ids = list(movies_qs.values_list('imdb_id', flat=True)[:50])
+                imdb_ids = list(movies_qs.values_list('imdb_id', flat=True)[:self.k])
                 if imdb_ids:
                     logger.info(f"为用户 '{user.username}' 生成基于偏好类型的备用推荐。")
                     return Response({"user_id": user.username, "source": "cold_start_profile",
@@ -130,11 +218,161 @@ class RealtimeRecommendationView(APIView):
         return None
 
     def get_global_fallback_recommendations(self):
-        logger.info("执行全局回退策略，返回真值分数最高的电影。")
-        movies_qs = Movie.objects.order_by('-truth_score').values_list('imdb_id', flat=True).distinct()
-        imdb_ids = list(movies_qs[:50])
-        return Response({"user_id": "anonymous", "source": "cold_start_global",
-                         "recommendations": [mid for mid in imdb_ids if mid]})
+        # 近期热门电影在前（一次索引查询），再用真值分数最高的电影补齐
+        trending_imdb_ids = get_trending_imdb_ids(self.k)
+        candidate_lists = cache.get(CANDIDATE_LISTS_CACHE_KEY)
+        if candidate_lists is not None:
+            imdb_ids = merge_candidate_lists(candidate_lists, exclude=trending_imdb_ids, k=self.k)
+        else:
+            movies_qs = Movie.objects.order_by('-truth_score').values_list('imdb_id', flat=True).distinct()
+            imdb_ids = [mid for mid in movies_qs[:self.k + len(trending_imdb_ids)]
+                        if mid and mid not in trending_imdb_ids]
+        imdb_ids = (trending_imdb_ids + imdb_ids)[:self.k]
+
+        if trending_imdb_ids:
+            logger.info("执行全局回退策略，返回近期热门及真值分数最高的电影。")
+            source = "cold_start_trending"
+        else:
+            logger.info("执行全局回退策略，返回真值分数最高的电影。")
+            source = "cold_start_global"
+        return Response({"user_id": "anonymous", "source": source, "recommendations": imdb_ids})
+
+
+def pipeline_payload(user, recommended_imdb_ids, candidates, timings, debug):
+    payload = {"user_id": user.username, "source": "candidate_pipeline", "recommendations": recommended_imdb_ids}
+    if debug:
+        payload['debug'] = {
+            'timings_ms': {stage: round(ms, 3) for stage, ms in timings.items()},
+            'candidates': {name: len(imdb_ids) for name, imdb_ids in candidates.items()},
+        }
+    return payload
+
+
+# --- 新增：ASGI 下使用的异步实时推荐视图 ---
+# 打分使用有界线程池：numpy 计算会释放 GIL，同一个 worker 上的并发请求可以让 I/O 与计算重叠
+SCORING_EXECUTOR = ThreadPoolExecutor(max_workers=settings.RECOMMENDATION_SCORING_WORKERS,
+                                      thread_name_prefix='rec-scoring')
+
+
+class AsyncRealtimeRecommendationView(View):
+    """与 RealtimeRecommendationView 的分层策略一致，ORM 调用走 sync_to_async，余弦打分交给线程池"""
+    k = 50
+
+    async def get(self, request, user_id, *args, **kwargs):
+        payload = await self.get_recommendations(user_id, debug=request.GET.get('debug') == '1')
+        if request.GET.get('include') == 'cards':
+            payload['cards'] = await sync_to_async(get_movie_cards)(payload['recommendations'])
+        return JsonResponse(payload)
+
+    async def get_recommendations(self, user_id, debug=False):
+        deadline = Deadline(settings.RECOMMENDATION_LATENCY_BUDGET_MS)
+        payload = await self.serve_recommendations(user_id, deadline, debug)
+        await sync_to_async(record_tier_served)(payload['source'], payload.get('degraded', False))
+        return payload
+
+    async def serve_recommendations(self, user_id, deadline, debug=False):
+        logger.info(f"收到用户 '{user_id}' 的异步实时推荐请求")
+        user = await User.objects.filter(username=user_id).afirst()
+
+        model_assets = await cache.aget('recommendation_model_assets')
+        loop = asyncio.get_running_loop()
+        # 备用方案只涉及缓存读取和轻量查询，直接复用同步视图的实现
+        fallback_view = RealtimeRecommendationView()
+        fallback_view.k = self.k
+        degrade = sync_to_async(fallback_view.get_degraded_recommendations)
+
+        if user and settings.RECOMMENDATION_CANDIDATE_GENERATORS:
+            try:
+                if deadline.expired():
+                    return (await degrade(user, deadline)).data
+                context, candidates, timings = await sync_to_async(collect_candidates)(
+                    user.id, model_assets, deadline=deadline)
+                if deadline.expired():
+                    return (await degrade(user, deadline)).data
+                if any(candidates.values()):
+                    recommended_imdb_ids = await loop.run_in_executor(
+                        SCORING_EXECUTOR, rank_candidates, context, candidates, self.k, timings)
+                    logger.info(f"成功为用户 '{user.username}' 生成召回+精排推荐。")
+                    return pipeline_payload(user, recommended_imdb_ids, candidates, timings, debug)
+            except Exception as e:
+                logger.warning(f"召回+精排推荐失败: {e}。将尝试备用方案。")
+
+        if model_assets and user:
+            if deadline.expired():
+                return (await degrade(user, deadline)).data
+            exclusion_parts = await sync_to_async(get_user_exclusion_parts)(user.id)
+            try:
+                recommended_imdb_ids = await loop.run_in_executor(
+                    SCORING_EXECUTOR, score_content_based, model_assets, exclusion_parts, self.k)
+                logger.info(f"成功为用户 '{user.username}' 生成基于内容的推荐。")
+                return {"user_id": user.username, "source": "content_based_inference",
+                        "recommendations": recommended_imdb_ids}
+            except Exception as e:
+                logger.warning(f"内容模型实时推断失败: {e}。将尝试备用方案。")
+
+            if deadline.expired():
+                return (await degrade(user, deadline)).data
+            try:
+                recent_imdb_ids = await sync_to_async(get_recent_viewed_imdb_ids)(user.id)
+                if not recent_imdb_ids: raise ValueError("用户无浏览记录")
+                recommended_imdb_ids = await loop.run_in_executor(
+                    SCORING_EXECUTOR, score_session_based, model_assets, recent_imdb_ids, exclusion_parts, self.k)
+                logger.info(f"成功为用户 '{user.username}' 生成基于浏览会话的推荐。")
+                return {"user_id": user.username, "source": "session_based", "recommendations": recommended_imdb_ids}
+            except Exception as e:
+                logger.warning(f"会话推荐失败: {e}。将尝试备用方案。")
+
+        if user:
+            response = await sync_to_async(fallback_view.get_profile_based_recommendations)(user)
+            if response:
+                return response.data
+
+        response = await sync_to_async(fallback_view.get_global_fallback_recommendations)()
+        return response.data
+
+
+# --- 新增：无限滚动推荐流，完整排序只计算一次，翻页只是对服务端缓存的列表切片 ---
+class RecommendationFeedView(RealtimeRecommendationView):
+    k = settings.RECOMMENDATION_FEED_LENGTH
+
+    def get(self, request, user_id, *args, **kwargs):
+        try:
+            page_size = min(max(int(request.query_params.get('page_size', 20)), 1), 50)
+        except ValueError:
+            return Response({"error": "'page_size' 必须是整数。"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # 游标格式为 "<token>:<offset>"
+        token, offset = None, 0
+        cursor = request.query_params.get('cursor')
+        if cursor:
+            try:
+                token, offset = cursor.rsplit(':', 1)
+                offset = max(int(offset), 0)
+            except ValueError:
+                return Response({"error": "无效的 'cursor'。"}, status=status.HTTP_400_BAD_REQUEST)
+
+        owner_id = User.objects.filter(username=user_id).values_list('id', flat=True).first()
+        user_key = owner_id if owner_id is not None else f"anonymous:{user_id}"
+
+        feed = load_feed(user_key, token) if token else None
+        expired = token is not None and feed is None
+        if feed is None:
+            # 首次请求、游标过期或用户“喜欢”发生变化后，重新计算完整排序；
+            # 旧排序已不可得，原位置在新排序中没有意义，从头开始并告知客户端替换已展示的列表
+            data = self.get_recommendations(user_id).data
+            feed = {'source': data['source'], 'recommendations': data['recommendations']}
+            token, offset = save_feed(user_key, feed), 0
+
+        page = feed['recommendations'][offset:offset + page_size]
+        next_offset = offset + len(page)
+        payload = {
+            "user_id": user_id, "source": feed['source'], "recommendations": page,
+            "next_cursor": f"{token}:{next_offset}" if next_offset < len(feed['recommendations']) else None,
+            "cursor_expired": expired,
+        }
+        if request.query_params.get('include') == 'cards':
+            payload['cards'] = get_movie_cards(page)
+        return Response(payload)
 
 
 class BatchMovieDetailView(APIView):
@@ -149,4 +387,16 @@ class BatchMovieDetailView(APIView):
         movies_dict = {movie.imdb_id: movie for movie in movies}
         sorted_movies = [movies_dict[imdb_id] for imdb_id in imdb_ids if imdb_id in movies_dict]
         serializer = RecommendationMovieSerializer(sorted_movies, many=True)
-        return Response(serializer.data)
\ No newline at end of file
+        return Response(serializer.data)
+
+
+# --- 新增：相似电影 API，数据来自离线计算的相似电影列表 ---
+class SimilarMoviesView(APIView):
+    permission_classes = [AllowAny]
+
+    def get(self, request, movie_id, *args, **kwargs):
+        try:
+            k = min(max(int(request.query_params.get('k', 12)), 1), 50)
+        except ValueError:
+            return Response({"error": "'k' 必须是整数。"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"movie_id": movie_id, "similar": get_similar_movie_cards(movie_id, k)})
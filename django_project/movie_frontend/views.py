@@ -1,3 +1,4 @@
+import random
 from django.template.loader import render_to_string
 from django.http import JsonResponse
 import json
@@ -27,6 +28,8 @@ from django.core.paginator import Paginator
 from django.db.models import Q, Case, When, Value, IntegerField
 
 from django.core.cache import cache
+from films_recommender_system.recommendation_utils import get_similar_movie_cards
+from films_recommender_system.trending import get_trending_movie_ids
 
 
 # --- 辅助函数：带优先级排序的内存搜索 ---
@@ -91,20 +94,25 @@ def _display_title(movie):
     return movie.original_title
 
 
-def _attach_display_titles(movies):
-    movie_ids = [m.id for m in movies]
-    titles = MovieTitle.objects.filter(movie_id__in=movie_ids)
+def _titles_by_movie(movie_ids):
     titles_map = {m_id: [] for m_id in movie_ids}
-    for title in titles:
+    for title in MovieTitle.objects.filter(movie_id__in=movie_ids):
         titles_map[title.movie_id].append(title)
+    return titles_map
+
+
+def _pick_display_title(movie_titles, original_title):
+    display_title = next((t.title_text for t in movie_titles if t.is_primary and 'zh' in t.language.lower()), None)
+    if not display_title: display_title = next((t.title_text for t in movie_titles if t.is_primary), None)
+    if not display_title: display_title = next((t.title_text for t in movie_titles if 'zh' in t.language.lower()),
+                                               None)
+    return display_title or original_title
+
+
+def _attach_display_titles(movies):
+    titles_map = _titles_by_movie([m.id for m in movies])
     for movie in movies:
-        movie_titles = titles_map.get(movie.id, [])
-        display_title = next((t.title_text for t in movie_titles if t.is_primary and 'zh' in t.language.lower()), None)
-        if not display_title: display_title = next((t.title_text for t in movie_titles if t.is_primary), None)
-        if not display_title: display_title = next((t.title_text for t in movie_titles if 'zh' in t.language.lower()),
-                                                   None)
-        if not display_title: display_title = movie.original_title
-        setattr(movie, 'display_title', display_title)
+        setattr(movie, 'display_title', _pick_display_title(titles_map.get(movie.id, []), movie.original_title))
     return movies
 
 
@@ -130,40 +138,47 @@ def signup(request):
     return render(request, 'registration/signup.html', {'form': form})
 
 
-def home(request):
-    # --- 热门电影展示逻辑 ---
+# --- 首页“热门电影”：精选电影在前，其次是按热度排序的电影，不足时随机补齐 ---
+# 刷新时从热度最高的这么多部电影中随机抽取，保证每次看到的都是热门电影
+TRENDING_POOL_SIZE = 36
 
-    # 1. 在这里指定希望固定展示的电影ID
-    # 可以通过后台管理或直接查询数据库来获取这些ID
-    featured_movie_ids = [263, 953, 100, 2, 90, 932, 481, 1288, 1010, 126, 1765,16]
-
-    # 2. 设置首页总共要展示的电影数量
-    total_movies_on_home = 12
 
-    # 3. 首先获取所有“精选”的电影对象
+def _pick_popular_movies(featured_movie_ids, total, shuffle_trending=False):
     featured_movies = list(Movie.objects.filter(id__in=featured_movie_ids).prefetch_related('titles', 'genres'))
-
-    # 4. 计算还需要多少部随机电影
-    num_random_movies_needed = total_movies_on_home - len(featured_movies)
+    num_needed = total - len(featured_movies)
+
+    # 热度表按 score 索引排序，一次查询取出热门电影 ID
+    trending_movies = []
+    picked_ids = []
+    if num_needed > 0:
+        pool = [mid for mid in get_trending_movie_ids(TRENDING_POOL_SIZE) if mid not in featured_movie_ids]
+        picked_ids = random.sample(pool, min(num_needed, len(pool))) if shuffle_trending else pool[:num_needed]
+        movies_by_id = Movie.objects.prefetch_related('titles', 'genres').in_bulk(picked_ids)
+        trending_movies = [movies_by_id[mid] for mid in picked_ids if mid in movies_by_id]
+        num_needed -= len(trending_movies)
 
     random_movies = []
-    if num_random_movies_needed > 0:
-        # 5. 从数据库中随机获取所需数量的电影
-        #    - 使用 exclude() 来确保不会重复选中精选电影
-        #    - 使用 order_by('?') 来实现随机排序
+    if num_needed > 0:
+        # 热度数据不足时（例如刚上线），使用 order_by('?') 随机补齐
         random_movies = list(
-            Movie.objects.exclude(id__in=featured_movie_ids)
+            Movie.objects.exclude(id__in=list(featured_movie_ids) + picked_ids)
             .order_by('?')
             .prefetch_related('titles', 'genres')
-            [:num_random_movies_needed]
+            [:num_needed]
         )
 
-    # 6. 合并列表（精选电影在前，随机电影在后）
-    final_movies_list = featured_movies + random_movies
+    return featured_movies + trending_movies + random_movies
 
-    # --- 逻辑结束，后续处理不变 ---
 
-    movies = _attach_display_titles(final_movies_list)
+def home(request):
+    # 在这里指定希望固定展示的电影ID
+    # 可以通过后台管理或直接查询数据库来获取这些ID
+    featured_movie_ids = [263, 953, 100, 2, 90, 932, 481, 1288, 1010, 126, 1765,16]
+
+    # 首页总共要展示的电影数量
+    total_movies_on_home = 12
+
+    movies = _attach_display_titles(_pick_popular_movies(featured_movie_ids, total_movies_on_home))
     context = {
         'movies': movies,
         'fav_ids': _get_fav_ids(request),
@@ -173,21 +188,8 @@ def home(request):
 
 # --- 新增：处理AJAX请求的视图 ---
 def refresh_popular_movies(request):
-    # 这里的逻辑与 home 视图中的电影获取逻辑完全相同
-    featured_movie_ids = []
-    total_movies_on_home = 12
-    featured_movies = list(Movie.objects.filter(id__in=featured_movie_ids).prefetch_related('titles', 'genres'))
-    num_random_movies_needed = total_movies_on_home - len(featured_movies)
-    random_movies = []
-    if num_random_movies_needed > 0:
-        random_movies = list(
-            Movie.objects.exclude(id__in=featured_movie_ids)
-            .order_by('?')
-            .prefetch_related('titles', 'genres')
-            [:num_random_movies_needed]
-        )
-    final_movies_list = featured_movies + random_movies
-    movies = _attach_display_titles(final_movies_list)
+    # 刷新时不固定精选电影，从热门电影中随机抽取
+    movies = _attach_display_titles(_pick_popular_movies([], 12, shuffle_trending=True))
 
     # 关键区别：只渲染模板片段，而不是整个页面
     return render(request, 'partials/_movie_grid.html', {'movies': movies})
@@ -240,7 +242,8 @@ def movie_list(request):
 
 def movie_detail(request, movie_id):
     movie = get_object_or_404(
-        Movie.objects.prefetch_related('titles', 'genres', 'directors', 'actors', 'scriptwriters'), pk=movie_id)
+        Movie.objects.select_related('stats')
+        .prefetch_related('titles', 'genres', 'directors', 'actors', 'scriptwriters'), pk=movie_id)
 
     if request.method == 'POST' and request.user.is_authenticated:
         review_form = UserReviewForm(request.POST, user=request.user, movie=movie)
@@ -274,6 +277,12 @@ def movie_detail(request, movie_id):
     setattr(movie, 'display_title', _display_title(movie))
     external_reviews = Review.objects.filter(movie=movie).select_related('source').order_by('-content_date')[:20]
     user_reviews = UserReview.objects.filter(movie=movie).select_related('user').order_by('-timestamp')
+    # 相似电影：ID 列表已随电影对象加载，卡片数据来自缓存，未命中时只需一次批量查询
+    similar_movies = get_similar_movie_cards(movie.id, 12, stored=movie.similar_imdb_ids or [])
+    # 卡片缓存与 API 共用，其中的 display_title 是原名；页面上按本地化规则换成中文标题，只多一次批量查询
+    titles_map = _titles_by_movie([card['id'] for card in similar_movies])
+    similar_movies = [dict(card, display_title=_pick_display_title(titles_map[card['id']], card['display_title']))
+                      for card in similar_movies]
     is_in_watchlist = False
     is_in_favorites = False
     liked_review_ids = set()
@@ -295,6 +304,7 @@ def movie_detail(request, movie_id):
         'is_in_watchlist': is_in_watchlist,
         'is_in_favorites': is_in_favorites,
         'liked_review_ids': liked_review_ids,
+        'similar_movies': similar_movies,
     }
     return render(request, 'movie_detail.html', context)
 
@@ -315,8 +325,8 @@ def like_review(request, review_id):
         review.likes_count = F('likes_count') + 1
         is_liked = True
 
-    review.save()
-    review.refresh_from_db()  # 从数据库重新加载以获取最新的 likes_count
+    review.save(update_fields=['likes_count'])
+    review.refresh_from_db(fields=['likes_count'])  # 从数据库重新加载以获取最新的 likes_count
 
     # 返回JSON响应
     return JsonResponse({